@@ -0,0 +1,1281 @@
+"""
+Do hieu nang kho hang tren database tam (khong dung inventory.db that)
+
+Chay: python benchmark.py [ten_bench ...]
+"""
+import asyncio
+import contextlib
+import csv
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import signal
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+import maychu
+from dulieu import InventoryManager, ProductCache
+from nhaplieu import import_catalog
+from quetma import SIGHTING_INTERVAL, ScanRouter
+from tacvu import AioInventory, AsyncInventory
+from timkiem import NameIndex
+
+
+class TempStore:
+    """InventoryManager tren 1 thu muc tam, tu xoa khi ket thuc"""
+
+    def __init__(self):
+        self.dir = tempfile.mkdtemp(prefix='kho_bench_')
+        self.db_name = os.path.join(self.dir, 'inventory.db')
+        self.manager = InventoryManager(self.db_name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.manager.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def seed_products(manager, count, quantity=1000):
+    """Them nhanh `count` san pham, tra ve danh sach ma vach"""
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    rows = [
+        (f"893{i:010d}", f"San pham {i}", f"Nhom {i % 20}", quantity, 10,
+         10000 + i % 500, 7000 + i % 300, '', f"NCC {i % 7}", now, now)
+        for i in range(count)
+    ]
+    with manager.db.write() as cursor:
+        cursor.executemany('''INSERT INTO products
+                            (barcode, name, category, quantity, min_stock, price, cost_price,
+                             description, supplier, last_updated, created_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+    return [row[0] for row in rows]
+
+
+def report(label, seconds, count):
+    """In ket qua 1 lan do"""
+    per_op = seconds / count * 1e6 if count else 0
+    print(f"  {label:<40} {seconds * 1000:10.1f} ms  {per_op:10.1f} us/op")
+
+
+# ===== QUERY PLAN =====
+
+def bench_query_plans(products=2000):
+    """Moi truy van doc cua InventoryManager.PLAN_CHECKS phai dung index, tra ve False neu co quet toan bang"""
+    print(f"\n[query_plans] {len(InventoryManager.PLAN_CHECKS)} ham doc, {products} san pham")
+    with TempStore() as store:
+        seed_products(store.manager, products)
+        start = time.perf_counter()
+        problems = store.manager.verify_query_plans()
+        report("verify_query_plans", time.perf_counter() - start, len(InventoryManager.PLAN_CHECKS))
+    for method_name, sql, detail in problems:
+        print(f"  LOI {method_name}: {detail}\n      {sql}")
+    if problems:
+        return False
+    print("  Tat ca truy van deu dung index")
+
+
+# ===== CONNECTION =====
+
+def _scan_per_connection(db_name, barcode):
+    """Cach cu: mo ket noi moi cho moi lan quet"""
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM products WHERE barcode = ?", (barcode,))
+    product = cursor.fetchone()
+    conn.close()
+    return product
+
+
+def bench_connection(scans=1000):
+    """Vong lap quet 1000 ma: ket noi moi moi lan vs ket noi dung lai"""
+    print(f"\n[connection] {scans} lan quet")
+    with TempStore() as store:
+        barcodes = seed_products(store.manager, 200)
+        codes = [barcodes[i % len(barcodes)] for i in range(scans)]
+
+        start = time.perf_counter()
+        for code in codes:
+            _scan_per_connection(store.db_name, code)
+        report("truoc: connect/close moi lan", time.perf_counter() - start, scans)
+
+        start = time.perf_counter()
+        for code in codes:
+            store.manager.check_product_status(code)
+        report("sau: ConnectionManager (WAL)", time.perf_counter() - start, scans)
+
+
+# ===== CREATE ORDER =====
+
+def bench_create_order(sizes=(1, 10, 100, 1000), repeat=5):
+    """Tao don hang 1, 10, 100, 1000 dong"""
+    print(f"\n[create_order] moi co don lap {repeat} lan")
+    with TempStore() as store:
+        barcodes = seed_products(store.manager, max(sizes), quantity=10 ** 6)
+
+        for size in sizes:
+            items = [{'barcode': code, 'quantity': 1} for code in barcodes[:size]]
+            elapsed = 0.0
+            for _ in range(repeat):
+                start = time.perf_counter()
+                success, msg, _ = store.manager.create_order(items)
+                elapsed += time.perf_counter() - start
+                assert success, msg
+            report(f"{size} dong / don", elapsed / repeat, size)
+
+
+# ===== VOID ORDER =====
+
+def bench_void_order(lines=100, repeat=20):
+    """Huy don `lines` dong: vong import_stock tung dong (cach cu) vs void_order 1 transaction"""
+    print(f"\n[void_order] don {lines} dong, lap {repeat} lan")
+    with TempStore() as store:
+        manager = store.manager
+        barcodes = seed_products(manager, lines)
+        items = [{'barcode': code, 'quantity': 2} for code in barcodes]
+
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            orders = [manager.create_order(items)[2] for _ in range(2 * repeat)]
+
+        start = time.perf_counter()
+        for order in orders[:repeat]:
+            for item in order['items']:
+                manager.import_stock(item['barcode'], item['quantity'],
+                                     f"Hoan tra tu don huy {order['order_code']}", 'admin')
+        report("vong import_stock", (time.perf_counter() - start) / repeat, lines)
+
+        start = time.perf_counter()
+        for order in orders[repeat:]:
+            success, msg = manager.void_order(order['order_id'], user='admin')
+            assert success, msg
+        report("void_order", (time.perf_counter() - start) / repeat, lines)
+
+        stock = manager.db.reader().execute("SELECT SUM(quantity) FROM products").fetchone()[0]
+        print(f"  ton kho tro lai ban dau: {stock == 1000 * lines}")
+        assert stock == 1000 * lines
+
+
+# ===== CATALOG IMPORT =====
+
+def write_catalog(path, count, start=0):
+    """File CSV danh muc nha cung cap: `count` ma tu `start`"""
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Ma vach', 'Ten san pham', 'Nhom', 'So luong', 'Gia ban', 'Gia nhap', 'NCC'])
+        for i in range(start, start + count):
+            writer.writerow([f"894{i:010d}", synthetic_name(i), f"Nhom {i % 20}", i % 100,
+                             10000 + i % 500, 7000 + i % 300, f"NCC {i % 7}"])
+
+
+def bench_catalog_import(count=20000, single=2000):
+    """Nhap danh muc `count` ma tu CSV: add_product tung ma vs import_catalog (chay thu / that / cap nhat)"""
+    print(f"\n[catalog_import] {count} ma tu CSV")
+    with TempStore() as store:
+        manager = store.manager
+        manager.warm_caches()
+        path = os.path.join(store.dir, 'danh_muc.csv')
+        write_catalog(path, count)
+
+        start = time.perf_counter()
+        for i in range(single):
+            manager.add_product(f"895{i:010d}", synthetic_name(i), f"Nhom {i % 20}", i % 100,
+                                10, 10000, 7000, 'NCC 1')
+        elapsed = time.perf_counter() - start
+        print(f"  {'add_product tung ma (' + str(single) + ' ma)':<40} {single / elapsed:10,.0f} dong/s")
+
+        for label, dry_run in (('chay thu (dry-run)', True), ('nhap moi', False), ('nhap lai = cap nhat', False)):
+            report_ = import_catalog(manager, path, dry_run=dry_run)
+            assert not report_['errors']
+            print(f"  {label:<40} {report_['rows_per_sec']:10,.0f} dong/s"
+                  f"  them {report_['inserted']}, cap nhat {report_['updated']}")
+
+        reader = manager.db.reader()
+        products = reader.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+        history = reader.execute("SELECT COUNT(*) FROM inventory_history WHERE action = 'ADD_NEW'").fetchone()[0]
+        print(f"  san pham: {products}, lich su ADD_NEW: {history},"
+              f" tim theo ten: {len(manager.lookup_products(synthetic_name(count - 1)))} ket qua")
+        assert products == history == count + single
+
+
+# ===== RECEIVING =====
+
+def bench_receiving(lines=1000, products=5000):
+    """Nhan hang `lines` dong: import_stock tung dong (+ tai lai danh sach) vs 1 phieu nhap"""
+    print(f"\n[receiving] phieu nhap {lines} dong, kho {products} ma")
+    with TempStore() as store:
+        manager = store.manager
+        barcodes = seed_products(manager, products)
+        picked = barcodes[:lines]
+
+        start = time.perf_counter()
+        for code in picked:
+            manager.import_stock(code, 5, 'Nhap le', 'admin')
+        report(f"{lines} x import_stock", time.perf_counter() - start, lines)
+
+        start = time.perf_counter()
+        for code in picked[:100]:
+            manager.import_stock(code, 5, 'Nhap le', 'admin')
+            manager.get_all_products()
+        # Do 100 dong roi nhan len `lines` dong (moi lan tai lai ca danh sach rat cham)
+        report(f"{lines} x (import_stock + tai lai)", (time.perf_counter() - start) * lines / 100, lines)
+
+        manager.save_receiving_draft([(code, '', 5) for code in picked])
+        start = time.perf_counter()
+        success, msg, _ = manager.import_stock_batch([(code, 5) for code in picked], 'Phieu nhap', 'admin')
+        manager.get_all_products()
+        report(f"import_stock_batch {lines} dong + tai lai 1 lan", time.perf_counter() - start, lines)
+        assert success, msg
+
+        reader = manager.db.reader()
+        stock = reader.execute("SELECT SUM(quantity) FROM products").fetchone()[0]
+        drafts = reader.execute("SELECT COUNT(*) FROM receiving_drafts").fetchone()[0]
+        print(f"  ton kho dung: {stock == 1000 * products + 5 * (2 * lines + 100)}, phieu tam con lai: {drafts}")
+        assert stock == 1000 * products + 5 * (2 * lines + 100) and drafts == 0
+
+
+def camera_sightings(barcodes, units, rate, visible=0.6, seed=7):
+    """
+    Luong ma camera bao ve khi dua `units` mon qua camera, `rate` mon/giay:
+    moi mon nam trong khung hinh `visible` giay, scanner bao lai moi SIGHTING_INTERVAL
+    Tra ve [(thoi diem, ma)] theo thoi gian
+    """
+    rng = random.Random(seed)
+    sightings = []
+    for i in range(units):
+        code = rng.choice(barcodes)
+        start = i / rate
+        t = 0.0
+        while t < visible:
+            sightings.append((start + t, code))
+            t += SIGHTING_INTERVAL
+    sightings.sort()
+    return sightings
+
+
+def bench_camera_scans(units=600, rate=4.0, codes=40):
+    """Quet camera xuat kho: 1 lenh ghi moi ma (cach cu) vs ScanRouter gom theo dot"""
+    print(f"\n[camera_scans] {units} mon, {rate:g} mon/giay, {codes} ma")
+    with TempStore() as store:
+        manager = store.manager
+        barcodes = seed_products(manager, codes, quantity=10 ** 6)
+        sightings = camera_sightings(barcodes, units, rate)
+
+        # Cach cu: scanner cooldown 2 giay, moi lan giao = 1 lenh ghi
+        last = {}
+        delivered = []
+        for t, code in sightings:
+            if code not in last or t - last[code] >= 2:
+                last[code] = t
+                delivered.append(code)
+        start = time.perf_counter()
+        for code in delivered:
+            manager.export_stock(code, 1, 'Xuat kho (camera)', 'admin')
+        report(f"{len(delivered)} x export_stock (cach cu)", time.perf_counter() - start, len(delivered))
+
+        # ScanRouter che do xuat kho, hen gio theo dong ho gia lap
+        batches = []
+        timers = []
+        router = ScanRouter({'export': batches.append}, schedule=lambda ms, func, *args: timers.append(
+            (now + ms / 1000, func, args)))
+        router.set_mode('export')
+        for now, code in sightings:
+            while timers and timers[0][0] <= now:
+                _, func, args = timers.pop(0)
+                func(*args)
+            router.feed(code, now)
+        router.flush()
+
+        start = time.perf_counter()
+        for batch in batches:
+            success, msg, _ = manager.export_stock_batch(list(batch.items()), 'Xuat kho (camera)', 'admin')
+            assert success, msg
+        elapsed = time.perf_counter() - start
+        stats = router.stats()
+        report(f"{len(batches)} x export_stock_batch (ScanRouter)", elapsed, stats['accepted'])
+        print(f"  {len(sightings)} lan doc -> {stats['accepted']} mon tinh, {stats['suppressed']} bo trung,"
+              f" {len(batches)} lenh ghi ({stats['accepted'] / max(len(batches), 1):.1f} mon/lenh)")
+
+        reader = manager.db.reader()
+        exported = -reader.execute("SELECT SUM(quantity) FROM inventory_history WHERE action = 'EXPORT'"
+                                   ).fetchone()[0]
+        stock = reader.execute("SELECT SUM(quantity) FROM products").fetchone()[0]
+        print(f"  ton kho khop lich su: {stock == codes * 10 ** 6 - exported}")
+        assert stock == codes * 10 ** 6 - exported
+
+
+def bench_stocktake(products=50000, devices=4, batch=200, sold=200):
+    """Kiem toan bo kho `products` ma: `devices` may quet cong so dem theo dot, ban hang trong luc dem"""
+    print(f"\n[stocktake] {products} ma, {devices} may quet, dot {batch} ma, ban {sold} don trong luc dem")
+    with TempStore() as store:
+        manager = store.manager
+        barcodes = seed_products(manager, products, quantity=100)
+        rng = random.Random(3)
+
+        start = time.perf_counter()
+        success, msg, session_id = manager.start_stocktake('Kiem ke cuoi nam', 'admin')
+        report("start_stocktake (anh chup ton kho)", time.perf_counter() - start, products)
+        assert success, msg
+
+        # ~5% ma lech, 1% ma khong dem (ke ca het hang)
+        counts = {}
+        for code in barcodes:
+            roll = rng.random()
+            if roll < 0.01:
+                continue
+            counts[code] = 100 + (rng.randint(-5, 5) if roll < 0.06 else 0)
+
+        def device(items):
+            for i in range(0, len(items), batch):
+                ok, _, _ = manager.add_stocktake_counts(session_id, items[i:i + batch])
+                assert ok
+
+        items = list(counts.items())
+        start = time.perf_counter()
+        threads = [threading.Thread(target=device, args=(items[i::devices],)) for i in range(devices)]
+        for thread in threads:
+            thread.start()
+        # Ban hang trong luc dem: ton kho hien tai lech khoi anh chup
+        sales = Counter()
+        for _ in range(sold):
+            code = rng.choice(barcodes)
+            ok, msg, _ = manager.create_order([{'barcode': code, 'quantity': 1}])
+            assert ok, msg
+            sales[code] += 1
+        for thread in threads:
+            thread.join()
+        report(f"add_stocktake_counts ({devices} may) + {sold} don", time.perf_counter() - start, len(items))
+        assert manager.get_open_stocktake()['counted_units'] == sum(counts.values())
+
+        start = time.perf_counter()
+        variances, unknown = manager.get_stocktake_variance(session_id, zero_missing=True)
+        report("get_stocktake_variance (xem truoc)", time.perf_counter() - start, products)
+
+        start = time.perf_counter()
+        success, msg, result = manager.close_stocktake(session_id, zero_missing=True, user='admin')
+        report("close_stocktake (dieu chinh + ADJUST)", time.perf_counter() - start, products)
+        assert success, msg
+        print(f"  {msg}")
+
+        reader = manager.db.reader()
+        stock = dict(reader.execute("SELECT barcode, quantity FROM products"))
+        wrong = sum(1 for code in barcodes if stock[code] != counts.get(code, 0) - sales[code])
+        adjusted = reader.execute("SELECT COUNT(*), SUM(quantity) FROM inventory_history"
+                                  " WHERE action = 'ADJUST'").fetchone()
+        print(f"  ton kho = so dem - ban trong luc dem: {wrong == 0},"
+              f" lich su ADJUST: {adjusted[0]} dong, {adjusted[1]:+d}")
+        assert wrong == 0 and len(variances) == adjusted[0] == len(result['variances'])
+        assert adjusted[1] == result['net_change'] and not unknown
+
+
+# ===== ORDER CODE =====
+
+def _order_worker(db_name, terminal_id, count, barcode, results):
+    """Tien trinh con: tao `count` don hang tren cung file db"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        manager = InventoryManager(db_name, terminal_id=terminal_id)
+        codes = []
+        failures = 0
+        for _ in range(count):
+            success, msg, order = manager.create_order([{'barcode': barcode, 'quantity': 1}])
+            if success:
+                codes.append(order['order_code'])
+            else:
+                failures += 1
+        manager.close()
+    results.put((codes, failures))
+
+
+def bench_order_codes(total=10000, processes=4, terminals=2):
+    """Stress: nhieu tien trinh cung tao don, kiem tra ma don khong trung"""
+    print(f"\n[order_codes] {total} don, {processes} tien trinh, {terminals} quay")
+    with TempStore() as store:
+        barcode = seed_products(store.manager, 1, quantity=10 ** 7)[0]
+        results = multiprocessing.Queue()
+        per_process = total // processes
+        workers = [
+            multiprocessing.Process(
+                target=_order_worker,
+                args=(store.db_name, f"Q{i % terminals + 1}", per_process, barcode, results))
+            for i in range(processes)
+        ]
+
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        outputs = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        codes = [code for worker_codes, _ in outputs for code in worker_codes]
+        failures = sum(worker_failures for _, worker_failures in outputs)
+        report(f"{len(codes)} don tao xong", elapsed, len(codes))
+        print(f"  that bai: {failures}  ma trung: {len(codes) - len(set(codes))}")
+
+        # So thu tu moi quay phai lien tuc 1..N
+        for i in range(terminals):
+            seqs = sorted(int(code.rsplit('-', 1)[1]) for code in codes if f"-Q{i + 1}-" in code)
+            print(f"  quay Q{i + 1}: {len(seqs)} don, lien tuc: {seqs == list(range(1, len(seqs) + 1))}")
+
+        assert failures == 0 and len(codes) == len(set(codes)) == total
+
+
+# ===== STOCK =====
+
+def _stock_worker(db_name, terminal_id, barcodes, ops, seed, results):
+    """Tien trinh con: ban / nhap / xuat ngau nhien tren vai ma hang it ton"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        manager = InventoryManager(db_name, terminal_id=terminal_id)
+        # busy_timeout ngan de vong thu lai co jitter cua BEGIN IMMEDIATE thuc su chay
+        with manager.db.write() as cursor:
+            cursor.execute("PRAGMA busy_timeout = 20")
+        rng = random.Random(seed)
+        counts = Counter()
+        for _ in range(ops):
+            roll = rng.random()
+            if roll < 0.7:
+                cart = [{'barcode': rng.choice(barcodes), 'quantity': rng.randint(1, 3)}
+                        for _ in range(rng.randint(1, 3))]
+                success, _, extra = manager.create_order(cart)
+                counts['ban' if success else 'thieu hang' if extra else 'loi'] += 1
+            elif roll < 0.85:
+                success, _ = manager.import_stock(rng.choice(barcodes), rng.randint(1, 5))
+                counts['nhap' if success else 'loi'] += 1
+            else:
+                success, _ = manager.export_stock(rng.choice(barcodes), rng.randint(1, 10))
+                counts['xuat' if success else 'thieu hang'] += 1
+        counts['busy_retries'] = manager.db.busy_retries
+        manager.close()
+    results.put(counts)
+
+
+def bench_stock_stress(processes=4, ops=1000, products=10, quantity=500):
+    """Stress: nhieu tien trinh ban/nhap/xuat cung luc, ton kho + da ban - nhap + xuat khong doi"""
+    print(f"\n[stock_stress] {processes} tien trinh x {ops} thao tac, {products} ma x {quantity} ton")
+    with TempStore() as store:
+        barcodes = seed_products(store.manager, products, quantity=quantity)
+        store.manager.close()
+
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=_stock_worker,
+                                           args=(store.db_name, f"Q{i + 1}", barcodes, ops, i, results))
+                   for i in range(processes)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        counts = sum((results.get() for _ in workers), Counter())
+        for worker in workers:
+            worker.join()
+        report(f"{processes * ops} thao tac", time.perf_counter() - start, processes * ops)
+        print("  " + "  ".join(f"{key}: {value}" for key, value in sorted(counts.items())))
+
+        store.manager = InventoryManager(store.db_name)
+        reader = store.manager.db.reader()
+        stock = dict(reader.execute("SELECT barcode, quantity FROM products"))
+        sold = dict(reader.execute("SELECT barcode, SUM(quantity) FROM order_items GROUP BY barcode"))
+        moved = dict(reader.execute('''SELECT barcode, SUM(quantity) FROM inventory_history
+                                       WHERE action IN ('IMPORT', 'EXPORT') GROUP BY barcode'''))
+        sale_rows = reader.execute('''SELECT -SUM(quantity) FROM inventory_history
+                                      WHERE action = 'SALE' ''').fetchone()[0] or 0
+
+        drift = [code for code in barcodes
+                 if stock[code] + sold.get(code, 0) - moved.get(code, 0) != quantity]
+        print(f"  ton am: {sum(1 for qty in stock.values() if qty < 0)}"
+              f"  ma lech (ton + ban - nhap/xuat != ban dau): {len(drift)}"
+              f"  lich su SALE khop don: {sale_rows == sum(sold.values())}")
+        assert not drift and min(stock.values()) >= 0 and sale_rows == sum(sold.values())
+
+
+# ===== SEARCH =====
+
+def bench_search(count=50000, queries=('San', 'pham 12', '8930000', 'Nhom 7', 'NCC 3')):
+    """Tim san pham: loc Python tren get_all_products vs FTS5"""
+    print(f"\n[search] {count} san pham")
+    with TempStore() as store:
+        seed_products(store.manager, count)
+
+        start = time.perf_counter()
+        for query in queries:
+            keyword = query.lower()
+            [p for p in store.manager.get_all_products()
+             if keyword in p[1].lower() or keyword in p[2].lower()][:10]
+        report("truoc: get_all_products + loc Python", time.perf_counter() - start, len(queries))
+
+        start = time.perf_counter()
+        for query in queries:
+            store.manager.search_products(query, limit=10)
+        report("sau: search_products (FTS5)", time.perf_counter() - start, len(queries))
+
+
+# ===== NAME LOOKUP =====
+
+NAME_PARTS = (
+    ('Nước', 'Mì', 'Bánh', 'Sữa', 'Kẹo', 'Dầu', 'Trà', 'Cà phê', 'Bột', 'Xúc xích'),
+    ('suối', 'mắm', 'ngọt', 'tươi', 'chua cay', 'ăn', 'xanh', 'đặc', 'giặt', 'quy'),
+    ('Hảo Hảo', 'Vinamilk', 'Aquafina', 'Nam Ngư', 'Omo', 'Tường An', 'Oreo', 'Trung Nguyên'),
+    ('100g', '250ml', '500ml', '1L', '1kg', 'hộp', 'gói', 'thùng'),
+)
+
+
+def synthetic_name(i):
+    """Ten san pham gia co dau, du da dang de trigram co y nghia"""
+    parts = []
+    for part in NAME_PARTS:
+        parts.append(part[i % len(part)])
+        i //= len(part)
+    return ' '.join(parts) + f" {i}"
+
+
+def bench_name_lookup(sizes=(10000, 100000, 1000000),
+                      queries=('nuoc mam', 'nouc mma nam ngu', 'sua tuoi vinamlk', 'banh quy oreo',
+                               'ca phe trung nguyen', 'mi hao', 'xuc xich', 'tra xanh 500')):
+    """Tim ten gan dung (NameIndex) tren 10k, 100k, 1M san pham"""
+    print("\n[name_lookup] do tre moi phim go (muc tieu < 16 ms = 1 frame)")
+    for size in sizes:
+        index = NameIndex()
+        start = time.perf_counter()
+        for i in range(size):
+            index.add(i + 1, f"893{i:010d}", synthetic_name(i))
+        report(f"xay chi muc {size} san pham", time.perf_counter() - start, size)
+
+        latencies = []
+        for query in queries:
+            # Mo phong go tung phim: "n", "nu", "nuo", ...
+            for end in range(1, len(query) + 1):
+                start = time.perf_counter()
+                index.lookup(query[:end])
+                latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p95 = latencies[int(len(latencies) * 0.95)] * 1000
+        print(f"  {size:>8} san pham: p50 {p50:6.2f} ms  p95 {p95:6.2f} ms  max {latencies[-1] * 1000:6.2f} ms")
+
+
+# ===== PRODUCT CACHE =====
+
+def bench_product_cache(count=50000, scans=20000, hot=500):
+    """Quet ma: 90% luot quet roi vao `hot` san pham ban chay, do ti le trung cache va do tre"""
+    print(f"\n[product_cache] {count} san pham, {scans} lan quet, {hot} ma ban chay")
+    with TempStore() as store:
+        manager = store.manager
+        barcodes = seed_products(manager, count)
+        rng = random.Random(7)
+        codes = [rng.choice(barcodes[:hot]) if rng.random() < 0.9 else rng.choice(barcodes)
+                 for _ in range(scans)]
+
+        manager.product_cache.capacity = 0
+        start = time.perf_counter()
+        for code in codes:
+            manager.check_product_status(code)
+        report("truoc: khong cache", time.perf_counter() - start, scans)
+
+        manager.product_cache = ProductCache()
+        manager.warm_product_cache()
+        latencies = []
+        for i, code in enumerate(codes):
+            if i % 1000 == 0:
+                # Ban 1 don: cac ma trong don bi xoa khoi cache
+                manager.create_order([{'barcode': code, 'quantity': 1}])
+            start = time.perf_counter()
+            manager.check_product_status(code)
+            latencies.append(time.perf_counter() - start)
+        report("sau: ProductCache (nap truoc)", sum(latencies), scans)
+
+        latencies.sort()
+        stats = manager.product_cache.stats()
+        print(f"  ti le trung: {stats['hit_rate'] * 100:.1f}%  ({stats['hits']}/{stats['hits'] + stats['misses']})"
+              f"  p50 {latencies[len(latencies) // 2] * 1e6:.1f} us"
+              f"  p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.1f} us")
+
+        # Tien trinh khac ghi -> data_version doi -> cache bi xoa
+        other = sqlite3.connect(store.db_name)
+        other.execute("UPDATE products SET quantity = 1 WHERE barcode = ?", (codes[0],))
+        other.commit()
+        other.close()
+        assert manager.check_product_status(codes[0])['data']['quantity'] == 1
+        print("  ghi tu ket noi khac: cache da cap nhat")
+
+
+# ===== SALES ROLLUP =====
+
+MONTHLY_FROM_ORDERS = '''SELECT strftime('%Y-%m', created_at) as month,
+                                SUM(total_profit), SUM(final_amount), COUNT(*)
+                         FROM orders WHERE status = 'COMPLETED'
+                         GROUP BY strftime('%Y-%m', created_at)
+                         ORDER BY month DESC LIMIT 12'''
+
+
+CUSTOMER_PARTS = (
+    ('Nguyễn', 'Trần', 'Lê', 'Phạm', 'Hoàng', 'Huỳnh', 'Phan', 'Vũ', 'Võ', 'Đặng', 'Bùi', 'Đỗ'),
+    ('Văn', 'Thị', 'Minh', 'Ngọc', 'Thanh', 'Hữu', 'Đức', 'Quốc'),
+    ('An', 'Bình', 'Cường', 'Dũng', 'Hà', 'Hải', 'Hương', 'Lan', 'Linh', 'Long', 'Mai', 'Nam',
+     'Phúc', 'Quân', 'Sơn', 'Tâm', 'Thảo', 'Trang', 'Tuấn', 'Vy'),
+)
+
+
+def seed_orders(manager, count, start=0):
+    """Them nhanh `count` don 2 dong, rai deu trong ~3 nam (trigger tong hop van chay)"""
+    base = datetime(2022, 1, 1).timestamp()
+    with manager.db.write() as cursor:
+        for i in range(start, start + count):
+            created = datetime.fromtimestamp(base + i * 9461 % (3 * 365 * 86400))
+            customer = ' '.join(part[i // 7 % len(part)] for part in CUSTOMER_PARTS)
+            cursor.execute('''INSERT INTO orders (order_code, customer_name, customer_phone,
+                                                total_amount, discount, final_amount,
+                                                payment_method, status, created_at, total_profit)
+                            VALUES (?, ?, ?, ?, 0, ?, ?, 'COMPLETED', ?, ?)''',
+                           (f"ORD{created:%Y%m%d}-S-{i:09d}", customer, f"09{i * 7919 % 10 ** 8:08d}",
+                            30000, 30000, ('CASH', 'CARD', 'TRANSFER')[i % 3],
+                            created.strftime("%Y-%m-%d %H:%M:%S"), 9000))
+            cursor.executemany('''INSERT INTO order_items (order_id, barcode, product_name, quantity,
+                                                         unit_price, subtotal, profit)
+                                VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                               [(cursor.lastrowid, 'x', 'x', 1, 10000, 10000, 3000),
+                                (cursor.lastrowid, 'y', 'y', 2, 10000, 20000, 6000)])
+
+
+def bench_sales_rollup(sizes=(10000, 100000, 500000), repeat=20):
+    """Bao cao thang: GROUP BY tren orders vs doc bang tong hop"""
+    print(f"\n[sales_rollup] bao cao 12 thang, lap {repeat} lan")
+    with TempStore() as store:
+        manager = store.manager
+        seeded = 0
+        for size in sizes:
+            seed_orders(manager, size - seeded, seeded)
+            seeded = size
+            reader = manager.db.reader()
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                before = reader.execute(MONTHLY_FROM_ORDERS).fetchall()
+            report(f"{size} don - truoc: GROUP BY orders", (time.perf_counter() - start) / repeat, 1)
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                after = manager.get_monthly_profit()
+            report(f"{size} don - sau: sales_monthly", (time.perf_counter() - start) / repeat, 1)
+            assert [row[0] for row in before] == [row[0] for row in after]
+
+        start = time.perf_counter()
+        manager.rebuild_sales_rollups()
+        report(f"rebuild_sales_rollups ({seeded} don)", time.perf_counter() - start, 1)
+        assert manager.get_monthly_profit() == after
+
+        barcodes = seed_products(manager, 10, quantity=10 ** 6)
+        items = [{'barcode': code, 'quantity': 1} for code in barcodes]
+        start = time.perf_counter()
+        for _ in range(repeat):
+            manager.create_order(items)
+        report("create_order 10 dong (co trigger tong hop)", (time.perf_counter() - start) / repeat, 1)
+
+
+# ===== PAGINATION =====
+
+def bench_pagination(count=200000, page=100, depths=(0, 1000, 100000, 199000)):
+    """Trang don hang o do sau khac nhau: LIMIT/OFFSET vs keyset (get_orders_page)"""
+    print(f"\n[pagination] {count} don, trang {page} dong")
+    with TempStore() as store:
+        manager = store.manager
+        seed_orders(manager, count)
+        reader = manager.db.reader()
+
+        # Lay cursor tai moi do sau bang cach di het cac trang
+        cursors = {}
+        cursor, position = None, 0
+        while position < max(depths) + page:
+            if position in depths:
+                cursors[position] = cursor
+            rows, cursor = manager.get_orders_page(page, cursor)
+            position += len(rows)
+
+        for depth in depths:
+            start = time.perf_counter()
+            reader.execute('''SELECT * FROM orders ORDER BY created_at DESC, order_id DESC
+                              LIMIT ? OFFSET ?''', (page, depth)).fetchall()
+            report(f"do sau {depth} - truoc: OFFSET", time.perf_counter() - start, 1)
+
+            start = time.perf_counter()
+            manager.get_orders_page(page, cursors[depth])
+            report(f"do sau {depth} - sau: keyset", time.perf_counter() - start, 1)
+
+
+# ===== ORDER SEARCH =====
+
+def bench_order_search(count=1000000, repeat=5):
+    """Tim don hang: get_orders(200) + loc Python vs search_orders tren 1M don"""
+    print(f"\n[order_search] {count} don, lap {repeat} lan")
+    with TempStore() as store:
+        manager = store.manager
+        start = time.perf_counter()
+        for offset in range(0, count, 100000):
+            seed_orders(manager, min(100000, count - offset), offset)
+        report("tao du lieu", time.perf_counter() - start, count)
+
+        oldest = manager.db.reader().execute(
+            "SELECT order_code, customer_phone FROM orders ORDER BY created_at LIMIT 1").fetchone()
+        cases = [
+            ("ma don cu nhat", (oldest[0],), {}),
+            ("tien to SDT", (oldest[1][:7],), {}),
+            ("ten khach khong dau", ('nguyen van an',), {}),
+            ("ten khach go do", ('tran thi th',), {}),
+            ("tu khoa rong 'ORD'", ('ORD',), {}),
+            ("khoang ngay + PTTT", ('',), {'date_from': '2023-03-01', 'date_to': '2023-03-31',
+                                           'payment_method': 'CARD'}),
+            ("ten + khoang ngay", ('le minh',), {'date_from': '2023-01-01', 'date_to': '2023-12-31'}),
+        ]
+
+        for label, args, kwargs in cases:
+            keyword = args[0].lower()
+            start = time.perf_counter()
+            for _ in range(repeat):
+                old = [o for o in manager.db.reader().execute(
+                    "SELECT * FROM orders ORDER BY created_at DESC LIMIT 200")
+                    if keyword in o[1].lower() or keyword in (o[2] or '').lower() or keyword in (o[3] or '')]
+            old_ms = (time.perf_counter() - start) / repeat * 1000
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                rows, next_cursor = manager.search_orders(*args, limit=50, **kwargs)
+            new_ms = (time.perf_counter() - start) / repeat * 1000
+
+            # Trang tiep theo (keyset)
+            start = time.perf_counter()
+            if next_cursor:
+                manager.search_orders(*args, limit=50, cursor=next_cursor, **kwargs)
+            next_ms = (time.perf_counter() - start) * 1000
+            print(f"  {label:<22} truoc: {old_ms:7.2f} ms ({len(old):>3} kq)"
+                  f"  sau: {new_ms:7.2f} ms ({len(rows):>2} kq)  trang 2: {next_ms:6.2f} ms")
+
+
+# ===== ASYNC UI =====
+
+class FakeRoot:
+    """Thay Tk: after() xep ham vao hang doi, vong lap chinh goi update()"""
+
+    def __init__(self):
+        self.pending = []
+        self.lock = threading.Lock()
+
+    def after(self, delay, func, *args):
+        with self.lock:
+            self.pending.append((func, args))
+
+    def update(self):
+        with self.lock:
+            pending, self.pending = self.pending, []
+        for func, args in pending:
+            func(*args)
+
+
+def _hold_write_lock(db_name, seconds, started):
+    """Quay khac giu khoa ghi `seconds` giay"""
+    conn = sqlite3.connect(db_name, isolation_level=None)
+    conn.execute("BEGIN IMMEDIATE")
+    started.set()
+    time.sleep(seconds)
+    conn.execute("COMMIT")
+    conn.close()
+
+
+def _main_loop(root, until, frame=0.016):
+    """Mo phong vong lap Tk, tra ve khoang dung lau nhat giua 2 frame"""
+    worst = 0.0
+    last = time.perf_counter()
+    while not until():
+        root.update()
+        time.sleep(frame)
+        now = time.perf_counter()
+        worst = max(worst, now - last)
+        last = now
+    return worst
+
+
+def bench_async_ui(hold=1.0):
+    """Quay khac giu khoa ghi 1s: goi dong bo lam dung giao dien, AsyncInventory thi khong"""
+    print(f"\n[async_ui] quay khac giu khoa ghi {hold:.1f}s trong luc nhap kho")
+    with TempStore() as store:
+        barcode = seed_products(store.manager, 1)[0]
+        root = FakeRoot()
+        async_db = AsyncInventory(store.manager, root)
+
+        started = threading.Event()
+        holder = threading.Thread(target=_hold_write_lock, args=(store.db_name, hold, started))
+        holder.start()
+        started.wait()
+        start = time.perf_counter()
+        store.manager.import_stock(barcode, 1)
+        report("truoc: goi dong bo (giao dien dung)", time.perf_counter() - start, 1)
+        holder.join()
+
+        started.clear()
+        holder = threading.Thread(target=_hold_write_lock, args=(store.db_name, hold, started))
+        holder.start()
+        started.wait()
+        results = []
+        start = time.perf_counter()
+        async_db.import_stock(barcode, 1, callback=results.append)
+        report("sau: AsyncInventory.import_stock tra ve", time.perf_counter() - start, 1)
+        worst = _main_loop(root, lambda: results)
+        print(f"  ket qua ve sau {(time.perf_counter() - start) * 1000:.0f} ms, "
+              f"frame dai nhat {worst * 1000:.0f} ms (muc tieu ~16 ms)")
+        holder.join()
+        async_db.close()
+
+
+# ===== ASYNCIO CASHIERS =====
+
+async def _cashier(aio, barcodes, orders, rng, latencies):
+    """1 thu ngan: moi don quet 5 ma roi thanh toan"""
+    done = 0
+    for _ in range(orders):
+        cart = [rng.choice(barcodes) for _ in range(5)]
+        for code in cart:
+            await aio.check_product_status(code)
+        start = time.perf_counter()
+        success, msg, _ = await aio.create_order([{'barcode': code, 'quantity': 1} for code in cart])
+        latencies.append(time.perf_counter() - start)
+        assert success, msg
+        done += 1
+    return done
+
+
+async def _run_cashiers(manager, barcodes, cashiers, orders, max_concurrency, cancel_after=None):
+    latencies = []
+    async with AioInventory(manager, max_concurrency=max_concurrency) as aio:
+        tasks = [asyncio.create_task(_cashier(aio, barcodes, orders, random.Random(i), latencies))
+                 for i in range(cashiers)]
+        if cancel_after is not None:
+            await asyncio.sleep(cancel_after)
+            for task in tasks[::2]:
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return latencies, sum(1 for task in tasks if task.cancelled())
+
+
+def bench_async_cashiers(cashiers=100, orders=10, products=1000):
+    """100 thu ngan dong thoi tren AioInventory: thong luong, do tre, huy giua chung"""
+    print(f"\n[async_cashiers] {cashiers} thu ngan x {orders} don (5 ma / don)")
+    with TempStore() as store:
+        manager = store.manager
+        barcodes = seed_products(manager, products, quantity=10 ** 6)
+        stock = lambda: manager.db.reader().execute("SELECT SUM(quantity) FROM products").fetchone()[0]
+        total_before = stock()
+
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            rng = random.Random(0)
+            start = time.perf_counter()
+            for _ in range(cashiers * orders // 10):
+                cart = [rng.choice(barcodes) for _ in range(5)]
+                for code in cart:
+                    manager.check_product_status(code)
+                manager.create_order([{'barcode': code, 'quantity': 1} for code in cart])
+            sequential = time.perf_counter() - start
+        report("1 thu ngan tuan tu (dong bo)", sequential, cashiers * orders // 10)
+
+        for max_concurrency in (8, 32, 128):
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                start = time.perf_counter()
+                latencies, _ = asyncio.run(
+                    _run_cashiers(manager, barcodes, cashiers, orders, max_concurrency))
+                elapsed = time.perf_counter() - start
+            latencies.sort()
+            print(f"  max_concurrency {max_concurrency:>3}: {len(latencies) / elapsed:7.0f} don/s"
+                  f"  create_order p50 {latencies[len(latencies) // 2] * 1000:6.1f} ms"
+                  f"  p95 {latencies[int(len(latencies) * 0.95)] * 1000:6.1f} ms")
+
+        # Huy 1 nua so thu ngan giua chung: khong co don do dang, ton kho khop so luong da ban
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            orders_before = manager.db.reader().execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+            latencies, cancelled = asyncio.run(
+                _run_cashiers(manager, barcodes, cashiers, orders, 32, cancel_after=0.2))
+        reader = manager.db.reader()
+        created = reader.execute("SELECT COUNT(*) FROM orders").fetchone()[0] - orders_before
+        sold = reader.execute("SELECT SUM(quantity) FROM order_items").fetchone()[0]
+        orphans = reader.execute('''SELECT COUNT(*) FROM orders o WHERE NOT EXISTS
+                                    (SELECT 1 FROM order_items i WHERE i.order_id = o.order_id)''').fetchone()[0]
+        print(f"  huy {cancelled} thu ngan: {created} don moi, don khong co dong: {orphans},"
+              f" ton + da ban khong doi: {stock() + sold == total_before}")
+        assert orphans == 0 and stock() + sold == total_before
+
+
+# ===== SERVER =====
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _run_server(db_name, port):
+    """Tien trinh may chu, dung khi nhan SIGINT"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        maychu.serve(db_name, port)
+
+
+def _terminal_worker(target, terminal_id, barcodes, orders, seed, results):
+    """Tien trinh 1 quay: moi don quet 5 ma roi tao don, qua may chu (url) hoac mo thang file db"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if target.startswith('http://'):
+            manager = maychu.RemoteInventory(target, terminal_id=terminal_id)
+        else:
+            manager = InventoryManager(target, terminal_id=terminal_id)
+        rng = random.Random(seed)
+        latencies = []
+        failures = 0
+        for _ in range(orders):
+            cart = [rng.choice(barcodes) for _ in range(5)]
+            start = time.perf_counter()
+            for code in cart:
+                manager.check_product_status(code)
+            success, _, _ = manager.create_order([{'barcode': code, 'quantity': 1} for code in cart])
+            latencies.append(time.perf_counter() - start)
+            failures += not success
+        manager.close()
+    results.put((latencies, failures))
+
+
+def _run_terminals(target, barcodes, terminals, orders):
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_terminal_worker,
+                                       args=(target, f"Q{i + 1}", barcodes, orders, i, results))
+               for i in range(terminals)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    outputs = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for worker_latencies, _ in outputs for latency in worker_latencies)
+    failures = sum(worker_failures for _, worker_failures in outputs)
+    print(f"  {len(latencies) / elapsed:7.0f} don/s  quet+ban p50 {latencies[len(latencies) // 2] * 1000:6.1f} ms"
+          f"  p95 {latencies[int(len(latencies) * 0.95)] * 1000:6.1f} ms  that bai: {failures}")
+    return failures
+
+
+def bench_server(terminals=(4, 16), orders=200, products=5000):
+    """Load test may chu: nhieu quay (tien trinh) quet + tao don qua HTTP, so voi cung mo file db"""
+    print(f"\n[server] {orders} don / quay (5 ma / don), {products} san pham")
+    with TempStore() as store:
+        barcodes = seed_products(store.manager, products, quantity=10 ** 6)
+        store.manager.close()
+
+        for count in terminals:
+            print(f" {count} quay mo thang file db:")
+            _run_terminals(store.db_name, barcodes, count, orders)
+
+        port = _free_port()
+        server = multiprocessing.Process(target=_run_server, args=(store.db_name, port))
+        server.start()
+        url = f"http://127.0.0.1:{port}"
+        remote = maychu.RemoteInventory(url)
+        for _ in range(100):
+            try:
+                remote.get_monthly_profit()
+                break
+            except OSError:
+                time.sleep(0.1)
+
+        for count in terminals:
+            print(f" {count} quay qua may chu:")
+            failures = _run_terminals(url, barcodes, count, orders)
+            assert failures == 0
+
+        conn = remote._connection()
+        conn.request('GET', '/api/stats')
+        stats = json.loads(conn.getresponse().read())['result']
+        remote.close()
+        print(f"  cache hit rate {stats['cache']['hit_rate']:.1%}, gom ghi trung binh"
+              f" {stats['writes']['avg_batch']:.1f} lenh / transaction")
+
+        os.kill(server.pid, signal.SIGINT)
+        server.join()
+        store.manager = InventoryManager(store.db_name)
+
+
+# ===== CAMERA DECODE =====
+
+def load_test_frames(image='Untitled.jpeg'):
+    """Frame co ma (anh mau cua repo) + frame khong co ma (phai thu het moi cach decode)"""
+    import cv2
+    from giaima import limit_width
+
+    frame = cv2.imread(image)
+    if frame is None:
+        raise FileNotFoundError(image)
+    frame = limit_width(frame)
+    # Nua tren chai nuoc: khong co ma vach
+    empty = cv2.resize(frame[:frame.shape[0] // 2], (frame.shape[1], frame.shape[0]))
+    return frame, empty
+
+
+def bench_decode_pool(image='Untitled.jpeg', frames=30, workers=(1, 2, 3, 4)):
+    """Do tre decode 1 frame: tuan tu vs DecodePool thread/process theo so loi"""
+    from scan import DecodePool, RealtimeBarcodeScanner
+
+    print(f"\n[decode_pool] {image}, {frames} frame moi loai, may co {os.cpu_count()} loi")
+    found, empty = load_test_frames(image)
+    scanner = RealtimeBarcodeScanner(roi_tracking=False, motion_gate=False)
+
+    for label, frame in (("co ma", found), ("khong co ma", empty)):
+        start = time.perf_counter()
+        for _ in range(frames):
+            results = scanner.process_frame(frame)
+        report(f"tuan tu, {label} ({len(results)} ma)", time.perf_counter() - start, frames)
+
+    for mode in ('thread', 'process'):
+        for count in workers:
+            pool = DecodePool(count, mode)
+            try:
+                pool.decode(found)  # khoi dong tien trinh / luong truoc khi do
+                for label, frame in (("co ma", found), ("khong co ma", empty)):
+                    start = time.perf_counter()
+                    for _ in range(frames):
+                        results = pool.decode(frame)
+                    report(f"{mode} x{count}, {label} ({len(results)} ma)",
+                           time.perf_counter() - start, frames)
+            finally:
+                pool.close()
+
+
+def recorded_footage(video=None, frames=150, image='Untitled.jpeg'):
+    """
+    Frame cua video quay san (video / KHO_BENCH_VIDEO); khong co thi dung canh gia:
+    anh mau duoc cam truoc camera 1280x720, troi nhe + nhieu nhu tay cam san pham
+    """
+    import cv2
+    import numpy as np
+
+    from nguonhinh import VideoFileSource
+
+    video = video or os.environ.get('KHO_BENCH_VIDEO')
+    if video:
+        source = VideoFileSource(video)
+        footage = []
+        while len(footage) < frames:
+            ok, frame = source.read()
+            if not ok:
+                break
+            footage.append(frame)
+        source.release()
+        return footage
+
+    product = cv2.imread(image)
+    if product is None:
+        raise FileNotFoundError(image)
+    scale = 700 / product.shape[0]
+    product = cv2.resize(product, (int(product.shape[1] * scale), 700))
+    rng = np.random.default_rng(5)
+    footage = []
+    for i in range(frames):
+        frame = np.full((720, 1280, 3), 90, dtype=np.uint8)
+        x = 300 + int(80 * np.sin(i / 25)) + int(rng.integers(-3, 4))
+        y = 10 + int(rng.integers(-3, 4))
+        frame[y:y + 700, x:x + product.shape[1]] = product
+        noise = rng.normal(0, 4, frame.shape)
+        footage.append(np.clip(frame + noise, 0, 255).astype(np.uint8))
+    return footage
+
+
+def bench_roi_tracking(video=None, frames=150):
+    """CPU moi frame khi cam san pham truoc camera: decode ca frame vs RoiTracker"""
+    from scan import RealtimeBarcodeScanner
+
+    footage = recorded_footage(video, frames)
+    print(f"\n[roi_tracking] {len(footage)} frame {footage[0].shape[1]}x{footage[0].shape[0]}")
+    for label, tracking in (("ca frame", False), ("RoiTracker", True)):
+        scanner = RealtimeBarcodeScanner(roi_tracking=tracking)
+        codes = Counter()
+        hits = 0
+        start = time.perf_counter()
+        cpu = time.process_time()
+        for frame in footage:
+            results = scanner.process_frame(frame)
+            hits += bool(results)
+            codes.update(result['data'] for result in results)
+        cpu = time.process_time() - cpu
+        report(f"{label}", time.perf_counter() - start, len(footage))
+        extra = f", {scanner.tracker.stats()}" if tracking else ""
+        print(f"  frame co ma: {hits}/{len(footage)}, CPU {cpu / len(footage) * 1000:.1f} ms/frame,"
+              f" ma: {dict(codes.most_common(3))}{extra}")
+
+
+def bench_decode_engines(folder=None, image='Untitled.jpeg'):
+    """
+    Ti le doc dung / doc sai / ms moi frame cua tung engine (giaima) tren anh/video co nhan
+    Thu muc: folder / KHO_BENCH_IMAGES; khong co thi dung anh mau cua repo (+ 1 anh khong co ma)
+    """
+    import cv2
+    from giaima import evaluate_engines, print_report
+
+    folder = folder or os.environ.get('KHO_BENCH_IMAGES')
+    print(f"\n[decode_engines] {folder or image}")
+    if folder:
+        print_report(evaluate_engines(folder))
+        return
+
+    found, empty = load_test_frames(image)
+    tmp = tempfile.mkdtemp(prefix='kho_bench_')
+    try:
+        # Ma tren chai nuoc cua anh mau
+        cv2.imwrite(os.path.join(tmp, '8935005800015.png'), found)
+        cv2.imwrite(os.path.join(tmp, '8935005800015_mo.png'), cv2.GaussianBlur(found, (0, 0), 2))
+        cv2.imwrite(os.path.join(tmp, 'none_nap_chai.png'), empty)
+        print_report(evaluate_engines(tmp))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _paced_capture(empty, footage, switch_after, fps=30):
+    """
+    Camera gia lap cho scanner.start(capture=...): phat frame dung nhip `fps`,
+    `empty` (quay trong) truoc, sau `switch_after` giay thi phat `footage` (co san pham)
+    """
+    from nguonhinh import FrameSource
+
+    class PacedCapture(FrameSource):
+        switched = None
+
+        def _next(self):
+            if time.monotonic() - self.started < switch_after:
+                return empty[self.count % len(empty)]
+            if self.switched is None:
+                self.switched = time.monotonic()
+            return footage[self.count % len(footage)]
+
+    return PacedCapture(fps)
+
+
+def bench_frame_sources(frames=300, fps=30):
+    """
+    Scanner chay tren nguon gia lap (nguonhinh.SyntheticSource, khong can camera):
+    thong luong khi decode moi frame va do tre tu luc ma xuat hien den callback khi phat 30 FPS
+    """
+    from nguonhinh import SyntheticSource
+    from scan import RealtimeBarcodeScanner
+
+    print(f"\n[frame_sources] {frames} frame EAN-13 gia lap 1280x720 (nhieu + mo)")
+    for label, tracking in (("ca frame", False), ("RoiTracker", True)):
+        source = SyntheticSource(frames=frames, seed=1)
+        read = set()
+        scanner = RealtimeBarcodeScanner(callback=lambda result: read.add(result['data']),
+                                         roi_tracking=tracking, motion_gate=False)
+        start = time.perf_counter()
+        scanner.start(capture=source)
+        scanner.wait()
+        elapsed = time.perf_counter() - start
+        decoded = scanner.stats()['decoded']
+        scanner.close()
+        report(f"moi frame, {label}", elapsed, decoded)
+        print(f"  {decoded / elapsed:.1f} frame/s, doc duoc {len(read & set(source.shown))}/{len(source.shown)} ma,"
+              f" doc sai {len(read - set(source.shown))}")
+
+    for label, gate in (("khong gate", False), ("MotionGate", True)):
+        source = SyntheticSource(frames=frames, fps=fps, seed=2)
+        first = {}
+        scanner = RealtimeBarcodeScanner(callback=lambda result: first.setdefault(result['data'], time.monotonic()),
+                                         motion_gate=gate)
+        scanner.start(capture=source)
+        scanner.wait()
+        stats = scanner.stats()
+        scanner.close()
+        latencies = sorted((first[code] - shown) * 1000 for code, shown in source.shown.items() if code in first)
+        if not latencies:
+            print(f"  {fps} FPS, {label}: khong doc duoc ma nao")
+            continue
+        print(f"  {fps} FPS, {label:<11} do tre p50 {latencies[len(latencies) // 2]:6.1f} ms"
+              f"  max {latencies[-1]:6.1f} ms  doc duoc {len(latencies)}/{len(source.shown)} ma"
+              f"  bo qua {stats['dropped']} frame")
+
+
+def bench_motion_gate(idle_seconds=12.0, active_seconds=3.0, after=3.0):
+    """CPU khi quay trong va thoi gian tu luc dua san pham den luc decode duoc: co/khong MotionGate"""
+    import numpy as np
+    from scan import RealtimeBarcodeScanner
+
+    footage = recorded_footage(frames=90)
+    rng = np.random.default_rng(9)
+    background = np.full(footage[0].shape, 90, dtype=np.uint8)
+    empty = [np.clip(background + rng.normal(0, 2, background.shape), 0, 255).astype(np.uint8)
+             for _ in range(10)]
+    print(f"\n[motion_gate] quay trong {idle_seconds:g}s / {active_seconds:g}s roi dua san pham,"
+          f" do them {after:g}s")
+
+    for label, gate, wait_seconds in (("khong gate", False, idle_seconds),
+                                      ("gate, dang hoat dong", True, active_seconds),
+                                      ("gate, che do nghi", True, idle_seconds)):
+        found = threading.Event()
+        first = []
+
+        def on_scan(result):
+            if not found.is_set():
+                first.append(time.monotonic())
+                found.set()
+
+        scanner = RealtimeBarcodeScanner(callback=on_scan, motion_gate=gate)
+        capture = _paced_capture(empty, footage, wait_seconds)
+        scanner.start(capture=capture)
+        time.sleep(wait_seconds - 0.2)
+        idle_cpu = scanner.cpu_percent()
+        idle_stats = scanner.stats()
+        cpu, wall = time.process_time(), time.monotonic()
+        found.wait(wait_seconds + after)
+        time.sleep(max(0.0, capture.started + wait_seconds + after - time.monotonic()))
+        busy_cpu = (time.process_time() - cpu) / (time.monotonic() - wall) * 100
+        scanner.close()
+
+        latency = (first[0] - capture.switched) * 1000 if first and capture.switched else float('nan')
+        print(f"  {label:<22} CPU quay trong {idle_cpu:5.1f}%  co san pham {busy_cpu:5.1f}%"
+              f"  decode dau tien sau {latency:7.1f} ms"
+              f"  (decode {idle_stats['decoded']} frame luc trong, bo qua {idle_stats.get('skipped', 0)})")
+
+
+BENCHMARKS = {
+    'query_plans': bench_query_plans,
+    'connection': bench_connection,
+    'create_order': bench_create_order,
+    'void_order': bench_void_order,
+    'catalog_import': bench_catalog_import,
+    'receiving': bench_receiving,
+    'camera_scans': bench_camera_scans,
+    'stocktake': bench_stocktake,
+    'order_codes': bench_order_codes,
+    'stock_stress': bench_stock_stress,
+    'search': bench_search,
+    'name_lookup': bench_name_lookup,
+    'product_cache': bench_product_cache,
+    'sales_rollup': bench_sales_rollup,
+    'pagination': bench_pagination,
+    'order_search': bench_order_search,
+    'async_ui': bench_async_ui,
+    'async_cashiers': bench_async_cashiers,
+    'server': bench_server,
+    'decode_engines': bench_decode_engines,
+    'frame_sources': bench_frame_sources,
+    'decode_pool': bench_decode_pool,
+    'roi_tracking': bench_roi_tracking,
+    'motion_gate': bench_motion_gate,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Khong co benchmark '{name}'. Chon: {', '.join(BENCHMARKS)}")
+            sys.exit(1)
+    # Bench tra ve False (vd query_plans co quet toan bang) -> ma thoat khac 0
+    failed = [name for name in names if BENCHMARKS[name]() is False]
+    if failed:
+        print(f"\nThat bai: {', '.join(failed)}")
+        sys.exit(1)
@@ -1,131 +1,18 @@
+import sys
 import cv2
-import numpy as np
-from pyzbar.pyzbar import decode
 from datetime import datetime
 
+from giaima import DEFAULT_ENGINE, draw_result, limit_width, make_engine
+from nguonhinh import open_source
+
 
 class RealtimeBarcodeScanner:
-    def __init__(self):
-        """Scanner thời gian thực từ camera"""
-        self.barcode_types = {
-            'QRCODE': 'Mã QR',
-            'EAN13': 'EAN-13',
-            'EAN8': 'EAN-8',
-            'CODE128': 'Code 128',
-            'CODE39': 'Code 39',
-            'CODE93': 'Code 93',
-            'UPC_A': 'UPC-A',
-            'UPC_E': 'UPC-E',
-        }
-        self.qr_detector = cv2.QRCodeDetector()
+    def __init__(self, engine=DEFAULT_ENGINE):
+        """Scanner thời gian thực từ camera (engine: chuỗi engine của giaima)"""
+        self.engine = make_engine(engine)
         self.scanned_codes = {}
         self.scan_cooldown = 2
     
-    def preprocess_frame(self, frame):
-        """Tiền xử lý frame"""
-        height, width = frame.shape[:2]
-        if width > 1280:
-            scale = 1280 / width
-            new_width = int(width * scale)
-            new_height = int(height * scale)
-            frame = cv2.resize(frame, (new_width, new_height))
-        
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        enhanced = clahe.apply(gray)
-        
-        return frame, enhanced
-    
-    def decode_barcode(self, frame, enhanced):
-        """Decode barcode"""
-        results = []
-        
-        detected = decode(frame)
-        for obj in detected:
-            results.append({
-                'data': obj.data.decode('utf-8'),
-                'type': obj.type,
-                'type_vn': self.barcode_types.get(obj.type, obj.type),
-                'rect': obj.rect,
-                'polygon': obj.polygon,
-                'quality': obj.quality
-            })
-        
-        if not results:
-            detected = decode(enhanced)
-            for obj in detected:
-                results.append({
-                    'data': obj.data.decode('utf-8'),
-                    'type': obj.type,
-                    'type_vn': self.barcode_types.get(obj.type, obj.type),
-                    'rect': obj.rect,
-                    'polygon': obj.polygon,
-                    'quality': obj.quality
-                })
-        
-        if not results:
-            try:
-                data, bbox, _ = self.qr_detector.detectAndDecode(frame)
-                if data and bbox is not None:
-                    results.append({
-                        'data': data,
-                        'type': 'QRCODE',
-                        'type_vn': 'Mã QR',
-                        'rect': None,
-                        'polygon': bbox,
-                        'quality': 100
-                    })
-            except:
-                pass
-        
-        return results
-    
-    def draw_barcode(self, frame, result):
-        """Vẽ khung và thông tin lên barcode"""
-        try:
-            if result['polygon'] is not None:
-                points = result['polygon']
-                
-                if isinstance(points, (list, tuple)):
-                    points_array = []
-                    for point in points:
-                        if hasattr(point, 'x') and hasattr(point, 'y'):
-                            points_array.append([int(point.x), int(point.y)])
-                        elif isinstance(point, (list, tuple)) and len(point) >= 2:
-                            points_array.append([int(point[0]), int(point[1])])
-                    
-                    if len(points_array) > 0:
-                        points_array = np.array(points_array, dtype=np.int32)
-                        cv2.polylines(frame, [points_array], True, (0, 255, 0), 3)
-            
-            if result['rect'] is not None:
-                x = result['rect'].left
-                y = result['rect'].top
-                w = result['rect'].width
-                h = result['rect'].height
-                
-                cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                
-                text = f"{result['type_vn']}: {result['data']}"
-                (text_w, text_h), baseline = cv2.getTextSize(
-                    text, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
-                
-                bg_y1 = max(0, y - text_h - 10)
-                bg_y2 = max(text_h + 10, y)
-                
-                cv2.rectangle(frame, (x, bg_y1), (x + text_w, bg_y2), 
-                            (0, 255, 0), -1)
-                
-                cv2.putText(frame, text, (x, y - 5),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
-        
-        except Exception as e:
-            text = f"{result['type_vn']}: {result['data']}"
-            cv2.putText(frame, text, (10, 100),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-        
-        return frame
-    
     def is_new_scan(self, barcode_data):
         """Kiểm tra mã mới (cooldown)"""
         current_time = datetime.now()
@@ -141,16 +28,13 @@ class RealtimeBarcodeScanner:
         return True
     
     def run(self, camera_id=0, show_fps=True):
-        """Chạy scanner real-time"""
-        cap = cv2.VideoCapture(camera_id)
+        """Chạy scanner real-time (camera_id: số camera hoặc nguồn của nguonhinh.open_source)"""
+        cap = open_source(camera_id)
         
         if not cap.isOpened():
             print("❌ Không thể mở camera!")
             return
         
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-        
         
         
         frame_count = 0
@@ -166,11 +50,11 @@ class RealtimeBarcodeScanner:
             
             frame_count += 1
             
-            processed_frame, enhanced = self.preprocess_frame(frame)
-            results = self.decode_barcode(processed_frame, enhanced)
+            processed_frame = limit_width(frame)
+            results = self.engine.decode(processed_frame)
             
             for result in results:
-                processed_frame = self.draw_barcode(processed_frame, result)
+                processed_frame = draw_result(processed_frame, result)
                 
                 if self.is_new_scan(result['data']):
                     scan_count += 1
@@ -215,5 +99,7 @@ class RealtimeBarcodeScanner:
 
 
 if __name__ == "__main__":
-    scanner = RealtimeBarcodeScanner()
-    scanner.run(camera_id=0, show_fps=True)
+    # python check.py ["pyzbar,opencv:sharpen"] [0 | quay.mp4 | thu_muc_anh | synthetic]
+    scanner = RealtimeBarcodeScanner(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_ENGINE)
+    print(f"Engine: {scanner.engine.name}")
+    scanner.run(camera_id=sys.argv[2] if len(sys.argv) > 2 else 0, show_fps=True)
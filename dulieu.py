@@ -1,180 +1,794 @@
+import json
+import os
+import random
 import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 
+from timkiem import NameIndex
+
+
+def is_busy_error(error):
+    """Loi SQLITE_BUSY/SQLITE_LOCKED: tien trinh khac dang giu khoa ghi"""
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return 'locked' in str(error) or 'busy' in str(error)
+
+
+class OutOfStockError(Exception):
+    """Don hang ban qua ton kho: shortages = [(barcode, ten, ton, can)]"""
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__("Khong du hang: " + ", ".join(
+            f"{name} (con {stock}, can {need})" for _, name, stock, need in shortages))
+
+
+class ConnectionManager:
+    """Quan ly ket noi SQLite dung lai: 1 ket noi ghi + 1 ket noi doc cho moi thread"""
+
+    PRAGMAS = (
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA cache_size = -16000",
+        "PRAGMA mmap_size = 268435456",
+        "PRAGMA temp_store = MEMORY",
+    )
+
+    # BEGIN IMMEDIATE bi SQLITE_BUSY sau `timeout` giay: thu lai toi da BUSY_RETRIES lan,
+    # cho ngau nhien 0..BUSY_BACKOFF*2^lan (jitter de cac tien trinh khong thu lai cung luc)
+    BUSY_RETRIES = 5
+    BUSY_BACKOFF = 0.05
+
+    def __init__(self, db_name, timeout=5.0):
+        self.db_name = db_name
+        self.timeout = timeout
+        self.busy_retries = 0
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
+        self._writer = None
+        self._after_commit = []
+        self._data_version = None
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        self._closed = False
+
+        # WAL luu vinh vien trong file db, chi can bat 1 lan
+        conn = self.connect()
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.close()
+
+    def connect(self):
+        """Mo 1 ket noi moi da cau hinh pragma (nguoi goi tu dong)"""
+        conn = sqlite3.connect(self.db_name, timeout=self.timeout,
+                               isolation_level=None, check_same_thread=False)
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def reader(self):
+        """Ket noi doc cua thread hien tai"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("ConnectionManager da dong")
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self.connect()
+            conn.execute("PRAGMA query_only = ON")
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    @contextmanager
+    def write(self):
+        """Giao dich ghi (BEGIN IMMEDIATE) tren ket noi ghi duy nhat, tra ve cursor"""
+        with self._write_lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("ConnectionManager da dong")
+            if self._writer is None:
+                self._writer = self.connect()
+            cursor = self._writer.cursor()
+
+            # Goi long nhau: SAVEPOINT, loi chi huy phan cua lenh trong
+            # (nhieu lenh gop chung 1 transaction van doc lap), giao dich ngoai cung BEGIN/COMMIT
+            if self._write_depth > 0:
+                savepoint = f"sp{self._write_depth}"
+                cursor.execute(f"SAVEPOINT {savepoint}")
+                self._write_depth += 1
+                try:
+                    yield cursor
+                except BaseException:
+                    cursor.execute(f"ROLLBACK TO {savepoint}")
+                    raise
+                finally:
+                    self._write_depth -= 1
+                    cursor.execute(f"RELEASE {savepoint}")
+                return
+
+            self._begin(cursor)
+            self._write_depth = 1
+            try:
+                yield cursor
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                self._after_commit.clear()
+                raise
+            finally:
+                self._write_depth = 0
+
+            callbacks, self._after_commit = self._after_commit, []
+            for callback in callbacks:
+                callback()
+
+    def _begin(self, cursor):
+        """BEGIN IMMEDIATE, thu lai co gioi han khi tien trinh khac giu khoa ghi qua lau"""
+        for attempt in range(self.BUSY_RETRIES + 1):
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as e:
+                if attempt == self.BUSY_RETRIES or not is_busy_error(e):
+                    raise
+                self.busy_retries += 1
+                time.sleep(random.uniform(0, self.BUSY_BACKOFF * 2 ** attempt))
+
+    def after_commit(self, callback, *args):
+        """Goi callback(*args) sau khi transaction dang mo commit (ngay lap tuc neu khong co)"""
+        with self._write_lock:
+            if self._write_depth > 0:
+                self._after_commit.append(lambda: callback(*args))
+                return
+        callback(*args)
+
+    def data_version(self):
+        """
+        PRAGMA data_version tren ket noi ghi: chi doi khi ket noi/tien trinh KHAC commit
+        (commit cua chinh ket noi ghi khong lam doi gia tri nay)
+        """
+        if not self._write_lock.acquire(blocking=False):
+            # Luong khac dang ghi: dung gia tri lan truoc, lan goi sau se kiem tra lai
+            return self._data_version
+        try:
+            if self._writer is None:
+                self._writer = self.connect()
+            self._data_version = self._writer.execute("PRAGMA data_version").fetchone()[0]
+            return self._data_version
+        finally:
+            self._write_lock.release()
+
+    def close(self):
+        """Dong tat ca ket noi"""
+        with self._write_lock:
+            self._closed = True
+            if self._writer is not None:
+                try:
+                    # Gop WAL vao file db chinh truoc khi thoat
+                    self._writer.execute("PRAGMA optimize")
+                    self._writer.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                except sqlite3.Error as e:
+                    print(f"Loi checkpoint: {e}")
+                self._writer.close()
+                self._writer = None
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+
+
+class ProductCache:
+    """Cache LRU ket qua check_product_status theo ma vach (ca ma chua co trong kho)"""
+
+    def __init__(self, capacity=5000):
+        self.capacity = capacity
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        # Tang moi lan xoa cache: ket qua doc truoc do khong duoc dua vao cache nua
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, barcode, count_miss=True):
+        """Lay ban sao ket qua trong cache, None neu chua co"""
+        with self._lock:
+            result = self._items.get(barcode)
+            if result is None:
+                if count_miss:
+                    self.misses += 1
+                return None
+            self._items.move_to_end(barcode)
+            self.hits += 1
+        data = result['data']
+        return {'exists': result['exists'], 'status': result['status'],
+                'data': dict(data) if data else data}
+
+    def put(self, barcode, result, generation):
+        """Luu ket qua doc o `generation`; bo qua neu cache da bi xoa trong luc doc"""
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._items[barcode] = result
+            self._items.move_to_end(barcode)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def invalidate(self, barcodes):
+        """Xoa cac ma vach vua bi ghi"""
+        with self._lock:
+            self.generation += 1
+            for barcode in barcodes:
+                self._items.pop(barcode, None)
+
+    def clear(self):
+        """Xoa toan bo cache"""
+        with self._lock:
+            self.generation += 1
+            self._items.clear()
+
+    def stats(self):
+        """So lan trung/truot cache va ti le trung"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._items),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
 
 class InventoryManager:
     """Class quan ly kho hang"""
     
-    def __init__(self, db_name='inventory.db'):
+    def __init__(self, db_name='inventory.db', terminal_id=None):
         self.db_name = db_name
-        self.conn = sqlite3.connect(self.db_name)
+        # Ma quay thu ngan, in trong ma don hang (vd: ORD20251218-Q1-000042)
+        self.terminal_id = terminal_id or os.environ.get('KHO_TERMINAL', 'Q1')
+        self.db = ConnectionManager(self.db_name)
+        # Chi muc ten san pham cho tim gan dung, xay lan dau khi can
+        self.name_index = None
+        # Khoa ca luc xay lan luc sua/tra chi muc (luong ghi va luong doc dung chung)
+        self._name_index_lock = threading.Lock()
+        # Cache san pham cho luong quet ma, xoa khi ghi qua manager hoac khi tien trinh khac ghi
+        self.product_cache = ProductCache()
+        self._data_version = None
+        # Kiem kho: session_id -> Counter so dem (moi may quet cong vao cung 1 tien trinh)
+        self._stocktake_counts = {}
+        self._stocktake_lock = threading.Lock()
         self.init_database()
         self.check_and_migrate_database()
-    
+        self.create_indexes()
+        self.create_search_index()
+        self.create_sales_rollups()
+        # KHO_CHECK_PLANS=1: kiem tra query plan moi lan khoi dong (chay thu moi ham doc 1 lan)
+        if os.environ.get('KHO_CHECK_PLANS'):
+            for method_name, sql, detail in self.verify_query_plans():
+                print(f"⚠️ Truy van quet toan bang - {method_name}: {detail}\n    {sql}")
+
     def get_connection(self):
-        """Lay ket noi database"""
-        return sqlite3.connect(self.db_name)
+        """Lay ket noi database rieng (nguoi goi tu commit/close)"""
+        conn = self.db.connect()
+        conn.isolation_level = ''
+        return conn
+    
+    def close(self):
+        """Dong ket noi database"""
+        self.db.close()
     
     def check_and_migrate_database(self):
         """Kiem tra va cap nhat database neu can"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         try:
-            # ===== MIGRATE PRODUCTS =====
-            cursor.execute("PRAGMA table_info(products)")
-            columns = [column[1] for column in cursor.fetchall()]
-            
-            if 'id' not in columns:
-                print("Dang cap nhat database products...")
-                
-                # Tao bang moi voi cot id
-                cursor.execute('''CREATE TABLE IF NOT EXISTS products_new (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    barcode TEXT UNIQUE NOT NULL,
-                    name TEXT NOT NULL,
-                    category TEXT,
-                    quantity INTEGER DEFAULT 0,
-                    min_stock INTEGER DEFAULT 10,
-                    price REAL DEFAULT 0.0,
-                    cost_price REAL DEFAULT 0.0,
-                    description TEXT,
-                    supplier TEXT,
-                    last_updated TEXT,
-                    created_at TEXT
-                )''')
+            with self.db.write() as cursor:
+                # ===== MIGRATE PRODUCTS =====
+                cursor.execute("PRAGMA table_info(products)")
+                columns = [column[1] for column in cursor.fetchall()]
                 
-                # Sao chep du lieu tu bang cu sang bang moi
-                cursor.execute('''INSERT INTO products_new 
-                                (barcode, name, category, quantity, min_stock, price, 
-                                 cost_price, supplier, description, last_updated, created_at)
-                                SELECT barcode, name, category, quantity, min_stock, price, 
-                                       cost_price, supplier, description, last_updated, created_at
-                                FROM products''')
-                
-                # Xoa bang cu va doi ten bang moi
-                cursor.execute('DROP TABLE products')
-                cursor.execute('ALTER TABLE products_new RENAME TO products')
-                
-                conn.commit()
-                print("Cap nhat database products thanh cong!")
-            
-            # ===== MIGRATE ORDER_ITEMS =====
-            cursor.execute("PRAGMA table_info(order_items)")
-            order_columns = [column[1] for column in cursor.fetchall()]
-            
-            if 'profit' not in order_columns:
-                print("Them cot profit vao order_items...")
-                cursor.execute("ALTER TABLE order_items ADD COLUMN profit REAL DEFAULT 0.0")
-                cursor.execute("ALTER TABLE order_items ADD COLUMN cost_price REAL DEFAULT 0.0")
-                conn.commit()
-                print("Da them cot profit vao order_items!")
-            
-            # ✅ MIGRATE ORDERS - THÊM MỚI
-            cursor.execute("PRAGMA table_info(orders)")
-            orders_columns = [column[1] for column in cursor.fetchall()]
-            
-            if 'total_profit' not in orders_columns:
-                print("Them cot total_profit vao orders...")
-                cursor.execute("ALTER TABLE orders ADD COLUMN total_profit REAL DEFAULT 0.0")
-                conn.commit()
-                print("Da them cot total_profit vao orders!")
+                if 'id' not in columns:
+                    print("Dang cap nhat database products...")
+                    
+                    # Tao bang moi voi cot id
+                    cursor.execute('''CREATE TABLE IF NOT EXISTS products_new (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        barcode TEXT UNIQUE NOT NULL,
+                        name TEXT NOT NULL,
+                        category TEXT,
+                        quantity INTEGER DEFAULT 0,
+                        min_stock INTEGER DEFAULT 10,
+                        price REAL DEFAULT 0.0,
+                        cost_price REAL DEFAULT 0.0,
+                        description TEXT,
+                        supplier TEXT,
+                        last_updated TEXT,
+                        created_at TEXT
+                    )''')
+                    
+                    # Sao chep du lieu tu bang cu sang bang moi
+                    cursor.execute('''INSERT INTO products_new 
+                                    (barcode, name, category, quantity, min_stock, price, 
+                                     cost_price, supplier, description, last_updated, created_at)
+                                    SELECT barcode, name, category, quantity, min_stock, price, 
+                                           cost_price, supplier, description, last_updated, created_at
+                                    FROM products''')
+                    
+                    # Xoa bang cu va doi ten bang moi
+                    cursor.execute('DROP TABLE products')
+                    cursor.execute('ALTER TABLE products_new RENAME TO products')
+                    
+                    print("Cap nhat database products thanh cong!")
+                
+                # ===== MIGRATE ORDER_ITEMS =====
+                cursor.execute("PRAGMA table_info(order_items)")
+                order_columns = [column[1] for column in cursor.fetchall()]
+                
+                if 'profit' not in order_columns:
+                    print("Them cot profit vao order_items...")
+                    cursor.execute("ALTER TABLE order_items ADD COLUMN profit REAL DEFAULT 0.0")
+                    cursor.execute("ALTER TABLE order_items ADD COLUMN cost_price REAL DEFAULT 0.0")
+                    print("Da them cot profit vao order_items!")
+                
+                # ✅ MIGRATE ORDERS - THÊM MỚI
+                cursor.execute("PRAGMA table_info(orders)")
+                orders_columns = [column[1] for column in cursor.fetchall()]
+                
+                if 'total_profit' not in orders_columns:
+                    print("Them cot total_profit vao orders...")
+                    cursor.execute("ALTER TABLE orders ADD COLUMN total_profit REAL DEFAULT 0.0")
+                    print("Da them cot total_profit vao orders!")
                 
         except Exception as e:
             print(f"Loi cap nhat database: {e}")
-        finally:
-            conn.close()
     
     def init_database(self):
         """Khoi tao database"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Bang san pham - CO COT ID
-        cursor.execute('''CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            barcode TEXT UNIQUE NOT NULL,
-            name TEXT NOT NULL,
-            category TEXT,
-            quantity INTEGER DEFAULT 0,
-            min_stock INTEGER DEFAULT 10,
-            price REAL DEFAULT 0.0,
-            cost_price REAL DEFAULT 0.0,
-            description TEXT,
-            supplier TEXT,
-            last_updated TEXT,
-            created_at TEXT
-        )''')
-        
-        # Bang don hang
-        cursor.execute('''CREATE TABLE IF NOT EXISTS orders (
-            order_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            order_code TEXT UNIQUE,
-            customer_name TEXT,
-            customer_phone TEXT,
-            total_amount REAL,
-            discount REAL DEFAULT 0.0,
-            final_amount REAL,
-            payment_method TEXT,
-            status TEXT DEFAULT 'PENDING',
-            created_by TEXT,
-            created_at TEXT,
-            completed_at TEXT,
-            total_profit REAL DEFAULT 0.0
-        )''')
-        
-        # Bang chi tiet don hang - THEM COT PROFIT
-        cursor.execute('''CREATE TABLE IF NOT EXISTS order_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            order_id INTEGER,
-            barcode TEXT,
-            product_name TEXT,
-            quantity INTEGER,
-            unit_price REAL,
-            cost_price REAL DEFAULT 0.0,
-            subtotal REAL,
-            profit REAL DEFAULT 0.0,
-            FOREIGN KEY (order_id) REFERENCES orders(order_id),
-            FOREIGN KEY (barcode) REFERENCES products(barcode)
-        )''')
-        
-        # Bang lich su xuat nhap
-        cursor.execute('''CREATE TABLE IF NOT EXISTS inventory_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            barcode TEXT,
-            product_name TEXT,
-            action TEXT,
-            quantity INTEGER,
-            note TEXT,
-            user TEXT,
-            timestamp TEXT,
-            FOREIGN KEY (barcode) REFERENCES products(barcode)
-        )''')
-        
-        # Bang canh bao
-        cursor.execute('''CREATE TABLE IF NOT EXISTS alerts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            barcode TEXT,
-            alert_type TEXT,
-            message TEXT,
-            is_read INTEGER DEFAULT 0,
-            created_at TEXT,
-            FOREIGN KEY (barcode) REFERENCES products(barcode)
-        )''')
-        
-        conn.commit()
-        conn.close()
+        with self.db.write() as cursor:
+            # Bang san pham - CO COT ID
+            cursor.execute('''CREATE TABLE IF NOT EXISTS products (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                barcode TEXT UNIQUE NOT NULL,
+                name TEXT NOT NULL,
+                category TEXT,
+                quantity INTEGER DEFAULT 0,
+                min_stock INTEGER DEFAULT 10,
+                price REAL DEFAULT 0.0,
+                cost_price REAL DEFAULT 0.0,
+                description TEXT,
+                supplier TEXT,
+                last_updated TEXT,
+                created_at TEXT
+            )''')
+            
+            # Bang don hang
+            cursor.execute('''CREATE TABLE IF NOT EXISTS orders (
+                order_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                order_code TEXT UNIQUE,
+                customer_name TEXT,
+                customer_phone TEXT,
+                total_amount REAL,
+                discount REAL DEFAULT 0.0,
+                final_amount REAL,
+                payment_method TEXT,
+                status TEXT DEFAULT 'PENDING',
+                created_by TEXT,
+                created_at TEXT,
+                completed_at TEXT,
+                total_profit REAL DEFAULT 0.0
+            )''')
+            
+            # Bang chi tiet don hang - THEM COT PROFIT
+            cursor.execute('''CREATE TABLE IF NOT EXISTS order_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                order_id INTEGER,
+                barcode TEXT,
+                product_name TEXT,
+                quantity INTEGER,
+                unit_price REAL,
+                cost_price REAL DEFAULT 0.0,
+                subtotal REAL,
+                profit REAL DEFAULT 0.0,
+                FOREIGN KEY (order_id) REFERENCES orders(order_id),
+                FOREIGN KEY (barcode) REFERENCES products(barcode)
+            )''')
+            
+            # Bang lich su xuat nhap
+            cursor.execute('''CREATE TABLE IF NOT EXISTS inventory_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                barcode TEXT,
+                product_name TEXT,
+                action TEXT,
+                quantity INTEGER,
+                note TEXT,
+                user TEXT,
+                timestamp TEXT,
+                FOREIGN KEY (barcode) REFERENCES products(barcode)
+            )''')
+            
+            # Bang so thu tu don hang theo quay + ngay
+            cursor.execute('''CREATE TABLE IF NOT EXISTS order_sequences (
+                terminal TEXT,
+                day TEXT,
+                last_seq INTEGER DEFAULT 0,
+                PRIMARY KEY (terminal, day)
+            )''')
+            
+            # Bang canh bao
+            cursor.execute('''CREATE TABLE IF NOT EXISTS alerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                barcode TEXT,
+                alert_type TEXT,
+                message TEXT,
+                is_read INTEGER DEFAULT 0,
+                created_at TEXT,
+                FOREIGN KEY (barcode) REFERENCES products(barcode)
+            )''')
+            
+            # Phieu nhap dang soan theo quay (con nguyen khi may tat/ung dung loi)
+            cursor.execute('''CREATE TABLE IF NOT EXISTS receiving_drafts (
+                terminal TEXT NOT NULL,
+                line INTEGER NOT NULL,
+                barcode TEXT NOT NULL,
+                product_name TEXT,
+                quantity INTEGER NOT NULL,
+                updated_at TEXT,
+                PRIMARY KEY (terminal, line)
+            )''')
+            
+            # Phien kiem kho + anh chup ton kho luc mo phien (xoa khi dong phien)
+            cursor.execute('''CREATE TABLE IF NOT EXISTS stocktake_sessions (
+                session_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                status TEXT NOT NULL,
+                user TEXT,
+                started_at TEXT,
+                closed_at TEXT,
+                counted_skus INTEGER DEFAULT 0,
+                counted_units INTEGER DEFAULT 0,
+                adjusted_skus INTEGER DEFAULT 0,
+                net_change INTEGER DEFAULT 0
+            )''')
+            cursor.execute('''CREATE TABLE IF NOT EXISTS stocktake_snapshots (
+                session_id INTEGER NOT NULL,
+                barcode TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                PRIMARY KEY (session_id, barcode)
+            ) WITHOUT ROWID''')
+        
         print("Database initialized!")
+
+    def create_indexes(self):
+        """Tao index cho cac truy van doc (chay sau migrate vi migrate co the tao lai bang)"""
+        with self.db.write() as cursor:
+            # get_orders(_page): ORDER BY created_at DESC, order_id DESC (rowid nam san trong index)
+            cursor.execute('''CREATE INDEX IF NOT EXISTS idx_orders_created_at
+                            ON orders(created_at)''')
+
+            # get_monthly_profit doc bang tong hop sales_monthly, khong can index nay nua
+            cursor.execute("DROP INDEX IF EXISTS idx_orders_status_month")
+
+            # get_order_details: WHERE order_id = ? (covering)
+            cursor.execute('''CREATE INDEX IF NOT EXISTS idx_order_items_order
+                            ON order_items(order_id, barcode, product_name, quantity,
+                                           unit_price, cost_price, subtotal, profit)''')
+
+            # search_orders: tim theo tien to so dien thoai (ma don da co index UNIQUE)
+            cursor.execute('''CREATE INDEX IF NOT EXISTS idx_orders_customer_phone
+                            ON orders(customer_phone)''')
+
+            # get_inventory_history(_page): ORDER BY timestamp DESC, id DESC
+            cursor.execute('''CREATE INDEX IF NOT EXISTS idx_history_timestamp
+                            ON inventory_history(timestamp)''')
+
+            # get_all_products: ORDER BY created_at DESC
+            cursor.execute('''CREATE INDEX IF NOT EXISTS idx_products_created_at
+                            ON products(created_at)''')
+
+            # get_low_stock_products: index rieng cho san pham sap het
+            cursor.execute('''CREATE INDEX IF NOT EXISTS idx_products_low_stock
+                            ON products(quantity) WHERE quantity <= min_stock''')
+
+            # get_open_stocktake + chi 1 phien kiem kho mo cung luc (ke ca giua cac tien trinh)
+            cursor.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_stocktake_open
+                            ON stocktake_sessions(status) WHERE status = 'OPEN' ''')
+
+    def create_search_index(self):
+        """Tao bang FTS5 tim san pham va ten khach cua don hang, dong bo bang trigger"""
+        self.fts_enabled = True
+        try:
+            with self.db.write() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'")
+                exists = cursor.fetchone() is not None
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'orders_fts'")
+                orders_exists = cursor.fetchone() is not None
+                
+                # remove_diacritics: "nuoc" khop "nước"
+                cursor.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                    barcode, name, category, supplier,
+                    content='products', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2',
+                    prefix='2 3'
+                )''')
+                
+                cursor.execute('''CREATE TRIGGER IF NOT EXISTS products_fts_insert
+                    AFTER INSERT ON products BEGIN
+                        INSERT INTO products_fts (rowid, barcode, name, category, supplier)
+                        VALUES (new.id, new.barcode, new.name, new.category, new.supplier);
+                    END''')
+                
+                cursor.execute('''CREATE TRIGGER IF NOT EXISTS products_fts_delete
+                    AFTER DELETE ON products BEGIN
+                        INSERT INTO products_fts (products_fts, rowid, barcode, name, category, supplier)
+                        VALUES ('delete', old.id, old.barcode, old.name, old.category, old.supplier);
+                    END''')
+                
+                # Chi cap nhat khi doi cot duoc tim kiem, ban hang (doi quantity) khong cham FTS
+                cursor.execute('''CREATE TRIGGER IF NOT EXISTS products_fts_update
+                    AFTER UPDATE OF barcode, name, category, supplier ON products BEGIN
+                        INSERT INTO products_fts (products_fts, rowid, barcode, name, category, supplier)
+                        VALUES ('delete', old.id, old.barcode, old.name, old.category, old.supplier);
+                        INSERT INTO products_fts (rowid, barcode, name, category, supplier)
+                        VALUES (new.id, new.barcode, new.name, new.category, new.supplier);
+                    END''')
+                
+                if not exists:
+                    cursor.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+                
+                cursor.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS orders_fts USING fts5(
+                    customer_name,
+                    content='orders', content_rowid='order_id',
+                    tokenize='unicode61 remove_diacritics 2',
+                    prefix='2 3'
+                )''')
+                
+                cursor.execute('''CREATE TRIGGER IF NOT EXISTS orders_fts_insert
+                    AFTER INSERT ON orders BEGIN
+                        INSERT INTO orders_fts (rowid, customer_name) VALUES (new.order_id, new.customer_name);
+                    END''')
+                
+                cursor.execute('''CREATE TRIGGER IF NOT EXISTS orders_fts_delete
+                    AFTER DELETE ON orders BEGIN
+                        INSERT INTO orders_fts (orders_fts, rowid, customer_name)
+                        VALUES ('delete', old.order_id, old.customer_name);
+                    END''')
+                
+                cursor.execute('''CREATE TRIGGER IF NOT EXISTS orders_fts_update
+                    AFTER UPDATE OF customer_name ON orders BEGIN
+                        INSERT INTO orders_fts (orders_fts, rowid, customer_name)
+                        VALUES ('delete', old.order_id, old.customer_name);
+                        INSERT INTO orders_fts (rowid, customer_name) VALUES (new.order_id, new.customer_name);
+                    END''')
+                
+                if not orders_exists:
+                    cursor.execute("INSERT INTO orders_fts (orders_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError as e:
+            # SQLite khong co FTS5: search_products dung LIKE
+            print(f"Canh bao: khong tao duoc FTS5 ({e}), tim kiem dung LIKE")
+            self.fts_enabled = False
+    
+    # Bang tong hop doanh thu: (ten bang, do dai tien to created_at 'YYYY-MM-DD HH')
+    ROLLUP_TABLES = (
+        ('sales_hourly', 13),
+        ('sales_daily', 10),
+        ('sales_monthly', 7),
+    )
+    
+    # Tong so luong ban cua 1 don (don moi tao chua co dong nao -> 0)
+    ORDER_UNITS = "(SELECT COALESCE(SUM(quantity), 0) FROM order_items WHERE order_id = {row}.order_id)"
+    
+    def _rollup_upserts(self, row, sign, units, source='', where=None):
+        """
+        Lenh cong (sign=1)/tru (sign=-1) 1 don COMPLETED vao ca 3 bang tong hop
+        row: NEW/OLD (trigger orders) hoac alias bang orders trong `source`
+        """
+        condition = f"{row}.status = 'COMPLETED'" + (f" AND {where}" if where else '')
+        return ''.join(f'''
+                        INSERT INTO {table} (bucket, payment_method, revenue, profit, order_count, units)
+                        SELECT substr({row}.created_at, 1, {length}), COALESCE({row}.payment_method, ''),
+                               {sign} * {row}.final_amount, {sign} * {row}.total_profit, {sign}, {sign} * {units}
+                        {source} WHERE {condition}
+                        ON CONFLICT (bucket, payment_method) DO UPDATE SET
+                            revenue = revenue + excluded.revenue,
+                            profit = profit + excluded.profit,
+                            order_count = order_count + excluded.order_count,
+                            units = units + excluded.units;''' for table, length in self.ROLLUP_TABLES)
+    
+    def _rollup_units(self, order_id, units):
+        """Lenh cong so luong 1 dong order_items vao bang tong hop cua don cha"""
+        return ''.join(f'''
+                        INSERT INTO {table} (bucket, payment_method, revenue, profit, order_count, units)
+                        SELECT substr(created_at, 1, {length}), COALESCE(payment_method, ''), 0, 0, 0, {units}
+                        FROM orders WHERE order_id = {order_id} AND status = 'COMPLETED'
+                        ON CONFLICT (bucket, payment_method) DO UPDATE SET
+                            units = units + excluded.units;''' for table, length in self.ROLLUP_TABLES)
+    
+    def create_sales_rollups(self):
+        """
+        Tao bang tong hop doanh thu theo gio/ngay/thang + phuong thuc thanh toan
+        Trigger tren orders/order_items cap nhat trong cung transaction voi moi lan tao/sua/xoa don
+        """
+        with self.db.write() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sales_monthly'")
+            exists = cursor.fetchone() is not None
+            
+            for table, _ in self.ROLLUP_TABLES:
+                cursor.execute(f'''CREATE TABLE IF NOT EXISTS {table} (
+                    bucket TEXT NOT NULL,
+                    payment_method TEXT NOT NULL,
+                    revenue REAL DEFAULT 0.0,
+                    profit REAL DEFAULT 0.0,
+                    order_count INTEGER DEFAULT 0,
+                    units INTEGER DEFAULT 0,
+                    PRIMARY KEY (bucket, payment_method)
+                ) WITHOUT ROWID''')
+            
+            old_units = self.ORDER_UNITS.format(row='OLD')
+            new_units = self.ORDER_UNITS.format(row='NEW')
+            
+            cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS sales_rollup_order_insert
+                AFTER INSERT ON orders BEGIN{self._rollup_upserts('NEW', 1, new_units)}
+                END''')
+            
+            # Xoa don truoc hay xoa order_items truoc deu tru dung so luong
+            cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS sales_rollup_order_delete
+                AFTER DELETE ON orders BEGIN{self._rollup_upserts('OLD', -1, old_units)}
+                END''')
+            
+            cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS sales_rollup_order_update
+                AFTER UPDATE OF status, created_at, payment_method, final_amount, total_profit
+                ON orders BEGIN{self._rollup_upserts('OLD', -1, old_units)}{self._rollup_upserts('NEW', 1, new_units)}
+                END''')
+            
+            cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS sales_rollup_item_insert
+                AFTER INSERT ON order_items BEGIN{self._rollup_units('NEW.order_id', 'NEW.quantity')}
+                END''')
+            
+            cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS sales_rollup_item_delete
+                AFTER DELETE ON order_items BEGIN{self._rollup_units('OLD.order_id', '-OLD.quantity')}
+                END''')
+            
+            cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS sales_rollup_item_update
+                AFTER UPDATE OF order_id, quantity ON order_items BEGIN{self._rollup_units('OLD.order_id', '-OLD.quantity')}{self._rollup_units('NEW.order_id', 'NEW.quantity')}
+                END''')
+            
+            if not exists:
+                self.rebuild_sales_rollups()
+    
+    def rebuild_sales_rollups(self):
+        """Tinh lai toan bo bang tong hop tu orders/order_items"""
+        with self.db.write() as cursor:
+            for table, length in self.ROLLUP_TABLES:
+                cursor.execute(f"DELETE FROM {table}")
+                cursor.execute(f'''INSERT INTO {table} (bucket, payment_method, revenue, profit, order_count, units)
+                                 SELECT substr(o.created_at, 1, {length}), COALESCE(o.payment_method, ''),
+                                        SUM(o.final_amount), SUM(o.total_profit), COUNT(*),
+                                        SUM(COALESCE(i.units, 0))
+                                 FROM orders o
+                                 LEFT JOIN (SELECT order_id, SUM(quantity) AS units
+                                            FROM order_items GROUP BY order_id) i
+                                     ON i.order_id = o.order_id
+                                 WHERE o.status = 'COMPLETED'
+                                 GROUP BY 1, 2''')
+        print("Da tinh lai bang tong hop doanh thu!")
+    
+    # Ham doc + tham so mau dung de kiem tra query plan
+    PLAN_CHECKS = [
+        ('check_product_status', ('',)),
+        ('get_product_by_barcode', ('',)),
+        ('get_product_by_id', (0,)),
+        ('get_all_products', ()),
+        ('search_products', ('a',)),
+        ('search_products', ('',)),
+        ('get_low_stock_products', ()),
+        ('get_inventory_history', (1,)),
+        ('get_orders', (1,)),
+        ('get_orders_page', (1, ('', 0))),
+        ('get_inventory_history_page', (1, ('', 0))),
+        ('search_orders', ('',)),
+        ('search_orders', ('', '2000-01-01', '2000-01-31', 'CASH', 1, ('', 0))),
+        ('search_orders', ('0901', '2000-01-01')),
+        ('search_orders', ('nguyen',)),
+        ('get_order_details', (0,)),
+        ('load_receiving_draft', ('Q1',)),
+        ('get_open_stocktake', ()),
+        ('get_monthly_profit', ()),
+        ('get_sales_rollup', ('hour', '2000-01-01', '2000-01-01')),
+        ('get_sales_rollup', ('day', '2000-01-01', '2000-01-31')),
+        ('get_sales_rollup', ('month', None, None, 12)),
+    ]
+    
+    # (ham, bang) duoc phep quet: bang tong hop thang doc nguoc theo khoa chinh (bucket)
+    # va dung som nho LIMIT, so dong ti le voi so thang chu khong phai so don
+    # Chi mien cho dung ham nay; ham khac quet bang tong hop van bi bao loi
+    PLAN_SCAN_OK = {
+        ('get_monthly_profit', 'sales_monthly'),
+        ('get_sales_rollup', 'sales_monthly'),
+    }
+
+    def verify_query_plans(self):
+        """
+        Chay EXPLAIN QUERY PLAN cho moi truy van cua cac ham trong PLAN_CHECKS
+        Tra ve danh sach (ten ham, sql, buoc plan) bi quet toan bang, rong neu OK
+        """
+        conn = self.db.reader()
+        captured = []
+
+        for method_name, args in self.PLAN_CHECKS:
+            statements = []
+            conn.set_trace_callback(statements.append)
+            try:
+                getattr(self, method_name)(*args)
+            finally:
+                conn.set_trace_callback(None)
+            # Bo qua lenh noi bo cua SQLite/FTS5 (PRAGMA, doc bang config 'main'.'..._config')
+            captured.extend((method_name, sql) for sql in statements
+                            if sql.lstrip().upper().startswith('SELECT') and "'main'." not in sql)
+
+        problems = []
+        for method_name, sql in captured:
+            plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+            # Subquery da gioi han (LIMIT) duoc tao thanh bang tam, quet bang tam la binh thuong
+            subqueries = {detail.split()[-1] for detail in plan
+                          if detail.startswith(('CO-ROUTINE ', 'MATERIALIZE '))}
+            for detail in plan:
+                # "SCAN <bang>" khong kem index = quet toan bang
+                if (detail.startswith('SCAN ') and ' USING ' not in detail
+                        and 'VIRTUAL TABLE' not in detail
+                        and detail.split()[1] not in subqueries
+                        and (method_name, detail.split()[1]) not in self.PLAN_SCAN_OK):
+                    problems.append((method_name, sql.strip(), detail))
+
+        return problems
+
+    def sync_product_cache(self):
+        """Xoa cache neu tien trinh/ket noi khac da ghi vao database (PRAGMA data_version)"""
+        version = self.db.data_version()
+        if version is not None and version != self._data_version:
+            if self._data_version is not None:
+                self.product_cache.clear()
+            self._data_version = version
+    
+    def warm_product_cache(self):
+        """Nap truoc vao cache cac san pham cap nhat gan day nhat"""
+        self.sync_product_cache()
+        generation = self.product_cache.generation
+        cursor = self.db.reader().execute(
+            "SELECT * FROM products ORDER BY last_updated DESC LIMIT ?",
+            (self.product_cache.capacity,))
+        for product in cursor:
+            self.product_cache.put(product[1], self._product_status(product), generation)
+    
+    def warm_caches(self):
+        """Nap truoc cache san pham va chi muc ten (chay nen luc khoi dong)"""
+        self.warm_product_cache()
+        self.get_name_index()
+    
+    def cached_product_status(self, barcode):
+        """Ket qua check_product_status neu ma da co trong cache (khong doc database), None neu chua"""
+        self.sync_product_cache()
+        return self.product_cache.get(barcode, count_miss=False)
     
     def check_product_status(self, barcode):
-        """Kiem tra trang thai san pham"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        """Kiem tra trang thai san pham (ma da quet roi lay tu cache)"""
+        self.sync_product_cache()
+        cached = self.product_cache.get(barcode)
+        if cached is not None:
+            return cached
         
+        generation = self.product_cache.generation
+        cursor = self.db.reader().cursor()
         cursor.execute("SELECT * FROM products WHERE barcode = ?", (barcode,))
-        product = cursor.fetchone()
-        conn.close()
+        result = self._product_status(cursor.fetchone())
+        self.product_cache.put(barcode, result, generation)
         
+        data = result['data']
+        return {'exists': result['exists'], 'status': result['status'],
+                'data': dict(data) if data else data}
+    
+    def _product_status(self, product):
+        """Chuyen 1 dong products thanh ket qua check_product_status"""
         if product:
             (product_id, barcode, name, category, quantity, min_stock, price, cost_price,
              description, supplier, last_updated, created_at) = product
@@ -209,117 +823,181 @@ class InventoryManager:
     
     def get_product_by_barcode(self, barcode):
         """Lay thong tin san pham theo ma vach"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.db.reader().cursor()
         
         cursor.execute("SELECT * FROM products WHERE barcode = ?", (barcode,))
-        product = cursor.fetchone()
-        conn.close()
-        
-        return product
+        return cursor.fetchone()
     
     def get_product_by_id(self, product_id):
         """Lay thong tin san pham theo ID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.db.reader().cursor()
         
         cursor.execute("SELECT * FROM products WHERE id = ?", (product_id,))
-        product = cursor.fetchone()
-        conn.close()
-        
-        return product
+        return cursor.fetchone()
     
     def add_product(self, barcode, name, category='', quantity=0, 
                    min_stock=10, price=0.0, cost_price=0.0, supplier='', description=''):
         """Them san pham"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
         try:
-            cursor.execute('''INSERT INTO products 
-                            (barcode, name, category, quantity, min_stock, price, cost_price,
-                             description, supplier, last_updated, created_at)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                          (barcode, name, category, quantity, min_stock, price, cost_price,
-                           description, supplier, now, now))
-            
-            cursor.execute('''INSERT INTO inventory_history 
-                            (barcode, product_name, action, quantity, note, user, timestamp)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)''', 
-                          (barcode, name, 'ADD_NEW', quantity, 'Them san pham moi', 'system', now))
+            with self.db.write() as cursor:
+                cursor.execute('''INSERT INTO products 
+                                (barcode, name, category, quantity, min_stock, price, cost_price,
+                                 description, supplier, last_updated, created_at)
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                              (barcode, name, category, quantity, min_stock, price, cost_price,
+                               description, supplier, now, now))
+                
+                cursor.execute('''INSERT INTO inventory_history 
+                                (barcode, product_name, action, quantity, note, user, timestamp)
+                                VALUES (?, ?, ?, ?, ?, ?, ?)''', 
+                              (barcode, name, 'ADD_NEW', quantity, 'Them san pham moi', 'system', now))
+                
+                self._index_product_name(cursor, barcode, name)
             
-            conn.commit()
-            conn.close()
+            self.db.after_commit(self.product_cache.invalidate, [barcode])
             return True, "Them san pham thanh cong!"
         except sqlite3.IntegrityError:
-            conn.close()
             return False, "Ma vach da ton tai!"
         except Exception as e:
-            conn.close()
             return False, f"Loi: {str(e)}"
     
     def update_product(self, barcode, name, category, quantity, min_stock, price, cost_price, supplier):
         """Cap nhat thong tin san pham"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
         try:
-            cursor.execute('''UPDATE products 
-                            SET name = ?, category = ?, quantity = ?, min_stock = ?,
-                                price = ?, cost_price = ?, supplier = ?, last_updated = ?
-                            WHERE barcode = ?''',
-                          (name, category, quantity, min_stock, price, cost_price, supplier, now, barcode))
+            with self.db.write() as cursor:
+                cursor.execute('''UPDATE products 
+                                SET name = ?, category = ?, quantity = ?, min_stock = ?,
+                                    price = ?, cost_price = ?, supplier = ?, last_updated = ?
+                                WHERE barcode = ?''',
+                              (name, category, quantity, min_stock, price, cost_price, supplier, now, barcode))
+                updated = cursor.rowcount > 0
+                if updated:
+                    self._index_product_name(cursor, barcode, name)
             
-            if cursor.rowcount > 0:
-                conn.commit()
-                conn.close()
+            if updated:
+                self.db.after_commit(self.product_cache.invalidate, [barcode])
                 return True, "Cap nhat san pham thanh cong!"
             else:
-                conn.close()
                 return False, "Khong tim thay san pham!"
                 
         except Exception as e:
-            conn.close()
             return False, f"Loi: {str(e)}"
     
     def delete_product(self, barcode):
         """Xoa san pham"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         try:
-            # Kiem tra san pham co ton tai khong
-            cursor.execute("SELECT name FROM products WHERE barcode = ?", (barcode,))
-            product = cursor.fetchone()
-            
-            if not product:
-                conn.close()
-                return False, "Khong tim thay san pham!"
-            
-            product_name = product[0]
-            
-            # Xoa san pham
-            cursor.execute("DELETE FROM products WHERE barcode = ?", (barcode,))
-            
-            # Luu lich su
-            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            cursor.execute('''INSERT INTO inventory_history 
-                            (barcode, product_name, action, quantity, note, user, timestamp)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                          (barcode, product_name, 'DELETE', 0, 'Xoa san pham', 'system', now))
+            with self.db.write() as cursor:
+                # Kiem tra san pham co ton tai khong
+                cursor.execute("SELECT id, name FROM products WHERE barcode = ?", (barcode,))
+                product = cursor.fetchone()
+                
+                if not product:
+                    return False, "Khong tim thay san pham!"
+                
+                product_id, product_name = product
+                
+                # Xoa san pham
+                cursor.execute("DELETE FROM products WHERE barcode = ?", (barcode,))
+                
+                # Luu lich su
+                now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                cursor.execute('''INSERT INTO inventory_history 
+                                (barcode, product_name, action, quantity, note, user, timestamp)
+                                VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                              (barcode, product_name, 'DELETE', 0, 'Xoa san pham', 'system', now))
+                
+                with self._name_index_lock:
+                    if self.name_index is not None:
+                        self.name_index.remove(product_id)
             
-            conn.commit()
-            conn.close()
+            self.db.after_commit(self.product_cache.invalidate, [barcode])
             return True, "Xoa san pham thanh cong!"
             
         except Exception as e:
-            conn.close()
             return False, f"Loi: {str(e)}"
     
+    # Gioi han so tham so cho 1 lenh IN (...)
+    IN_CHUNK_SIZE = 500
+    
+    def fetch_products(self, cursor, barcodes, columns='*'):
+        """Lay nhieu san pham bang IN (...) theo tung lo, tra ve dict {barcode: row}"""
+        unique = list(dict.fromkeys(barcodes))
+        products = {}
+        
+        for i in range(0, len(unique), self.IN_CHUNK_SIZE):
+            chunk = unique[i:i + self.IN_CHUNK_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(f"SELECT barcode, {columns} FROM products WHERE barcode IN ({placeholders})",
+                           chunk)
+            for row in cursor.fetchall():
+                products[row[0]] = row[1:]
+        
+        return products
+    
+    # Cot san pham nhap tu file va gia tri mac dinh khi them moi
+    CATALOG_DEFAULTS = {
+        'name': None, 'category': '', 'quantity': 0, 'min_stock': 10, 'price': 0.0,
+        'cost_price': 0.0, 'supplier': '', 'description': '',
+    }
+    
+    def existing_barcodes(self, barcodes):
+        """Tap cac ma vach da co trong kho"""
+        return set(self.fetch_products(self.db.reader().cursor(), barcodes, 'id'))
+    
+    def upsert_products(self, products, user='system'):
+        """
+        Them/cap nhat nhieu san pham trong 1 transaction (nhap danh muc tu file)
+        products: [{'barcode': ..., 'name': ..., 'price': ...}], thieu cot = khong co trong file
+        - ma moi: INSERT (cot thieu lay mac dinh) + lich su ADD_NEW, moi loai 1 lenh executemany
+        - ma da co: chi cap nhat cot co gia tri, khong doi ton kho
+        Tra ve tap ma vach da co truoc khi nhap
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        columns = list(self.CATALOG_DEFAULTS)
+        updatable = [column for column in columns if column != 'quantity']
+        
+        with self.db.write() as cursor:
+            existing = set(self.fetch_products(cursor, [p['barcode'] for p in products], 'id'))
+            new = [p for p in products if p['barcode'] not in existing]
+            old = [p for p in products if p['barcode'] in existing]
+            
+            rows = []
+            for p in new:
+                values = {column: p.get(column, default) for column, default in self.CATALOG_DEFAULTS.items()}
+                values['name'] = values['name'] or f"SP{p['barcode'][-8:]}"
+                rows.append(values)
+            cursor.executemany(f'''INSERT INTO products 
+                                 (barcode, {', '.join(columns)}, last_updated, created_at)
+                                 VALUES (?, {', '.join('?' * len(columns))}, ?, ?)''',
+                              [(p['barcode'], *(values[column] for column in columns), now, now)
+                               for p, values in zip(new, rows)])
+            cursor.executemany('''INSERT INTO inventory_history 
+                                 (barcode, product_name, action, quantity, note, user, timestamp)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                              [(p['barcode'], values['name'], 'ADD_NEW', values['quantity'],
+                                'Nhap danh muc tu file', user, now) for p, values in zip(new, rows)])
+            
+            # NULL = o trong trong file -> giu gia tri cu
+            cursor.executemany(f'''UPDATE products 
+                                 SET {', '.join(f"{column} = COALESCE(?, {column})" for column in updatable)},
+                                     last_updated = ?
+                                 WHERE barcode = ?''',
+                              [(*(p.get(column) for column in updatable), now, p['barcode']) for p in old])
+            
+            if self.name_index is not None:
+                named = {p['barcode'] for p in products if 'name' in p} | {p['barcode'] for p in new}
+                ids = self.fetch_products(cursor, list(named), 'id, name')
+                with self._name_index_lock:
+                    for barcode, (product_id, name) in ids.items():
+                        self.name_index.add(product_id, barcode, name)
+        
+        self.db.after_commit(self.product_cache.invalidate, [p['barcode'] for p in products])
+        return existing
+    
     def quick_add_product(self, barcode, name="San pham moi", price=0.0):
         """Them nhanh san pham khi quet ma moi"""
         return self.add_product(
@@ -336,36 +1014,31 @@ class InventoryManager:
     
     def update_quantity(self, barcode, quantity_change, action='UPDATE', note='', user='system'):
         """Cap nhat so luong"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        cursor.execute("SELECT quantity, name FROM products WHERE barcode = ?", (barcode,))
-        result = cursor.fetchone()
-        
-        if not result:
-            conn.close()
-            return False, "San pham khong ton tai!"
-        
-        current_qty, product_name = result
-        new_qty = current_qty + quantity_change
-        
-        if new_qty < 0:
-            conn.close()
-            return False, f"Khong du hang! (Con: {current_qty})"
-        
-        cursor.execute('''UPDATE products 
-                         SET quantity = ?, last_updated = ?
-                         WHERE barcode = ?''', (new_qty, now, barcode))
-        
-        cursor.execute('''INSERT INTO inventory_history 
-                         (barcode, product_name, action, quantity, note, user, timestamp)
-                         VALUES (?, ?, ?, ?, ?, ?, ?)''', 
-                      (barcode, product_name, action, quantity_change, note, user, now))
+        with self.db.write() as cursor:
+            # Cong/tru tuong doi co dieu kien: khong ghi de so luong vua doc, khong bao gio am
+            cursor.execute('''UPDATE products 
+                             SET quantity = quantity + ?, last_updated = ?
+                             WHERE barcode = ? AND quantity + ? >= 0''',
+                          (quantity_change, now, barcode, quantity_change))
+            updated = cursor.rowcount == 1
+            
+            cursor.execute("SELECT quantity, name FROM products WHERE barcode = ?", (barcode,))
+            result = cursor.fetchone()
+            
+            if not result:
+                return False, "San pham khong ton tai!"
+            if not updated:
+                return False, f"Khong du hang! (Con: {result[0]})"
+            
+            product_name = result[1]
+            cursor.execute('''INSERT INTO inventory_history 
+                             (barcode, product_name, action, quantity, note, user, timestamp)
+                             VALUES (?, ?, ?, ?, ?, ?, ?)''', 
+                          (barcode, product_name, action, quantity_change, note, user, now))
         
-        conn.commit()
-        conn.close()
+        self.db.after_commit(self.product_cache.invalidate, [barcode])
         return True, "Da cap nhat!"
     
     def import_stock(self, barcode, quantity, note='', user='system'):
@@ -376,98 +1049,458 @@ class InventoryManager:
         """Xuat kho"""
         return self.update_quantity(barcode, -quantity, 'EXPORT', note, user)
     
+    def import_stock_batch(self, lines, note='', user='system', terminal_id=None):
+        """
+        Nhap kho ca phieu nhap trong 1 transaction: 1 lenh UPDATE + 1 lenh ghi lich su IMPORT
+        lines: [(barcode, so luong)], 1 ma co the lap lai (cong don)
+        Ma khong ton tai -> khong nhap dong nao, tra ve (False, msg, [ma loi])
+        Thanh cong: xoa luon phieu nhap nhap do cua quay trong cung transaction
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        received = Counter()
+        for barcode, quantity in lines:
+            if quantity <= 0:
+                return False, f"So luong cua {barcode} phai lon hon 0!", [barcode]
+            received[barcode] += quantity
+        if not received:
+            return False, "Phieu nhap trong!", []
+        
+        with self.db.write() as cursor:
+            products = self.fetch_products(cursor, list(received), 'name')
+            missing = [barcode for barcode in received if barcode not in products]
+            if missing:
+                return False, f"San pham khong ton tai: {', '.join(missing[:5])}", missing
+            
+            cursor.executemany('''UPDATE products SET quantity = quantity + ?, last_updated = ?
+                                 WHERE barcode = ?''',
+                              [(quantity, now, barcode) for barcode, quantity in received.items()])
+            cursor.executemany('''INSERT INTO inventory_history 
+                                 (barcode, product_name, action, quantity, note, user, timestamp)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                              [(barcode, products[barcode][0], 'IMPORT', quantity, note, user, now)
+                               for barcode, quantity in received.items()])
+            cursor.execute("DELETE FROM receiving_drafts WHERE terminal = ?",
+                          (terminal_id or self.terminal_id,))
+        
+        self.db.after_commit(self.product_cache.invalidate, list(received))
+        return True, f"Da nhap {sum(received.values())} san pham ({len(received)} ma)!", []
+
+    def export_stock_batch(self, lines, note='', user='system'):
+        """
+        Xuat kho nhieu ma trong 1 transaction (vd 1 dot quet camera che do xuat)
+        lines: [(barcode, so luong)], 1 ma co the lap lai (cong don)
+        Ma khong ton tai / khong du hang -> khong xuat dong nao, tra ve (False, msg, [ma loi])
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        shipped = Counter()
+        for barcode, quantity in lines:
+            if quantity <= 0:
+                return False, f"So luong cua {barcode} phai lon hon 0!", [barcode]
+            shipped[barcode] += quantity
+        if not shipped:
+            return False, "Khong co gi de xuat!", []
+
+        try:
+            with self.db.write() as cursor:
+                products = self.fetch_products(cursor, list(shipped), 'name, quantity')
+                missing = [barcode for barcode in shipped if barcode not in products]
+                if missing:
+                    return False, f"San pham khong ton tai: {', '.join(missing[:5])}", missing
+
+                shortages = []
+                for barcode, quantity in shipped.items():
+                    cursor.execute('''UPDATE products SET quantity = quantity - ?, last_updated = ?
+                                     WHERE barcode = ? AND quantity >= ?''',
+                                  (quantity, now, barcode, quantity))
+                    if cursor.rowcount != 1:
+                        shortages.append((barcode, products[barcode][0], products[barcode][1], quantity))
+                if shortages:
+                    raise OutOfStockError(shortages)
+
+                cursor.executemany('''INSERT INTO inventory_history
+                                     (barcode, product_name, action, quantity, note, user, timestamp)
+                                     VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                                  [(barcode, products[barcode][0], 'EXPORT', -quantity, note, user, now)
+                                   for barcode, quantity in shipped.items()])
+        except OutOfStockError as e:
+            return False, str(e), [barcode for barcode, *_ in e.shortages]
+
+        self.db.after_commit(self.product_cache.invalidate, list(shipped))
+        return True, f"Da xuat {sum(shipped.values())} san pham ({len(shipped)} ma)!", []
+
+    def save_receiving_draft(self, lines, terminal_id=None):
+        """Luu phieu nhap dang soan cua quay: lines [(barcode, ten, so luong)] (ghi de ban cu)"""
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        terminal_id = terminal_id or self.terminal_id
+        with self.db.write() as cursor:
+            cursor.execute("DELETE FROM receiving_drafts WHERE terminal = ?", (terminal_id,))
+            cursor.executemany('''INSERT INTO receiving_drafts 
+                                 (terminal, line, barcode, product_name, quantity, updated_at)
+                                 VALUES (?, ?, ?, ?, ?, ?)''',
+                              [(terminal_id, i, barcode, name, quantity, now)
+                               for i, (barcode, name, quantity) in enumerate(lines)])
+        return True, "Da luu phieu nhap tam!"
+    
+    def load_receiving_draft(self, terminal_id=None):
+        """Phieu nhap dang soan cua quay: [(barcode, ten, so luong)] theo thu tu quet"""
+        cursor = self.db.reader().cursor()
+        cursor.execute('''SELECT barcode, product_name, quantity FROM receiving_drafts
+                         WHERE terminal = ? ORDER BY line''', (terminal_id or self.terminal_id,))
+        return cursor.fetchall()
+    
+    # ===== KIEM KHO =====
+    
+    def start_stocktake(self, name='', user='system'):
+        """
+        Mo phien kiem kho: chup ton kho cua moi ma (1 lenh INSERT ... SELECT)
+        Chi 1 phien mo cung luc, moi may quet cung cong so dem vao phien do
+        Tra ve (ok, msg, session_id)
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.db.write() as cursor:
+            cursor.execute("SELECT session_id FROM stocktake_sessions WHERE status = 'OPEN'")
+            row = cursor.fetchone()
+            if row:
+                return False, f"Phien kiem kho #{row[0]} chua dong!", row[0]
+            
+            cursor.execute('''INSERT INTO stocktake_sessions (name, status, user, started_at)
+                             VALUES (?, 'OPEN', ?, ?)''', (name, user, now))
+            session_id = cursor.lastrowid
+            cursor.execute('''INSERT INTO stocktake_snapshots (session_id, barcode, quantity)
+                             SELECT ?, barcode, quantity FROM products''', (session_id,))
+            skus = cursor.rowcount
+        
+        with self._stocktake_lock:
+            self._stocktake_counts[session_id] = Counter()
+        return True, f"Da mo phien kiem kho #{session_id} ({skus} ma)", session_id
+    
+    def get_open_stocktake(self):
+        """Phien kiem kho dang mo: dict (id, ten, luc mo, so ma/so luong da dem) hoac None"""
+        cursor = self.db.reader().cursor()
+        cursor.execute('''SELECT session_id, name, user, started_at FROM stocktake_sessions
+                         WHERE status = 'OPEN' ''')
+        row = cursor.fetchone()
+        if not row:
+            return None
+        counts = self._stocktake_counter(row[0])
+        with self._stocktake_lock:
+            skus, units = len(counts), sum(counts.values())
+        return {'session_id': row[0], 'name': row[1], 'user': row[2], 'started_at': row[3],
+                'counted_skus': skus, 'counted_units': units}
+    
+    def _stocktake_counter(self, session_id):
+        """Bo dem trong bo nho cua phien dang mo, None neu phien khong mo"""
+        with self._stocktake_lock:
+            counts = self._stocktake_counts.get(session_id)
+        if counts is not None:
+            return counts
+        # Tien trinh vua khoi dong lai: phien van mo trong database, dem lai tu dau
+        row = self.db.reader().execute(
+            "SELECT 1 FROM stocktake_sessions WHERE session_id = ? AND status = 'OPEN'",
+            (session_id,)).fetchone()
+        if not row:
+            return None
+        with self._stocktake_lock:
+            return self._stocktake_counts.setdefault(session_id, Counter())
+    
+    def add_stocktake_counts(self, session_id, counts):
+        """
+        Cong so dem vao phien (khong ghi database): counts {ma: so luong} hoac [(ma, so luong)]
+        So am de bot lai khi dem nham; tra ve (ok, msg, {'skus', 'units'} cua ca phien)
+        """
+        counter = self._stocktake_counter(session_id)
+        if counter is None:
+            return False, f"Phien kiem kho #{session_id} khong mo!", None
+        
+        items = counts.items() if hasattr(counts, 'items') else counts
+        with self._stocktake_lock:
+            for barcode, quantity in items:
+                counter[barcode] += quantity
+                if counter[barcode] <= 0:
+                    del counter[barcode]
+            totals = {'skus': len(counter), 'units': sum(counter.values())}
+        return True, f"Da dem {totals['units']} san pham ({totals['skus']} ma)", totals
+    
+    def set_stocktake_count(self, session_id, barcode, quantity):
+        """Dat lai so dem cua 1 ma (dem lai), 0 = bo ma khoi phien"""
+        counter = self._stocktake_counter(session_id)
+        if counter is None:
+            return False, f"Phien kiem kho #{session_id} khong mo!"
+        with self._stocktake_lock:
+            if quantity > 0:
+                counter[barcode] = quantity
+            else:
+                counter.pop(barcode, None)
+        return True, "Da cap nhat so dem!"
+    
+    def _stocktake_variance(self, cursor, session_id, counts, zero_missing):
+        """
+        Chenh lech cua ca phien trong 1 lan truy van: so dem dua vao SQLite 1 tham so JSON,
+        moi ma dem tim anh chup theo khoa chinh; zero_missing: ma trong anh chup chua dem = 0
+        Tra ve ([(ma, ten, ton luc mo, so dem, chenh lech)], [ma dem duoc nhung khong co trong anh chup])
+        """
+        counted = json.dumps(counts)
+        cursor.execute('''SELECT c.key, p.name, s.quantity, c.value
+                         FROM json_each(?) c
+                         LEFT JOIN stocktake_snapshots s ON s.session_id = ? AND s.barcode = c.key
+                         LEFT JOIN products p ON p.barcode = s.barcode''', (counted, session_id))
+        variances, unknown = [], []
+        for barcode, name, expected, quantity in cursor.fetchall():
+            if expected is None or name is None:
+                unknown.append(barcode)
+            elif quantity != expected:
+                variances.append((barcode, name, expected, quantity, quantity - expected))
+        
+        if zero_missing:
+            cursor.execute('''SELECT s.barcode, p.name, s.quantity
+                             FROM stocktake_snapshots s JOIN products p ON p.barcode = s.barcode
+                             WHERE s.session_id = ? AND s.quantity != 0
+                               AND s.barcode NOT IN (SELECT key FROM json_each(?))''',
+                          (session_id, counted))
+            variances.extend((barcode, name, expected, 0, -expected)
+                             for barcode, name, expected in cursor.fetchall())
+        return variances, unknown
+    
+    def get_stocktake_variance(self, session_id, zero_missing=False):
+        """Xem truoc chenh lech (khong ghi): ([(ma, ten, ton luc mo, so dem, chenh lech)], [ma la])"""
+        counter = self._stocktake_counter(session_id)
+        if counter is None:
+            return [], []
+        with self._stocktake_lock:
+            counts = dict(counter)
+        return self._stocktake_variance(self.db.reader().cursor(), session_id, counts, zero_missing)
+    
+    def close_stocktake(self, session_id, zero_missing=False, note='', user='system'):
+        """
+        Dong phien: tinh chenh lech so voi anh chup luc mo, cong chenh lech vao ton kho hien tai
+        (ban hang trong luc dem van dung) + lich su ADJUST, tat ca trong 1 transaction
+        zero_missing: kiem toan bo kho, ma khong dem duoc coi la het hang
+        Tra ve (ok, msg, bao cao)
+        """
+        start = time.perf_counter()
+        counter = self._stocktake_counter(session_id)
+        if counter is None:
+            return False, f"Phien kiem kho #{session_id} khong mo!", None
+        with self._stocktake_lock:
+            counts = dict(counter)
+        
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        note = note or f"Kiem kho #{session_id}"
+        with self.db.write() as cursor:
+            cursor.execute("SELECT status FROM stocktake_sessions WHERE session_id = ?", (session_id,))
+            row = cursor.fetchone()
+            if not row or row[0] != 'OPEN':
+                return False, f"Phien kiem kho #{session_id} khong mo!", None
+            
+            variances, unknown = self._stocktake_variance(cursor, session_id, counts, zero_missing)
+            cursor.executemany('''UPDATE products SET quantity = quantity + ?, last_updated = ?
+                                 WHERE barcode = ?''',
+                              [(diff, now, barcode) for barcode, _, _, _, diff in variances])
+            cursor.executemany('''INSERT INTO inventory_history 
+                                 (barcode, product_name, action, quantity, note, user, timestamp)
+                                 VALUES (?, ?, 'ADJUST', ?, ?, ?, ?)''',
+                              [(barcode, name, diff, f"{note}: dem {counted}, so sach {expected}", user, now)
+                               for barcode, name, expected, counted, diff in variances])
+            
+            net_change = sum(diff for *_, diff in variances)
+            cursor.execute('''UPDATE stocktake_sessions
+                             SET status = 'CLOSED', closed_at = ?, counted_skus = ?, counted_units = ?,
+                                 adjusted_skus = ?, net_change = ?
+                             WHERE session_id = ?''',
+                          (now, len(counts), sum(counts.values()), len(variances), net_change, session_id))
+            cursor.execute("DELETE FROM stocktake_snapshots WHERE session_id = ?", (session_id,))
+        
+        # Bo so dem chi sau khi commit (lenh nam trong lo ghi chung co the bi huy)
+        self.db.after_commit(self._drop_stocktake_counts, session_id)
+        self.db.after_commit(self.product_cache.invalidate, [v[0] for v in variances])
+        
+        report = {'session_id': session_id, 'counted_skus': len(counts),
+                  'counted_units': sum(counts.values()), 'variances': variances,
+                  'unknown': unknown, 'net_change': net_change,
+                  'seconds': time.perf_counter() - start}
+        return True, (f"Da dong phien kiem kho #{session_id}: dieu chinh {len(variances)} ma"
+                      f" ({net_change:+d} san pham)"), report
+    
+    def cancel_stocktake(self, session_id):
+        """Huy phien kiem kho, khong dieu chinh ton kho"""
+        with self.db.write() as cursor:
+            cursor.execute('''UPDATE stocktake_sessions SET status = 'CANCELLED', closed_at = ?
+                             WHERE session_id = ? AND status = 'OPEN' ''',
+                          (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), session_id))
+            if cursor.rowcount != 1:
+                return False, f"Phien kiem kho #{session_id} khong mo!"
+            cursor.execute("DELETE FROM stocktake_snapshots WHERE session_id = ?", (session_id,))
+        self.db.after_commit(self._drop_stocktake_counts, session_id)
+        return True, f"Da huy phien kiem kho #{session_id}"
+    
+    def _drop_stocktake_counts(self, session_id):
+        with self._stocktake_lock:
+            self._stocktake_counts.pop(session_id, None)
+    
+    def allocate_order_code(self, cursor, when=None, terminal_id=None):
+        """
+        Cap ma don hang tiep theo cua quay trong ngay: ORD<YYYYMMDD>-<quay>-<so thu tu>
+        Phai goi trong giao dich ghi: BEGIN IMMEDIATE giu khoa ghi nen an toan giua nhieu tien trinh
+        """
+        day = (when or datetime.now()).strftime('%Y%m%d')
+        terminal_id = terminal_id or self.terminal_id
+        
+        cursor.execute('''INSERT INTO order_sequences (terminal, day, last_seq)
+                         VALUES (?, ?, 1)
+                         ON CONFLICT (terminal, day) DO UPDATE SET last_seq = last_seq + 1''',
+                      (terminal_id, day))
+        cursor.execute("SELECT last_seq FROM order_sequences WHERE terminal = ? AND day = ?",
+                      (terminal_id, day))
+        seq = cursor.fetchone()[0]
+        
+        return f"ORD{day}-{terminal_id}-{seq:06d}"
+    
+    def _order_lines(self, cursor, items, previous=None):
+        """
+        Tinh dong don hang theo gia hien tai (1 truy van cho ca gio)
+        previous: {ma: (ten, gia, gia von)} cac dong cu cua don dang sua; ma khong con trong products
+        thi giu ten/gia cu, ma khong co o ca 2 noi -> ValueError (khong ghi dong gia 0)
+        Tra ve (order_details, total_amount, total_profit, products)
+        """
+        products = self.fetch_products(
+            cursor, [item['barcode'] for item in items],
+            'name, price, cost_price, quantity')
+        if previous is not None:
+            unknown = sorted({item['barcode'] for item in items} - set(products) - set(previous))
+            if unknown:
+                raise ValueError(f"San pham khong ton tai: {', '.join(unknown)}")
+        
+        total_amount = 0
+        total_profit = 0
+        order_details = []
+        
+        for item in items:
+            barcode = item['barcode']
+            quantity = item['quantity']
+            product = products.get(barcode)
+            
+            if not product and previous is not None:
+                # San pham da bi xoa sau khi ban: giu nguyen dong cu cua don
+                name, price, cost_price = previous[barcode]
+            elif not product:
+                # San pham da duoc them tu dong, lay thong tin tu item
+                name = item.get('name', f'SP_{barcode[:8]}')
+                price = item.get('price', 0)
+                cost_price = 0
+            else:
+                name, price, cost_price, _ = product
+            
+            subtotal = price * quantity
+            profit_per_item = (price - cost_price) * quantity
+            
+            total_amount += subtotal
+            total_profit += profit_per_item
+            
+            order_details.append({
+                'barcode': barcode,
+                'name': name,
+                'quantity': quantity,
+                'price': price,
+                'cost_price': cost_price,
+                'subtotal': subtotal,
+                'profit': profit_per_item
+            })
+        
+        return order_details, total_amount, total_profit, products
+    
+    def _take_stock(self, cursor, order_details, products, now, allow_oversell=False):
+        """
+        Tru kho co dieu kien cho cac dong don (tong theo ma, 1 ma co the nam nhieu dong):
+        rowcount 0 = khong du hang -> OutOfStockError, nguoi goi huy ca transaction
+        """
+        needed = Counter()
+        for d in order_details:
+            if d['barcode'] in products:
+                needed[d['barcode']] += d['quantity']
+        
+        guard = '' if allow_oversell else ' AND quantity >= ?'
+        shortages = []
+        for barcode, need in needed.items():
+            cursor.execute(f'''UPDATE products 
+                             SET quantity = quantity - ?, last_updated = ?
+                             WHERE barcode = ?{guard}''',
+                          (need, now, barcode) + (() if allow_oversell else (need,)))
+            if cursor.rowcount != 1:
+                shortages.append((barcode, products[barcode][0], products[barcode][3], need))
+        if shortages:
+            raise OutOfStockError(shortages)
+    
+    def _insert_order_lines(self, cursor, order_id, order_details, note, user, now):
+        """Them order_items + lich su SALE cho ca don (moi bang 1 lenh)"""
+        cursor.executemany('''INSERT INTO order_items 
+                        (order_id, barcode, product_name, quantity, unit_price, cost_price, subtotal, profit)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                      [(order_id, d['barcode'], d['name'], d['quantity'], d['price'],
+                        d['cost_price'], d['subtotal'], d['profit']) for d in order_details])
+        
+        cursor.executemany('''INSERT INTO inventory_history 
+                         (barcode, product_name, action, quantity, note, user, timestamp)
+                         VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                      [(d['barcode'], d['name'], 'SALE', -d['quantity'], note, user, now)
+                       for d in order_details])
+    
+    def _return_order_stock(self, cursor, order_id, note, user, now):
+        """
+        Tra hang cua 1 don ve kho: 1 lenh UPDATE + 1 lenh ghi lich su RETURN cho ca don
+        Tra ve danh sach ma vach da hoan tra
+        """
+        cursor.execute('''SELECT barcode, MAX(product_name), SUM(quantity) FROM order_items
+                         WHERE order_id = ? GROUP BY barcode''', (order_id,))
+        rows = cursor.fetchall()
+        
+        cursor.executemany('''UPDATE products SET quantity = quantity + ?, last_updated = ?
+                             WHERE barcode = ?''',
+                          [(quantity, now, barcode) for barcode, _, quantity in rows])
+        cursor.executemany('''INSERT INTO inventory_history 
+                             (barcode, product_name, action, quantity, note, user, timestamp)
+                             VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                          [(barcode, name, 'RETURN', quantity, note, user, now)
+                           for barcode, name, quantity in rows])
+        return [barcode for barcode, _, _ in rows]
+    
     def create_order(self, items, customer_name='', customer_phone='', 
-                    discount=0.0, payment_method='CASH', user='system'):
+                    discount=0.0, payment_method='CASH', user='system', terminal_id=None,
+                    allow_oversell=False):
         """
         Tao don hang - CO TINH LOI NHUAN
         items: [{'barcode': 'xxx', 'name': 'xxx', 'quantity': 1, 'price': 100, 'subtotal': 100}, ...]
-        """
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        terminal_id: quay tao don (may chu dung chung cho nhieu quay), mac dinh self.terminal_id
         
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        order_code = f"ORD{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        Ban qua ton kho: mac dinh tu choi ca don (khong ghi gi), tra ve
+        (False, msg, {'shortages': [(barcode, ten, ton, can)]});
+        allow_oversell=True (thu ngan xac nhan): van ban, ton kho xuong am dung bang so da ban
+        """
+        current = datetime.now()
+        now = current.strftime("%Y-%m-%d %H:%M:%S")
         
         try:
-            # Tinh tong tien va loi nhuan
-            total_amount = 0
-            total_profit = 0
-            order_details = []
-            
-            for item in items:
-                barcode = item['barcode']
-                quantity = item['quantity']
-                
-                cursor.execute("SELECT name, price, cost_price, quantity FROM products WHERE barcode = ?", (barcode,))
-                product = cursor.fetchone()
-                
-                if not product:
-                    # San pham da duoc them tu dong, lay thong tin tu item
-                    name = item.get('name', f'SP_{barcode[:8]}')
-                    price = item.get('price', 0)
-                    cost_price = 0
-                    stock = 999
-                else:
-                    name, price, cost_price, stock = product
+            with self.db.write() as cursor:
+                order_details, total_amount, total_profit, products = self._order_lines(cursor, items)
                 
-                subtotal = price * quantity
-                profit_per_item = (price - cost_price) * quantity
+                # Tru kho truoc khi ghi don: thieu hang thi khong co dong nao bi ghi
+                self._take_stock(cursor, order_details, products, now, allow_oversell)
                 
-                total_amount += subtotal
-                total_profit += profit_per_item
+                final_amount = total_amount - discount
+                order_code = self.allocate_order_code(cursor, current, terminal_id)
                 
-                order_details.append({
-                    'barcode': barcode,
-                    'name': name,
-                    'quantity': quantity,
-                    'price': price,
-                    'cost_price': cost_price,
-                    'subtotal': subtotal,
-                    'profit': profit_per_item
-                })
-            
-            final_amount = total_amount - discount
-            
-            # Tao don hang
-            cursor.execute('''INSERT INTO orders 
-                            (order_code, customer_name, customer_phone, total_amount, 
-                             discount, final_amount, payment_method, status, created_by, created_at, total_profit)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                          (order_code, customer_name, customer_phone, total_amount,
-                           discount, final_amount, payment_method, 'COMPLETED', user, now, total_profit))
-            
-            order_id = cursor.lastrowid
-            
-            # Them chi tiet don hang
-            for detail in order_details:
-                cursor.execute('''INSERT INTO order_items 
-                                (order_id, barcode, product_name, quantity, unit_price, cost_price, subtotal, profit)
-                                VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                              (order_id, detail['barcode'], detail['name'], 
-                               detail['quantity'], detail['price'], detail['cost_price'], 
-                               detail['subtotal'], detail['profit']))
-                
-                # Tru hang trong kho (neu co ton kho)
-                cursor.execute('''UPDATE products 
-                                 SET quantity = CASE 
-                                     WHEN quantity >= ? THEN quantity - ?
-                                     ELSE quantity
-                                 END,
-                                 last_updated = ?
-                                 WHERE barcode = ?''', 
-                              (detail['quantity'], detail['quantity'], now, detail['barcode']))
+                # Tao don hang
+                cursor.execute('''INSERT INTO orders 
+                                (order_code, customer_name, customer_phone, total_amount, 
+                                 discount, final_amount, payment_method, status, created_by, created_at, total_profit)
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                              (order_code, customer_name, customer_phone, total_amount,
+                               discount, final_amount, payment_method, 'COMPLETED', user, now, total_profit))
                 
-                # Luu lich su
-                cursor.execute('''INSERT INTO inventory_history 
-                                 (barcode, product_name, action, quantity, note, user, timestamp)
-                                 VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                              (detail['barcode'], detail['name'], 'SALE', -detail['quantity'],
-                               f"Don hang {order_code}", user, now))
-            
-            # ✅ COMMIT - QUAN TRỌNG!
-            conn.commit()
-            conn.close()
+                order_id = cursor.lastrowid
+                self._insert_order_lines(cursor, order_id, order_details,
+                                         f"Don hang {order_code}", user, now)
             
+            self.db.after_commit(self.product_cache.invalidate, [d['barcode'] for d in order_details])
             print(f"✅ Đã tạo đơn hàng {order_code} - Profit: {total_profit:,.0f}")
             
             return True, "Tao don hang thanh cong!", {
@@ -480,116 +1513,434 @@ class InventoryManager:
                 'items': order_details
             }
             
+        except OutOfStockError as e:
+            return False, str(e), {'shortages': e.shortages}
         except Exception as e:
-            conn.rollback()
-            conn.close()
             print(f"❌ Lỗi tạo đơn hàng: {e}")
             return False, f"Loi: {str(e)}", None
     
+    def void_order(self, order_id, note='', user='system'):
+        """
+        Huy don (giu lai don voi trang thai CANCELLED): hoan tra ca don ve kho trong 1 transaction
+        Bang tong hop doanh thu tu tru don qua trigger
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        
+        try:
+            with self.db.write() as cursor:
+                cursor.execute("SELECT order_code, status FROM orders WHERE order_id = ?", (order_id,))
+                order = cursor.fetchone()
+                if not order:
+                    return False, "Khong tim thay don hang!"
+                
+                order_code, status = order
+                if status == 'CANCELLED':
+                    return False, f"Don {order_code} da huy truoc do!"
+                
+                barcodes = self._return_order_stock(
+                    cursor, order_id, note or f"Hoan tra tu don huy {order_code}", user, now)
+                cursor.execute("UPDATE orders SET status = 'CANCELLED' WHERE order_id = ?", (order_id,))
+            
+            self.db.after_commit(self.product_cache.invalidate, barcodes)
+            return True, f"Da huy don {order_code}!"
+        except Exception as e:
+            return False, f"Loi: {str(e)}"
+    
+    def delete_order(self, order_id, user='system'):
+        """Xoa han don + chi tiet, hoan tra kho (don da huy thi kho da hoan tra truoc do)"""
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        
+        try:
+            with self.db.write() as cursor:
+                cursor.execute("SELECT order_code, status FROM orders WHERE order_id = ?", (order_id,))
+                order = cursor.fetchone()
+                if not order:
+                    return False, "Khong tim thay don hang!"
+                
+                order_code, status = order
+                barcodes = []
+                if status != 'CANCELLED':
+                    barcodes = self._return_order_stock(
+                        cursor, order_id, f"Hoan tra tu don xoa {order_code}", user, now)
+                
+                cursor.execute("DELETE FROM order_items WHERE order_id = ?", (order_id,))
+                cursor.execute("DELETE FROM orders WHERE order_id = ?", (order_id,))
+            
+            self.db.after_commit(self.product_cache.invalidate, barcodes)
+            return True, f"Da xoa don {order_code}!"
+        except Exception as e:
+            return False, f"Loi: {str(e)}"
+    
+    def replace_order_items(self, order_id, items, customer_name=None, customer_phone=None,
+                            user='system', allow_oversell=False):
+        """
+        Sua don: hoan tra hang cu, ghi lai cac dong moi theo gia hien tai, tinh lai tong tien/loi nhuan
+        (giu giam gia cu), tat ca trong 1 transaction
+        items: [{'barcode': 'xxx', 'quantity': 1}, ...]; customer_*=None -> giu nguyen
+        Tra ve giong create_order: (success, msg, du lieu don | {'shortages': [...]} | None)
+        """
+        if not items:
+            return False, "Don hang phai co it nhat 1 san pham!", None
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        
+        try:
+            with self.db.write() as cursor:
+                cursor.execute('''SELECT order_code, status, discount, customer_name, customer_phone
+                                 FROM orders WHERE order_id = ?''', (order_id,))
+                order = cursor.fetchone()
+                if not order:
+                    return False, "Khong tim thay don hang!", None
+                
+                order_code, status, discount, old_name, old_phone = order
+                if status == 'CANCELLED':
+                    return False, f"Don {order_code} da huy, khong sua duoc!", None
+                
+                cursor.execute('''SELECT barcode, product_name, unit_price, cost_price
+                                 FROM order_items WHERE order_id = ?''', (order_id,))
+                previous = {row[0]: row[1:] for row in cursor.fetchall()}
+                returned = self._return_order_stock(
+                    cursor, order_id, f"Hoan tra tu don sua {order_code}", user, now)
+                cursor.execute("DELETE FROM order_items WHERE order_id = ?", (order_id,))
+                
+                order_details, total_amount, total_profit, products = self._order_lines(
+                    cursor, items, previous)
+                self._take_stock(cursor, order_details, products, now, allow_oversell)
+                self._insert_order_lines(cursor, order_id, order_details,
+                                         f"Xuat lai tu don sua {order_code}", user, now)
+                
+                discount = discount or 0
+                final_amount = total_amount - discount
+                cursor.execute('''UPDATE orders 
+                                 SET customer_name = ?, customer_phone = ?, total_amount = ?,
+                                     final_amount = ?, total_profit = ?
+                                 WHERE order_id = ?''',
+                              (old_name if customer_name is None else customer_name,
+                               old_phone if customer_phone is None else customer_phone,
+                               total_amount, final_amount, total_profit, order_id))
+            
+            self.db.after_commit(self.product_cache.invalidate,
+                                 returned + [d['barcode'] for d in order_details])
+            return True, f"Da cap nhat don {order_code}!", {
+                'order_id': order_id,
+                'order_code': order_code,
+                'total': total_amount,
+                'discount': discount,
+                'final': final_amount,
+                'profit': total_profit,
+                'items': order_details
+            }
+        except OutOfStockError as e:
+            return False, str(e), {'shortages': e.shortages}
+        except ValueError as e:
+            return False, str(e), None
+        except Exception as e:
+            return False, f"Loi: {str(e)}", None
+    
     def get_all_products(self):
         """Lay tat ca san pham"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.db.reader().cursor()
         
         cursor.execute('''SELECT id, barcode, name, category, quantity, min_stock, 
                                 price, cost_price, last_updated 
                          FROM products ORDER BY created_at DESC''')
-        products = cursor.fetchall()
-        conn.close()
+        return cursor.fetchall()
+    
+    # So ket qua FTS toi da duoc xep hang cho 1 lan tim
+    SEARCH_CANDIDATES = 1000
+    
+    def search_products(self, query, limit=50, offset=0):
+        """
+        Tim san pham theo ma vach, ten, danh muc, NCC (khop tien to, xep theo do lien quan)
+        Tra ve cung dang dong voi get_all_products
+        """
+        cursor = self.db.reader().cursor()
+        terms = query.replace('"', ' ').split()
         
-        return products
+        if not terms:
+            cursor.execute('''SELECT id, barcode, name, category, quantity, min_stock,
+                                    price, cost_price, last_updated
+                             FROM products ORDER BY created_at DESC
+                             LIMIT ? OFFSET ?''', (limit, offset))
+            return cursor.fetchall()
+        
+        if not self.fts_enabled:
+            conditions = ' AND '.join(
+                "(barcode LIKE ? OR name LIKE ? OR category LIKE ? OR supplier LIKE ?)" for _ in terms)
+            params = [f"%{term}%" for term in terms for _ in range(4)]
+            cursor.execute(f'''SELECT id, barcode, name, category, quantity, min_stock,
+                                     price, cost_price, last_updated
+                              FROM products WHERE {conditions}
+                              ORDER BY created_at DESC LIMIT ? OFFSET ?''',
+                          params + [limit, offset])
+            return cursor.fetchall()
+        
+        # Moi tu la 1 tien to: "nuoc ng" -> "nuoc"* AND "ng"*
+        match = ' '.join(f'"{term}"*' for term in terms)
+        # Tu khoa qua ngan khop ca catalog: chi cham diem 1 nhom ung vien de giu toc do
+        candidates = max(self.SEARCH_CANDIDATES, offset + limit)
+        cursor.execute('''SELECT p.id, p.barcode, p.name, p.category, p.quantity, p.min_stock,
+                                p.price, p.cost_price, p.last_updated
+                         FROM (SELECT rowid, bm25(products_fts, 10.0, 5.0, 2.0, 1.0) AS score
+                               FROM products_fts WHERE products_fts MATCH ? LIMIT ?) f
+                         JOIN products p ON p.id = f.rowid
+                         ORDER BY f.score
+                         LIMIT ? OFFSET ?''', (match, candidates, limit, offset))
+        return cursor.fetchall()
+    
+    def get_name_index(self):
+        """Chi muc trigram ten san pham (xay tu database lan dau goi)"""
+        with self._name_index_lock:
+            if self.name_index is None:
+                index = NameIndex()
+                cursor = self.db.reader().execute("SELECT id, barcode, name FROM products")
+                for product_id, barcode, name in cursor:
+                    index.add(product_id, barcode, name)
+                self.name_index = index
+            return self.name_index
+    
+    def _index_product_name(self, cursor, barcode, name):
+        """Cap nhat chi muc ten sau khi them/sua san pham (neu chi muc da duoc xay)"""
+        if self.name_index is None:
+            return
+        cursor.execute("SELECT id FROM products WHERE barcode = ?", (barcode,))
+        row = cursor.fetchone()
+        if row:
+            with self._name_index_lock:
+                self.name_index.add(row[0], barcode, name)
+    
+    def lookup_products(self, text, limit=8):
+        """
+        Tim san pham theo ten gan dung: khong dau ("nuoc" khop "nước"), chiu loi go sai
+        Tra ve cung dang dong voi get_all_products, tot nhat truoc
+        """
+        index = self.get_name_index()
+        with self._name_index_lock:
+            matches = index.lookup(text, limit)
+        if not matches:
+            return []
+        
+        ids = [product_id for product_id, _ in matches]
+        placeholders = ','.join('?' * len(ids))
+        cursor = self.db.reader().cursor()
+        cursor.execute(f'''SELECT id, barcode, name, category, quantity, min_stock,
+                                 price, cost_price, last_updated
+                          FROM products WHERE id IN ({placeholders})''', ids)
+        rows = {row[0]: row for row in cursor.fetchall()}
+        
+        return [rows[product_id] for product_id in ids if product_id in rows]
     
     def get_low_stock_products(self):
         """Lay san pham ton kho thap"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.db.reader().cursor()
         
         cursor.execute('''SELECT barcode, name, category, quantity, min_stock, 
                                 price, last_updated, created_at 
                          FROM products 
                          WHERE quantity <= min_stock 
                          ORDER BY quantity ASC''')
-        products = cursor.fetchall()
-        conn.close()
-        
-        return products
+        return cursor.fetchall()
     
     def get_inventory_history(self, limit=50):
         """Lay lich su xuat nhap"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        return self.get_inventory_history_page(limit)[0]
+    
+    def get_inventory_history_page(self, limit=50, cursor=None):
+        """
+        Lich su xuat nhap theo trang, moi nhat truoc (keyset tren timestamp, id)
+        cursor: gia tri next_cursor cua trang truoc, None = trang dau
+        Tra ve (rows, next_cursor), next_cursor None khi het du lieu
+        """
+        if cursor is None:
+            where, params = '', []
+        else:
+            where, params = 'WHERE (timestamp, id) < (?, ?)', list(cursor)
         
-        cursor.execute('''SELECT id, barcode, product_name, action, quantity, note, user, timestamp
-                         FROM inventory_history
-                         ORDER BY timestamp DESC LIMIT ?''', (limit,))
-        history = cursor.fetchall()
-        conn.close()
+        rows = self.db.reader().execute(f'''SELECT id, barcode, product_name, action, quantity, note, user, timestamp
+                                           FROM inventory_history {where}
+                                           ORDER BY timestamp DESC, id DESC LIMIT ?''',
+                                        params + [limit]).fetchall()
+        next_cursor = (rows[-1][7], rows[-1][0]) if len(rows) == limit else None
+        return rows, next_cursor
+    
+    def get_orders_page(self, limit=50, cursor=None):
+        """
+        Don hang theo trang, moi nhat truoc (keyset tren created_at, order_id)
+        cursor: gia tri next_cursor cua trang truoc, None = trang dau
+        Tra ve (rows 11 cot nhu get_orders, next_cursor), next_cursor None khi het du lieu
+        """
+        if cursor is None:
+            where, params = '', []
+        else:
+            where, params = 'WHERE (created_at, order_id) < (?, ?)', list(cursor)
+        
+        rows = self.db.reader().execute(f'''SELECT order_id, order_code, customer_name, customer_phone,
+                                                  total_amount, discount, final_amount, payment_method,
+                                                  status, created_at, total_profit
+                                           FROM orders {where}
+                                           ORDER BY created_at DESC, order_id DESC LIMIT ?''',
+                                        params + [limit]).fetchall()
+        next_cursor = (rows[-1][9], rows[-1][0]) if len(rows) == limit else None
+        return rows, next_cursor
+    
+    # Tu khoa khop it hon so don nay: lay het don khop roi sap xep,
+    # nhieu hon: duyet index created_at tu moi nhat va loc tung dong (dung som nho LIMIT)
+    ORDER_SEARCH_SORT_LIMIT = 5000
+    
+    def _order_text_conditions(self, text):
+        """
+        Dieu kien khop `text`: tien to ma don, tien to SDT, ten khach (FTS)
+        Tra ve [(dieu kien tren orders, truy van order_id khop, tham so)]
+        """
+        conditions = []
+        
+        code = text.upper().replace(' ', '')
+        condition = "(order_code >= ? AND order_code < ?)"
+        conditions.append((condition, f"SELECT order_id FROM orders WHERE {condition}",
+                           [code, code + '\uffff']))
+        
+        phone = ''.join(ch for ch in text if ch.isdigit())
+        if phone and len(phone) == len(text.replace(' ', '')):
+            condition = "(customer_phone >= ? AND customer_phone < ?)"
+            conditions.append((condition, f"SELECT order_id FROM orders WHERE {condition}",
+                               [phone, phone + '\uffff']))
         
-        return history
+        if self.fts_enabled:
+            match = "SELECT rowid FROM orders_fts WHERE orders_fts MATCH ?"
+            terms = text.replace('"', ' ').split()
+            conditions.append((f"order_id IN ({match})", match,
+                               [' '.join(f'"{term}"*' for term in terms)]))
+        else:
+            condition = "customer_name LIKE ?"
+            conditions.append((condition, f"SELECT order_id FROM orders WHERE {condition}",
+                               [f"%{text}%"]))
+        
+        return conditions
+    
+    def search_orders(self, text='', date_from=None, date_to=None, payment_method=None,
+                      limit=50, cursor=None):
+        """
+        Tim don hang tren toan bo lich su: tien to ma don / SDT, ten khach (khong dau, tien to)
+        date_from/date_to: 'YYYY-MM-DD' (tinh ca 2 dau), payment_method: 'CASH', ...
+        Phan trang nhu get_orders_page: tra ve (rows, next_cursor)
+        """
+        conditions, params = [], []
+        if date_from:
+            conditions.append("created_at >= ?")
+            params.append(date_from)
+        if date_to:
+            conditions.append("created_at <= ?")
+            params.append(date_to + '~')
+        if payment_method:
+            conditions.append("payment_method = ?")
+            params.append(payment_method)
+        if cursor is not None:
+            conditions.append("(created_at, order_id) < (?, ?)")
+            params += list(cursor)
+        
+        reader = self.db.reader()
+        source = 'orders INDEXED BY idx_orders_created_at'
+        text = (text or '').strip()
+        if text:
+            text_conditions = self._order_text_conditions(text)
+            # Moi dieu kien dung index rieng, UNION ALL de dung som khi du SORT_LIMIT don (co the trung id)
+            candidates = ' UNION ALL '.join(select for _, select, _ in text_conditions)
+            candidate_params = [param for _, _, values in text_conditions for param in values]
+            ids = [row[0] for row in reader.execute(f"{candidates} LIMIT ?",
+                                                    candidate_params + [self.ORDER_SEARCH_SORT_LIMIT])]
+            if not ids:
+                return [], None
+            
+            if len(ids) < self.ORDER_SEARCH_SORT_LIMIT:
+                # It ket qua: doc dung cac don nay roi sap xep
+                source = 'orders NOT INDEXED'
+                conditions.insert(0, "order_id IN (SELECT value FROM json_each(?))")
+                params.insert(0, json.dumps(ids))
+            else:
+                conditions.insert(0, '(' + ' OR '.join(condition for condition, _, _ in text_conditions) + ')')
+                params = candidate_params + params
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        rows = reader.execute(f'''SELECT order_id, order_code, customer_name, customer_phone,
+                                        total_amount, discount, final_amount, payment_method,
+                                        status, created_at, total_profit
+                                 FROM {source} {where}
+                                 ORDER BY created_at DESC, order_id DESC LIMIT ?''',
+                              params + [limit]).fetchall()
+        next_cursor = (rows[-1][9], rows[-1][0]) if len(rows) == limit else None
+        return rows, next_cursor
     
     def get_orders(self, limit=50):
         """Lay danh sach don hang - 11 cột"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute('''SELECT order_id, order_code, customer_name, customer_phone,
-                                    total_amount, discount, final_amount, payment_method,
-                                    status, created_at, total_profit
-                             FROM orders
-                             ORDER BY created_at DESC LIMIT ?''', (limit,))
-            orders = cursor.fetchall()
-            conn.close()
+            orders = self.get_orders_page(limit)[0]
             
             print(f"✅ get_orders: Tìm thấy {len(orders)} đơn hàng")
             return orders
             
         except Exception as e:
-            conn.close()
             print(f"❌ Lỗi get_orders: {e}")
             return []
     
     def get_order_details(self, order_id):
         """Lay chi tiet don hang"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.db.reader().cursor()
         
         cursor.execute('''SELECT barcode, product_name, quantity, unit_price, cost_price, subtotal, profit
                          FROM order_items
                          WHERE order_id = ?''', (order_id,))
-        items = cursor.fetchall()
-        conn.close()
-        
-        return items
+        return cursor.fetchall()
     
     def get_monthly_profit(self):
-        """Thong ke loi nhuan theo thang"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        """Thong ke loi nhuan theo thang (doc bang tong hop, khong quet orders)"""
+        cursor = self.db.reader().cursor()
         
         cursor.execute('''
             SELECT 
-                strftime('%Y-%m', created_at) as month,
-                SUM(total_profit) as total_profit,
-                SUM(final_amount) as total_revenue,
-                COUNT(*) as order_count
-            FROM orders
-            WHERE status = 'COMPLETED'
-            GROUP BY strftime('%Y-%m', created_at)
-            ORDER BY month DESC
+                bucket as month,
+                SUM(profit) as total_profit,
+                SUM(revenue) as total_revenue,
+                SUM(order_count) as order_count
+            FROM sales_monthly
+            GROUP BY bucket
+            HAVING SUM(order_count) > 0
+            ORDER BY bucket DESC
             LIMIT 12
         ''')
         
-        monthly_data = cursor.fetchall()
-        conn.close()
+        return cursor.fetchall()
+    
+    # Do chi tiet bao cao -> bang tong hop
+    ROLLUP_GRAINS = {'hour': 'sales_hourly', 'day': 'sales_daily', 'month': 'sales_monthly'}
+    
+    def get_sales_rollup(self, grain='day', start=None, end=None, limit=None):
+        """
+        Doanh thu theo gio/ngay/thang va phuong thuc thanh toan, moi nhat truoc
+        start/end: tien to thoi gian (vd '2024-05-01'), tinh ca 2 dau
+        Tra ve [(bucket, payment_method, revenue, profit, order_count, units)]
+        """
+        table = self.ROLLUP_GRAINS[grain]
+        conditions = ["order_count > 0"]
+        params = []
+        if start:
+            conditions.append("bucket >= ?")
+            params.append(start)
+        if end:
+            # '2024-05-31' phai gom ca gio '2024-05-31 23'
+            conditions.append("bucket <= ?")
+            params.append(end + '~')
         
-        return monthly_data
+        cursor = self.db.reader().cursor()
+        cursor.execute(f'''SELECT bucket, payment_method, revenue, profit, order_count, units
+                          FROM {table}
+                          WHERE {' AND '.join(conditions)}
+                          ORDER BY bucket DESC, payment_method
+                          LIMIT ?''', params + [-1 if limit is None else limit])
+        return cursor.fetchall()
     
     # ✅ THÊM HÀM DEBUG
     def debug_database(self):
         """Debug database structure"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.db.reader().cursor()
         
         print("\n=== DEBUG DATABASE ===")
         
@@ -616,5 +1967,22 @@ class InventoryManager:
             print("\n--- 3 đơn hàng gần nhất ---")
             for row in cursor.fetchall():
                 print(f"  {row}")
-        
-        conn.close()
+
+
+if __name__ == "__main__":
+    # Kiem tra query plan: python dulieu.py [duong_dan_db]
+    # Tinh lai bang tong hop doanh thu: python dulieu.py [duong_dan_db] --rebuild-rollups
+    import sys
+    
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    manager = InventoryManager(args[0] if args else 'inventory.db')
+    if '--rebuild-rollups' in sys.argv:
+        manager.rebuild_sales_rollups()
+    problems = manager.verify_query_plans()
+    manager.close()
+    
+    if problems:
+        for method_name, sql, detail in problems:
+            print(f"❌ {method_name}: {detail}\n    {sql}")
+        sys.exit(1)
+    print("✅ Tat ca truy van deu dung index")
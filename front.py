@@ -3,8 +3,14 @@ from tkinter import ttk, filedialog, messagebox, scrolledtext, simpledialog
 from PIL import Image, ImageTk
 import cv2
 import numpy as np
+from collections import Counter
 from datetime import datetime
 from dulieu import InventoryManager
+from maychu import RemoteInventory
+from nhaplieu import import_catalog, write_error_report
+from tacvu import AsyncInventory
+from quetma import SIGHTING_INTERVAL, ScanRouter
+from giaima import DEFAULT_ENGINE
 from scan import RealtimeBarcodeScanner
 from pyzbar.pyzbar import decode
 import threading
@@ -20,10 +26,25 @@ class InventoryApp:
         self.root.geometry("1600x900")
         self.root.configure(bg='#f0f0f0')
 
-        self.manager = InventoryManager()
+        # KHO_SERVER=http://127.0.0.1:8765: dung chung database qua may chu (maychu.py)
+        server_url = os.environ.get('KHO_SERVER')
+        self.manager = RemoteInventory(server_url) if server_url else InventoryManager()
+        # Goi database o luong nen, ket qua ve lai giao dien qua root.after
+        self.async_db = AsyncInventory(self.manager, root)
 
         try:
-            self.camera_scanner = RealtimeBarcodeScanner(callback=self.on_camera_scanned)
+            # KHO_DECODE_WORKERS=3 (KHO_DECODE_MODE=process): decode song song tren nhieu loi
+            # KHO_CAMERA_CPU=0.3: decode dung toi da 30% 1 loi (may quay yeu)
+            # KHO_DECODE_ENGINE="pyzbar,opencv:sharpen": doi bo giai ma (xem giaima.py)
+            # KHO_CAMERA=1 / quay.mp4 / thu_muc_anh / synthetic: doi nguon hinh (xem nguonhinh.py)
+            self.camera_scanner = RealtimeBarcodeScanner(
+                callback=self.on_camera_scanned,
+                pool_workers=int(os.environ.get('KHO_DECODE_WORKERS', 0)),
+                pool_mode=os.environ.get('KHO_DECODE_MODE', 'thread'),
+                cpu_budget=float(os.environ.get('KHO_CAMERA_CPU', 1.0)),
+                engine=os.environ.get('KHO_DECODE_ENGINE', DEFAULT_ENGINE))
+            # Loc trung theo che do nam o ScanRouter, scanner chi bao ma con trong khung hinh
+            self.camera_scanner.scan_cooldown = SIGHTING_INTERVAL
             self.camera_available = True
         except Exception as e:
             self.camera_scanner = None
@@ -37,6 +58,14 @@ class InventoryApp:
         self.last_scanned_product = None
         self.current_tab_mode = None
         self.last_order_data = None
+        # Ma quet tu camera -> gio hang / phieu nhap / xuat kho / kiem kho, gom theo dot
+        self.scan_router = ScanRouter({
+            'sell': self.on_sell_scans,
+            'import': self.on_import_scans,
+            'export': self.on_export_scans,
+            'stocktake': self.on_stocktake_scans,
+        }, schedule=self.root.after)
+        self.camera_canvas = None
 
         self.style = ttk.Style()
         self.style.theme_use('clam')
@@ -46,6 +75,9 @@ class InventoryApp:
         self.create_widgets()
         self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
 
+        # Xay san chi muc ten san pham de goi y khong phai doi o phim dau tien
+        self.async_db.warm_caches()
+
     def create_widgets(self):
         """Tao giao dien chinh"""
 
@@ -113,6 +145,15 @@ class InventoryApp:
 
         if 'Ban Hang' in current_tab:
             self.current_tab_mode = 'sell'
+            self.camera_canvas = self.sell_camera_canvas
+        elif 'Xuat Nhap' in current_tab:
+            self.current_tab_mode = self.inventory_scan_mode.get()
+            self.camera_canvas = self.inventory_camera_canvas
+        else:
+            self.current_tab_mode = None
+        self.scan_router.set_mode(self.current_tab_mode)
+
+        if self.current_tab_mode:
             if not self.camera_running:
                 self.start_camera_auto()
         else:
@@ -232,6 +273,23 @@ class InventoryApp:
         self.sell_barcode_entry.bind('<FocusIn>', on_focus_in)
         self.sell_barcode_entry.bind('<FocusOut>', on_focus_out)
 
+        # Goi y theo ten (khong dau, chiu go sai), an khi khong co ket qua
+        self.sell_suggestions = []
+        self.sell_suggest_listbox = tk.Listbox(
+            search_body,
+            height=6,
+            font=('Segoe UI', 10),
+            relief=tk.SOLID,
+            borderwidth=1,
+            activestyle='none'
+        )
+        self.sell_barcode_entry.bind('<KeyRelease>', self.suggest_products)
+        self.sell_barcode_entry.bind('<Down>', lambda e: self.focus_suggestions())
+        self.sell_barcode_entry.bind('<Escape>', lambda e: self.hide_suggestions())
+        self.sell_suggest_listbox.bind('<Return>', lambda e: self.add_suggested_product())
+        self.sell_suggest_listbox.bind('<Double-1>', lambda e: self.add_suggested_product())
+        self.sell_suggest_listbox.bind('<Escape>', lambda e: self.hide_suggestions())
+
         # CARD CAMERA
         if self.camera_available:
             camera_card = tk.Frame(left_col, bg='white', relief=tk.SOLID, borderwidth=1, height=180)
@@ -532,13 +590,35 @@ class InventoryApp:
     # GIO HANG / THANH TOAN
 
     def add_to_cart(self, barcode):
-        """Them san pham vao gio hang theo ma vach"""
-        result = self.manager.check_product_status(barcode)
-        if not result['exists']:
-            self.manager.quick_add_product(barcode, f"SP{barcode[-8:]}", 0.0)
-            result = self.manager.check_product_status(barcode)
-
-        data = result['data']
+        """Them san pham vao gio hang theo ma vach (ma chua co trong cache: tra o luong doc)"""
+        result = self.manager.cached_product_status(barcode)
+        if result is not None and result['exists']:
+            self.put_in_cart(barcode, result['data'])
+            return
+        self.async_db.check_product_status(
+            barcode, callback=lambda result: self.on_cart_product_loaded(barcode, result),
+            errback=lambda e: self.update_status(f"Loi tra ma {barcode}: {e}"))
+
+    def on_cart_product_loaded(self, barcode, result, created=False):
+        """Ket qua check_product_status: ma moi thi them nhanh san pham roi moi vao gio"""
+        if result['exists']:
+            self.put_in_cart(barcode, result['data'])
+        elif created:
+            self.update_status(f"Khong them duoc san pham '{barcode}'")
+        else:
+            self.async_db.quick_add_product(
+                barcode, f"SP{barcode[-8:]}", 0.0,
+                callback=lambda result: self.on_quick_add_done(barcode, result),
+                errback=lambda e: messagebox.showerror("Loi", f"Loi them san pham: {e}"))
+
+    def on_quick_add_done(self, barcode, result):
+        """Ket qua quick_add_product (ma da duoc quay khac them cung tinh): nap lai san pham"""
+        self.async_db.check_product_status(
+            barcode, callback=lambda status: self.on_cart_product_loaded(barcode, status, created=True),
+            errback=lambda e: self.update_status(f"Loi tra ma {barcode}: {e}"))
+
+    def put_in_cart(self, barcode, data):
+        """Cong 1 san pham (data cua check_product_status) vao gio hang"""
         for item in self.cart_items:
             if item['barcode'] == barcode:
                 item['quantity'] += 1
@@ -560,11 +640,74 @@ class InventoryApp:
         self.update_status(f"Da them {data['name']}")
 
     def add_to_cart_manual(self):
-        """Them san pham bang tay"""
+        """Them san pham bang tay (ma vach, hoac ten -> goi y dau tien)"""
         barcode = self.sell_barcode_entry.get().strip()
         if barcode and barcode != "Nhap ma hoac ten san pham...":
-            self.add_to_cart(barcode)
+            if self.sell_suggestions:
+                # Chu khong phai ma vach -> goi y dau tien
+                suggested = self.sell_suggestions[0][1]
+                cached = self.manager.cached_product_status(barcode)
+                if cached is not None and cached['exists']:
+                    self.add_to_cart(barcode)
+                else:
+                    self.async_db.check_product_status(
+                        barcode, callback=lambda result: self.add_to_cart(
+                            barcode if result['exists'] else suggested))
+            else:
+                self.add_to_cart(barcode)
             self.sell_barcode_entry.delete(0, tk.END)
+            self.hide_suggestions()
+
+    def suggest_products(self, event=None):
+        """Goi y san pham theo ten moi khi go phim"""
+        if event is not None and event.keysym in ('Return', 'Down', 'Up', 'Escape'):
+            return
+        text = self.sell_barcode_entry.get().strip()
+        if len(text) < 2 or text == "Nhap ma hoac ten san pham..." or text.isdigit():
+            self.hide_suggestions()
+            return
+
+        self.async_db.lookup_products(text, limit=8, key='suggest', callback=self.show_suggestions)
+
+    def show_suggestions(self, suggestions):
+        """Ket qua lookup_products cua chu go moi nhat"""
+        self.sell_suggestions = suggestions
+        if not self.sell_suggestions:
+            self.hide_suggestions()
+            return
+
+        self.sell_suggest_listbox.delete(0, tk.END)
+        for p in self.sell_suggestions:
+            product_id, barcode, name, category, qty, min_stock, price, cost_price, last_updated = p
+            self.sell_suggest_listbox.insert(tk.END, f"{name} - {price:,.0f} VND (Ton: {qty})")
+        if not self.sell_suggest_listbox.winfo_ismapped():
+            self.sell_suggest_listbox.pack(fill='x', pady=(6, 0))
+
+    def focus_suggestions(self):
+        """Chuyen focus xuong danh sach goi y"""
+        if self.sell_suggestions:
+            self.sell_suggest_listbox.focus_set()
+            self.sell_suggest_listbox.selection_clear(0, tk.END)
+            self.sell_suggest_listbox.selection_set(0)
+            self.sell_suggest_listbox.activate(0)
+
+    def add_suggested_product(self):
+        """Them san pham dang chon trong danh sach goi y"""
+        selection = self.sell_suggest_listbox.curselection()
+        if not selection or not self.sell_suggestions:
+            return
+        barcode = self.sell_suggestions[selection[0]][1]
+        self.add_to_cart(barcode)
+        self.sell_barcode_entry.delete(0, tk.END)
+        self.hide_suggestions()
+        self.sell_barcode_entry.focus_set()
+
+    def hide_suggestions(self):
+        """An danh sach goi y (bo ca ket qua tra cuu dang chay cua chu go truoc)"""
+        self.async_db.discard('suggest')
+        self.sell_suggestions = []
+        self.sell_suggest_listbox.delete(0, tk.END)
+        self.sell_suggest_listbox.pack_forget()
 
     def update_product_info(self, data, quantity_in_cart):
         """Cap nhat thong tin san pham vua them"""
@@ -718,15 +861,49 @@ class InventoryApp:
         else:
             payment_method = 'TRANSFER'
 
-        success, msg, order_data = self.manager.create_order(
-            items=self.cart_items,
+        self.submit_order(customer_name, customer_phone, payment_method, discount)
+
+    def submit_order(self, customer_name, customer_phone, payment_method, discount,
+                     allow_oversell=False):
+        """Gui gio hang cho luong ghi tao don"""
+        # Khoa nut trong luc luong ghi tao don, tranh bam 2 lan
+        self.btn_payment.config(state=tk.DISABLED, bg="#6c757d")
+        self.update_status("Dang tao don hang...")
+
+        def done(result):
+            self.on_payment_done(result, customer_name, customer_phone, payment_method, discount,
+                                 allow_oversell)
+
+        def failed(error):
+            self.btn_payment.config(state=tk.NORMAL, bg="#28a745")
+            messagebox.showerror("LOI", f"Loi tao don hang: {error}")
+
+        self.async_db.create_order(
+            items=list(self.cart_items),
             customer_name=customer_name,
             customer_phone=customer_phone,
             discount=discount,
             payment_method=payment_method,
-            user='admin'
+            user='admin',
+            allow_oversell=allow_oversell,
+            callback=done,
+            errback=failed
         )
 
+    def on_payment_done(self, result, customer_name, customer_phone, payment_method, discount,
+                        allow_oversell=False):
+        """Ket qua create_order tu luong ghi"""
+        success, msg, order_data = result
+        if not success and order_data and not allow_oversell:
+            # Khong du hang (vd hang moi quet chua nhap kho): thu ngan quyet dinh ban am kho
+            shortages = "\n".join(f"- {name}: con {stock}, can {need}"
+                                   for _, name, stock, need in order_data['shortages'])
+            if messagebox.askyesno("KHONG DU HANG",
+                                   f"Ton kho khong du:\n{shortages}\n\n"
+                                   f"Van ban (ton kho se am)?"):
+                self.submit_order(customer_name, customer_phone, payment_method, discount,
+                                  allow_oversell=True)
+                return
         if success:
             self.last_order_data = {
                 'orderdata': order_data,
@@ -757,7 +934,9 @@ class InventoryApp:
             
             self.refresh_reports()
             self.refresh_products_list()
+            self.update_status(f"Da tao don {order_data['order_code']}")
         else:
+            self.btn_payment.config(state=tk.NORMAL, bg="#28a745")
             messagebox.showerror("LOI", msg)
 
     def cancel_payment(self):
@@ -776,15 +955,18 @@ class InventoryApp:
             return
 
         orderdata = self.last_order_data['orderdata']
-        for item in orderdata['items']:
-            barcode = item['barcode']
-            quantity = item['quantity']
-            self.manager.import_stock(
-                barcode, 
-                quantity, 
-                f"Hoan tra tu don huy {orderdata['order_code']}", 
-                'admin'
-            )
+
+        self.btn_cancel_payment.config(state=tk.DISABLED, bg="#6c757d")
+        self.async_db.void_order(orderdata['order_id'], user='admin',
+                                 callback=lambda result: self.on_payment_cancelled(result, orderdata))
+
+    def on_payment_cancelled(self, result, orderdata):
+        """Da huy don + hoan tra kho cho don vua thanh toan (luong ghi xong)"""
+        success, msg = result
+        if not success:
+            self.btn_cancel_payment.config(state=tk.NORMAL, bg="#ffc107")
+            messagebox.showerror("Loi", msg)
+            return
 
         messagebox.showinfo(
             "Da huy thanh toan", 
@@ -910,7 +1092,7 @@ class InventoryApp:
 
         def startthread():
             try:
-                success = self.camera_scanner.start(camera_id=0)
+                success = self.camera_scanner.start(camera_id=os.environ.get('KHO_CAMERA', 0))
                 if success:
                     self.camera_running = True
                     self.root.after(0, lambda: self.update_status("Camera hoat dong"))
@@ -933,9 +1115,9 @@ class InventoryApp:
         if self.update_camera_job:
             self.root.after_cancel(self.update_camera_job)
             self.update_camera_job = None
-        if hasattr(self, 'sell_camera_canvas'):
-            self.sell_camera_canvas.delete("all")
-            self.sell_camera_canvas.create_text(
+        if self.camera_canvas is not None:
+            self.camera_canvas.delete("all")
+            self.camera_canvas.create_text(
                 150, 75,
                 text="Camera da tam dung",
                 font=('Arial', 14),
@@ -956,11 +1138,14 @@ class InventoryApp:
         self.update_camera_job = self.root.after(33, self.update_camera_view)
 
     def display_camera_image(self, cvimage):
-        """Hien thi anh camera"""
+        """Hien thi anh camera len khung cua tab dang mo"""
+        canvas = self.camera_canvas
+        if canvas is None:
+            return
         try:
             rgbimage = cv2.cvtColor(cvimage, cv2.COLOR_BGR2RGB)
-            canvas_width = self.sell_camera_canvas.winfo_width()
-            canvas_height = self.sell_camera_canvas.winfo_height()
+            canvas_width = canvas.winfo_width()
+            canvas_height = canvas.winfo_height()
             if canvas_width <= 1 and canvas_height <= 1:
                 return
             h, w, _ = rgbimage.shape
@@ -969,28 +1154,70 @@ class InventoryApp:
             resized = cv2.resize(rgbimage, (new_w, new_h))
             pilimage = Image.fromarray(resized)
             photo = ImageTk.PhotoImage(pilimage)
-            self.sell_camera_canvas.delete("all")
-            self.sell_camera_canvas.create_image(
+            canvas.delete("all")
+            canvas.create_image(
                 canvas_width // 2,
                 canvas_height // 2,
                 image=photo,
                 anchor='center'
             )
-            self.sell_camera_canvas.image = photo
+            canvas.image = photo
         except Exception as e:
             print("Loi hien thi", e)
 
     def on_camera_scanned(self, result):
-        """Callback khi quet duoc ma vach"""
-        code_data = result['data']
+        """Callback khi quet duoc ma vach (luong camera): chuyen ve luong Tk cho ScanRouter"""
         try:
-            current_tab_id = self.notebook.select()
-            current_tab_name = self.notebook.tab(current_tab_id, "text")
-            if "Ban Hang" in current_tab_name:
-                self.root.after(0, lambda c=code_data: self.add_to_cart(c))
+            self.root.after(0, self.scan_router.feed, result['data'])
         except Exception as e:
             print("Loi callback", e)
 
+    def on_sell_scans(self, batch):
+        """Che do ban hang: moi ma vao gio ngay"""
+        for code, count in batch.items():
+            for _ in range(count):
+                self.add_to_cart(code)
+
+    def on_import_scans(self, batch):
+        """Che do nhap kho: ca dot cong vao phieu nhap (chua ghi kho, phieu tam luu 1 lan)"""
+        for code, count in batch.items():
+            self.add_receiving_line(code, count, quiet=True)
+
+    def on_export_scans(self, batch):
+        """Che do xuat kho: ca dot xuat trong 1 transaction"""
+        lines = list(batch.items())
+        self.update_status(f"Dang xuat kho {sum(batch.values())} san pham ({len(lines)} ma)...")
+        self.async_db.export_stock_batch(
+            lines, "Xuat kho (camera)", 'admin',
+            callback=self.on_camera_exported,
+            errback=lambda e: messagebox.showerror("Loi", f"Loi xuat kho: {e}"))
+
+    def on_camera_exported(self, result):
+        """Ket qua export_stock_batch cua 1 dot quet"""
+        success, msg, _ = result
+        self.camera_scan_summary.config(text=msg)
+        if not success:
+            messagebox.showerror("Loi", msg)
+            return
+        self.update_status(msg)
+        self.refresh_products_list()
+
+    def on_stocktake_scans(self, batch):
+        """Che do kiem kho: ca dot cong vao phien kiem kho dang mo (bo dem chung moi may)"""
+        if not self.stocktake_session:
+            self.update_status("Chua mo phien kiem kho - bam 'Mo kiem kho' truoc")
+            return
+        self.async_db.add_stocktake_counts(
+            self.stocktake_session['session_id'], list(batch.items()),
+            callback=self.on_stocktake_counted,
+            errback=lambda e: self.update_status(f"Loi kiem kho: {e}"))
+
+    def on_inventory_scan_mode_changed(self):
+        """Doi che do quet camera trong tab Xuat Nhap"""
+        if self.current_tab_mode and self.current_tab_mode != 'sell':
+            self.current_tab_mode = self.inventory_scan_mode.get()
+            self.scan_router.set_mode(self.current_tab_mode)
+
     # ================= TAB DON HANG (SUA LAI HOAN CHINH) =================
 
     def create_orders_tab(self):
@@ -1088,7 +1315,7 @@ class InventoryApp:
             width=30
         )
         self.order_search_entry.pack(side='left', padx=5)
-        self.order_search_entry.bind('<KeyRelease>', lambda e: self.search_orders())
+        self.order_search_entry.bind('<KeyRelease>', lambda e: self.schedule_order_search())
         
         tk.Button(
             search_frame,
@@ -1108,12 +1335,14 @@ class InventoryApp:
         
         scroll_y = ttk.Scrollbar(tree_frame, orient='vertical')
         scroll_x = ttk.Scrollbar(tree_frame, orient='horizontal')
+        self.orders_scroll_y = scroll_y
         
         self.orders_tree = ttk.Treeview(
             tree_frame,
-            columns=('ID', 'Ma DH', 'Khach hang', 'SDT', 'Tong tien', 'Giam gia', 'Thanh toan', 'Loi nhuan', 'PT', 'Ngay'),
+            columns=('ID', 'Ma DH', 'Khach hang', 'SDT', 'Tong tien', 'Giam gia', 'Thanh toan', 'Loi nhuan', 'PT', 'Ngay',
+                     'Trang thai'),
             show='headings',
-            yscrollcommand=scroll_y.set,
+            yscrollcommand=self.on_orders_scroll,
             xscrollcommand=scroll_x.set,
             height=20
         )
@@ -1131,12 +1360,15 @@ class InventoryApp:
             'Thanh toan': 110,
             'Loi nhuan': 110,
             'PT': 80,
-            'Ngay': 140
+            'Ngay': 140,
+            'Trang thai': 100
         }
         
         for col, width in columns.items():
             self.orders_tree.heading(col, text=col)
             self.orders_tree.column(col, width=width, anchor='center')
+        # Don da huy (void_order) van nam trong danh sach nhung khong tinh doanh thu
+        self.orders_tree.tag_configure('cancelled', foreground='#999999')
         
         self.orders_tree.pack(side='top', fill='both', expand=True)
         scroll_y.pack(side='right', fill='y')
@@ -1156,119 +1388,132 @@ class InventoryApp:
         )
         self.orders_status.pack(side='bottom', fill='x')
         
+        # Trang thai cuon vo han: vi tri keyset cua trang tiep theo
+        self.orders_keyword = ''
+        self.orders_cursor = None
+        self.orders_loaded = 0
+        self.orders_exhausted = False
+        self.orders_loading = False
+        self.order_search_job = None
+        
         self.refresh_orders()
 
+    # So don moi lan tai them
+    ORDERS_PAGE_SIZE = 100
+
     def refresh_orders(self):
-        """SUA: Refresh danh sach don hang"""
-        for item in self.orders_tree.get_children():
-            self.orders_tree.delete(item)
-        
-        try:
-            orders = self.manager.get_orders()
-            
-            print(f"DEBUG: Tim thay {len(orders)} don hang")
-            
-            if len(orders) == 0:
-                self.orders_status.config(text="Chua co don hang nao")
-                return
-            
-            for o in orders:
-                try:
-                    order_id = o[0]
-                    code = o[1]
-                    customer = o[2] or 'Khach le'
-                    phone = o[3] or ''
-                    total = float(o[4]) if o[4] else 0.0      # ← SỬA
-                    discount = float(o[5]) if o[5] else 0.0   # ← SỬA
-                    final = float(o[6]) if o[6] else 0.0      # ← SỬA
-                    method = o[7]
-                    status = o[8]
-                    created = o[9]
-                    profit = float(o[10]) if o[10] else 0.0   # ← SỬA
-
-                    
-                    self.orders_tree.insert(
-                        '',
-                        'end',
-                        values=(
-                            order_id,
-                            code,
-                            customer,
-                            phone,
-                            f"{total:,.0f}",
-                            f"{discount:,.0f}",
-                            f"{final:,.0f}",
-                            f"{profit:,.0f}",
-                            method,
-                            created
-                        )
-                    )
-                    
-                except (IndexError, ValueError, TypeError) as e:
-                    print(f"Loi load don {o}: {e}")
-                    continue
-            
-            self.orders_status.config(text=f"Co {len(orders)} don hang")
-            print(f"Da load {len(orders)} don hang vao table")
-            
-        except Exception as e:
-            print(f"Loi refresh_orders: {e}")
-            import traceback
-            traceback.print_exc()
-            self.orders_status.config(text=f"Loi: {e}")
+        """Refresh danh sach don hang (tai trang dau, cuon xuong de tai tiep)"""
+        self.reset_orders_list('')
+
+    def schedule_order_search(self):
+        """Go phim: cho ngung go 250ms moi tim (khong truy van moi phim)"""
+        if self.order_search_job is not None:
+            self.root.after_cancel(self.order_search_job)
+        self.order_search_job = self.root.after(250, self.search_orders)
 
     def search_orders(self):
-        """Tim kiem don hang"""
-        keyword = self.order_search_entry.get().strip().lower()
-        
+        """Tim kiem don hang theo ma don, SDT, ten khach tren toan bo lich su"""
+        self.order_search_job = None
+        self.reset_orders_list(self.order_search_entry.get().strip().lower())
+
+    def reset_orders_list(self, keyword):
+        """Xoa bang don hang va tai lai tu trang dau"""
         for item in self.orders_tree.get_children():
             self.orders_tree.delete(item)
         
-        orders = self.manager.get_orders(limit=200)
-        count = 0
+        self.orders_keyword = keyword
+        self.orders_cursor = None
+        self.orders_loaded = 0
+        self.orders_exhausted = False
+        # Trang dang tai cua danh sach cu (neu co) se bi bo qua
+        self.orders_loading = False
+        self.load_more_orders()
+
+    def on_orders_scroll(self, first, last):
+        """Cap nhat thanh cuon, gan cuoi bang thi tai them trang"""
+        self.orders_scroll_y.set(first, last)
+        if float(last) >= 0.9 and not self.orders_exhausted and not self.orders_loading:
+            self.root.after_idle(self.load_more_orders)
+
+    def load_more_orders(self):
+        """Tai them 1 trang don hang vao orders_tree (keyset, khong dung OFFSET) o luong nen"""
+        if self.orders_exhausted or self.orders_loading:
+            return
+        
+        self.orders_loading = True
+        keyword = self.orders_keyword
+        if keyword:
+            self.async_db.search_orders(
+                keyword, limit=self.ORDERS_PAGE_SIZE, cursor=self.orders_cursor,
+                key='orders', callback=self.on_orders_page, errback=self.on_orders_error)
+        else:
+            self.async_db.get_orders_page(
+                self.ORDERS_PAGE_SIZE, self.orders_cursor,
+                key='orders', callback=self.on_orders_page, errback=self.on_orders_error)
+
+    def on_orders_page(self, page):
+        """Them 1 trang don hang vua doc vao cuoi bang"""
+        orders, self.orders_cursor = page
+        self.orders_exhausted = self.orders_cursor is None
+        self.orders_loading = False
         
         for o in orders:
-            try:
-                order_id = o[0]
-                code = o[1]
-                customer = o[2] or 'Khach le'
-                phone = o[3] or ''
-                
-                if (keyword in code.lower() or 
-                    keyword in customer.lower() or 
-                    keyword in phone.lower()):
-                    
-                    total = float(o[4]) if o[4] else 0.0
-                    discount = float(o[5]) if o[5] else 0.0
-                    final = float(o[6]) if o[6] else 0.0
-
-                    method = o[7]
-                    status = o[8]
-                    created = o[9]
-                    profit = float(o[10]) if o[10] else 0.0
-
-                    
-                    self.orders_tree.insert(
-                        '',
-                        'end',
-                        values=(
-                            order_id,
-                            code,
-                            customer,
-                            phone,
-                            f"{total:,.0f}",
-                            f"{discount:,.0f}",
-                            f"{final:,.0f}",
-                            f"{profit:,.0f}",
-                            method,
-                            created
-                        )
-                    )
-                    count += 1
-            except:
-                continue
+            if self.insert_order_row(o):
+                self.orders_loaded += 1
         
-        self.orders_status.config(text=f"Tim thay {count} don hang")
+        keyword = self.orders_keyword
+        if self.orders_loaded == 0 and self.orders_exhausted:
+            text = "Khong tim thay don hang" if keyword else "Chua co don hang nao"
+        else:
+            text = f"{'Tim thay' if keyword else 'Co'} {self.orders_loaded} don hang"
+            if not self.orders_exhausted:
+                text += " - cuon xuong de tai them"
+        self.orders_status.config(text=text)
+
+    def on_orders_error(self, error):
+        """Loi doc danh sach don hang"""
+        print(f"Loi load_more_orders: {error}")
+        self.orders_loading = False
+        self.orders_status.config(text=f"Loi: {error}")
+
+    def insert_order_row(self, o):
+        """Them 1 don (11 cot cua get_orders) vao cuoi orders_tree"""
+        try:
+            order_id = o[0]
+            code = o[1]
+            customer = o[2] or 'Khach le'
+            phone = o[3] or ''
+            total = float(o[4]) if o[4] else 0.0
+            discount = float(o[5]) if o[5] else 0.0
+            final = float(o[6]) if o[6] else 0.0
+            method = o[7]
+            cancelled = o[8] == 'CANCELLED'
+            created = o[9]
+            profit = float(o[10]) if o[10] else 0.0
+            
+            self.orders_tree.insert(
+                '',
+                'end',
+                tags=('cancelled',) if cancelled else (),
+                values=(
+                    order_id,
+                    code,
+                    customer,
+                    phone,
+                    f"{total:,.0f}",
+                    f"{discount:,.0f}",
+                    f"{final:,.0f}",
+                    f"{profit:,.0f}",
+                    method,
+                    created,
+                    "Da huy" if cancelled else "Hoan thanh"
+                )
+            )
+            return True
+            
+        except (IndexError, ValueError, TypeError) as e:
+            print(f"Loi load don {o}: {e}")
+            return False
 
     def view_order_details(self, event):
         """Xem chi tiet don hang"""
@@ -1278,11 +1523,15 @@ class InventoryApp:
             return
         
         values = self.orders_tree.item(selected[0])['values']
-        order_id = values[0]
+        self.async_db.get_order_details(
+            values[0], key='order_details',
+            callback=lambda items: self.show_order_details(values, items),
+            errback=lambda e: messagebox.showerror("Loi", f"Loi tai don hang: {e}"))
+
+    def show_order_details(self, values, items):
+        """Cua so chi tiet don (items cua get_order_details tu luong doc)"""
         code = values[1]
         
-        items = self.manager.get_order_details(order_id)
-        
         dialog = tk.Toplevel(self.root)
         dialog.title(f"Don hang {code}")
         dialog.geometry("900x600")
@@ -1390,14 +1639,19 @@ class InventoryApp:
             return
         
         values = self.orders_tree.item(selected[0])['values']
+        # Lay chi tiet don hang o luong doc
+        self.async_db.get_order_details(
+            values[0], key='order_details',
+            callback=lambda items: self.show_edit_order(values, items),
+            errback=lambda e: messagebox.showerror("Loi", f"Loi tai don hang: {e}"))
+
+    def show_edit_order(self, values, items):
+        """Cua so sua don (items cua get_order_details tu luong doc)"""
         order_id = values[0]
         code = values[1]
         current_customer = values[2]
         current_phone = values[3]
         
-        # Lay chi tiet don hang
-        items = self.manager.get_order_details(order_id)
-        
         # Tao dialog
         dialog = tk.Toplevel(self.root)
         dialog.title(f"Sua don hang {code}")
@@ -1481,9 +1735,11 @@ class InventoryApp:
         product_tree.column('Tong', width=120, anchor='e')
         
         # Load san pham
+        # Treeview doi ma vach dang so thanh int (mat so 0 dau): giu ma goc theo dong
+        row_barcodes = {}
         for item in items:
             barcode, name, qty, price, cost, subtotal, profit = item
-            product_tree.insert(
+            row_barcodes[product_tree.insert(
                 '',
                 'end',
                 values=(
@@ -1493,7 +1749,7 @@ class InventoryApp:
                     f"{price:,.0f}",
                     f"{subtotal:,.0f}"
                 )
-            )
+            )] = barcode
         
         product_tree.pack(side='left', fill='both', expand=True)
         scroll_y.pack(side='right', fill='y')
@@ -1509,7 +1765,7 @@ class InventoryApp:
                 return
             
             values_item = product_tree.item(selected_item[0])['values']
-            barcode = values_item[0]
+            barcode = row_barcodes[selected_item[0]]
             name = values_item[1]
             current_qty = int(values_item[2])
             
@@ -1584,7 +1840,7 @@ class InventoryApp:
             new_items = []
             for item_id in product_tree.get_children():
                 values_item = product_tree.item(item_id)['values']
-                barcode = values_item[0]
+                barcode = row_barcodes[item_id]
                 qty = int(values_item[2])
                 if qty > 0:
                     new_items.append({
@@ -1602,96 +1858,38 @@ class InventoryApp:
             ):
                 return
             
-            try:
-                conn = self.manager.get_connection()
-                cursor = conn.cursor()
-                
-                # 1. Hoan tra hang cu ve kho
-                old_items = self.manager.get_order_details(order_id)
-                for item in old_items:
-                    old_barcode = item[0]
-                    old_qty = item[2]
-                    self.manager.import_stock(
-                        old_barcode,
-                        old_qty,
-                        f"Hoan tra tu don sua {code}",
-                        'admin'
-                    )
-                
-                # 2. Cap nhat thong tin don hang
-                cursor.execute("""
-                    UPDATE orders 
-                    SET customer_name = ?, customer_phone = ?
-                    WHERE order_id = ?
-                """, (new_customer, new_phone, order_id))
-                
-                # 3. Xoa san pham cu
-                cursor.execute("DELETE FROM order_items WHERE order_id = ?", (order_id,))
-                
-                # 4. Them san pham moi va tinh lai
-                total = 0
-                total_profit = 0
-                
-                for item in new_items:
-                    barcode = item['barcode']
-                    qty = item['quantity']
-                    
-                    # Lay thong tin san pham
-                    cursor.execute("""
-                        SELECT name, price, cost_price 
-                        FROM products 
-                        WHERE barcode = ?
-                    """, (barcode,))
-                    
-                    product = cursor.fetchone()
-                    if not product:
-                        continue
-                    
-                    name, price, cost = product
-                    price = float(price)
-                    cost = float(cost)
-                    
-                    subtotal = price * qty
-                    profit = (price - cost) * qty
-                    
-                    total += subtotal
-                    total_profit += profit
-                    
-                    # Them vao order_items
-                    cursor.execute("""
-                        INSERT INTO order_items 
-                        (order_id, barcode, name, quantity, price, cost_price, subtotal, profit)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (order_id, barcode, name, qty, price, cost, subtotal, profit))
-                    
-                    # Xuat kho
-                    self.manager.export_stock(
-                        barcode,
-                        qty,
-                        f"Xuat lai tu don sua {code}",
-                        'admin'
-                    )
-                
-                # 5. Cap nhat tong tien
-                cursor.execute("""
-                    UPDATE orders 
-                    SET total = ?, final = ?, profit = ?
-                    WHERE order_id = ?
-                """, (total, total, total_profit, order_id))
-                
-                conn.commit()
-                conn.close()
-                
-                messagebox.showinfo("Thanh cong", f"Da cap nhat don hang {code}")
-                dialog.destroy()
-                self.refresh_orders()
-                self.refresh_reports()
-                self.refresh_products_list()
-                
-            except Exception as e:
-                messagebox.showerror("Loi", f"Loi khi sua don: {e}")
-                import traceback
-                traceback.print_exc()
+            submit(new_items, new_customer, new_phone, allow_oversell=False)
+        
+        def submit(new_items, new_customer, new_phone, allow_oversell):
+            # Hoan tra hang cu + ghi dong moi + tinh lai tong tien: 1 transaction tren luong ghi
+            def retry():
+                submit(new_items, new_customer, new_phone, allow_oversell=True)
+            
+            self.async_db.replace_order_items(
+                order_id, new_items, new_customer, new_phone, user='admin',
+                allow_oversell=allow_oversell,
+                callback=lambda result: saved(result, allow_oversell, retry),
+                errback=lambda e: messagebox.showerror("Loi", f"Loi khi sua don: {e}"))
+        
+        def saved(result, allow_oversell, retry):
+            success, msg, order_data = result
+            if not success:
+                if order_data and not allow_oversell:
+                    shortages = "\n".join(f"- {name}: con {stock}, can {need}"
+                                           for _, name, stock, need in order_data['shortages'])
+                    if messagebox.askyesno("KHONG DU HANG",
+                                           f"Ton kho khong du:\n{shortages}\n\n"
+                                           f"Van luu (ton kho se am)?"):
+                        retry()
+                    return
+                messagebox.showerror("Loi", f"Loi khi sua don: {msg}")
+                return
+            
+            messagebox.showinfo("Thanh cong", f"Da cap nhat don hang {code}")
+            dialog.destroy()
+            self.refresh_orders()
+            self.refresh_reports()
+            self.refresh_products_list()
         
         tk.Button(
             action_frame,
@@ -1738,32 +1936,19 @@ class InventoryApp:
         ):
             return
         
-        # Lay chi tiet don hang
-        items = self.manager.get_order_details(order_id)
-        
-        # Hoan tra san pham
-        for item in items:
-            barcode = item[0]
-            quantity = item[2]
-            self.manager.import_stock(
-                barcode,
-                quantity,
-                f"Hoan tra tu don xoa {code}",
-                'admin'
-            )
-        
-        # Xoa don hang
-        conn = self.manager.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM order_items WHERE order_id = ?", (order_id,))
-        cursor.execute("DELETE FROM orders WHERE order_id = ?", (order_id,))
-        conn.commit()
-        conn.close()
+        def done(result):
+            success, msg = result
+            if not success:
+                messagebox.showerror("Loi", f"Loi xoa don: {msg}")
+                return
+            messagebox.showinfo("Thanh cong", f"Da xoa don hang {code}")
+            self.refresh_orders()
+            self.refresh_reports()
+            self.refresh_products_list()
         
-        messagebox.showinfo("Thanh cong", f"Da xoa don hang {code}")
-        self.refresh_orders()
-        self.refresh_reports()
-        self.refresh_products_list()
+        self.update_status(f"Dang xoa don hang {code}...")
+        self.async_db.delete_order(order_id, user='admin', callback=done,
+                                   errback=lambda e: messagebox.showerror("Loi", f"Loi xoa don: {e}"))
 
 
     def create_inventory_tab_new(self):
@@ -1913,6 +2098,98 @@ class InventoryApp:
             cursor='hand2'
         ).pack(fill='x', padx=10, pady=10)
 
+        # PHIA DUOI: PHIEU NHAP NHIEU MA (nhan hang ca pallet)
+        batch = tk.LabelFrame(
+            main,
+            text="PHIEU NHAP (QUET NHIEU MA, NHAP 1 LAN)",
+            font=('Arial', 12, 'bold'),
+            bg='white',
+            fg='#28a745'
+        )
+        batch.pack(fill='x', padx=5, pady=(0, 5))
+
+        batch_input = tk.Frame(batch, bg='white')
+        batch_input.pack(fill='x', padx=10, pady=5)
+
+        tk.Label(batch_input, text="Ma vach / ten:", bg='white', font=('Arial', 10, 'bold')).pack(side='left')
+        self.receiving_entry = tk.Entry(batch_input, font=('Arial', 12), width=30)
+        self.receiving_entry.pack(side='left', padx=5)
+        self.receiving_entry.bind('<Return>', lambda e: self.add_receiving_from_entry())
+
+        tk.Label(batch_input, text="SL:", bg='white', font=('Arial', 10, 'bold')).pack(side='left')
+        self.receiving_qty = tk.Entry(batch_input, font=('Arial', 12), width=6)
+        self.receiving_qty.insert(0, "1")
+        self.receiving_qty.pack(side='left', padx=5)
+        self.receiving_qty.bind('<Return>', lambda e: self.add_receiving_from_entry())
+
+        tk.Button(batch_input, text="Them", command=self.add_receiving_from_entry,
+                  bg='#17a2b8', fg='white', font=('Arial', 10, 'bold')).pack(side='left', padx=5)
+        tk.Button(batch_input, text="Xoa dong", command=self.remove_receiving_line,
+                  bg='#6c757d', fg='white', font=('Arial', 10)).pack(side='left', padx=5)
+        tk.Button(batch_input, text="Xoa het", command=self.clear_receiving,
+                  bg='#6c757d', fg='white', font=('Arial', 10)).pack(side='left', padx=5)
+
+        self.receiving_summary = tk.Label(batch_input, text="0 ma, 0 san pham", bg='white',
+                                          font=('Arial', 10, 'bold'), fg='#28a745')
+        self.receiving_summary.pack(side='left', padx=15)
+
+        tk.Button(batch_input, text="NHAP TAT CA", command=self.commit_receiving,
+                  bg='#28a745', fg='white', font=('Arial', 11, 'bold'), cursor='hand2').pack(side='right')
+
+        # Che do quet camera khi dang o tab nay
+        scan_row = tk.Frame(batch, bg='white')
+        scan_row.pack(fill='x', padx=10, pady=(0, 5))
+
+        tk.Label(scan_row, text="Camera:", bg='white', font=('Arial', 10, 'bold')).pack(side='left')
+        self.inventory_scan_mode = tk.StringVar(value='import')
+        for value, text in (('import', 'Vao phieu nhap'), ('export', 'Xuat kho ngay'),
+                            ('stocktake', 'Kiem kho')):
+            tk.Radiobutton(scan_row, text=text, value=value, variable=self.inventory_scan_mode,
+                           command=self.on_inventory_scan_mode_changed, bg='white',
+                           font=('Arial', 10)).pack(side='left', padx=5)
+
+        self.camera_scan_summary = tk.Label(scan_row, text="", bg='white', font=('Arial', 10), fg='#6c757d')
+        self.camera_scan_summary.pack(side='left', padx=15)
+
+        tk.Button(scan_row, text="Dong kiem kho", command=self.close_stocktake,
+                  bg='#dc3545', fg='white', font=('Arial', 10, 'bold')).pack(side='right', padx=5)
+        tk.Button(scan_row, text="Chenh lech", command=self.show_stocktake_variance,
+                  bg='#6c757d', fg='white', font=('Arial', 10)).pack(side='right', padx=5)
+        tk.Button(scan_row, text="Mo kiem kho", command=self.start_stocktake,
+                  bg='#17a2b8', fg='white', font=('Arial', 10, 'bold')).pack(side='right', padx=5)
+
+        # Phien kiem kho dang mo (so dem nam o manager / may chu, dung chung moi quay)
+        self.stocktake_session = None
+        self.async_db.get_open_stocktake(callback=self.on_stocktake_loaded)
+
+        grid_frame = tk.Frame(batch, bg='white')
+        grid_frame.pack(fill='x', padx=10, pady=(0, 10))
+
+        if self.camera_available:
+            self.inventory_camera_canvas = tk.Canvas(grid_frame, bg='#34495e', width=220, height=140,
+                                                     highlightthickness=0)
+            self.inventory_camera_canvas.pack(side='left', padx=(0, 10))
+
+        self.receiving_tree = ttk.Treeview(grid_frame, columns=('barcode', 'name', 'qty'),
+                                           show='headings', height=6)
+        for column, title, width in (('barcode', 'Ma vach', 160), ('name', 'Ten san pham', 400),
+                                     ('qty', 'So luong', 90)):
+            self.receiving_tree.heading(column, text=title)
+            self.receiving_tree.column(column, width=width)
+        self.receiving_tree.pack(side='left', fill='x', expand=True)
+        self.receiving_tree.bind('<Double-1>', lambda e: self.edit_receiving_quantity())
+
+        receiving_scroll = ttk.Scrollbar(grid_frame, orient='vertical', command=self.receiving_tree.yview)
+        receiving_scroll.pack(side='right', fill='y')
+        self.receiving_tree.configure(yscrollcommand=receiving_scroll.set)
+
+        # barcode -> [ten, so luong], giu thu tu quet
+        self.receiving_lines = {}
+        self.receiving_draft_job = None
+        # So luong dang nhap kho (import_stock_batch chua xong): ban tam khong luu lai phan nay
+        self.receiving_committing = Counter()
+        self.async_db.load_receiving_draft(callback=self.restore_receiving_draft)
+
         self.selected_import_barcode = None
         self.selected_export_barcode = None
 
@@ -1925,20 +2202,18 @@ class InventoryApp:
             keyword = self.export_search_entry.get().strip().lower()
             listbox = self.export_search_listbox
 
-        listbox.delete(0, tk.END)
         if len(keyword) < 1:
+            listbox.delete(0, tk.END)
             return
 
-        products = self.manager.get_all_products()
-        matching = []
-        for p in products:
-            product_id, barcode, name, category, quantity, min_stock, price, cost_price, last_updated = p
-            if keyword in barcode.lower() or keyword in name.lower():
-                matching.append((barcode, name, quantity, price))
+        def show(products):
+            listbox.delete(0, tk.END)
+            for p in products:
+                product_id, barcode, name, category, qty, min_stock, price, cost_price, last_updated = p
+                display_text = f"{barcode} - {name} (Ton: {qty}, Gia: {price:,.0f})"
+                listbox.insert(tk.END, display_text)
 
-        for barcode, name, qty, price in matching[:10]:
-            display_text = f"{barcode} - {name} (Ton: {qty}, Gia: {price:,.0f})"
-            listbox.insert(tk.END, display_text)
+        self.async_db.search_products(keyword, limit=10, key=f'search_{mode}', callback=show)
 
     def on_select_product(self, mode):
         """Chon san pham"""
@@ -1961,8 +2236,12 @@ class InventoryApp:
         else:
             self.selected_export_barcode = barcode
 
-        product = self.manager.get_product_by_barcode(barcode)
+        self.async_db.get_product_by_barcode(
+            barcode, key=f'select_{mode}',
+            callback=lambda product: self.show_selected_product(info_widget, product))
 
+    def show_selected_product(self, info_widget, product):
+        """Thong tin san pham vua chon (get_product_by_barcode tu luong doc)"""
         if product:
             info_widget.config(state='normal')
             info_widget.delete(1.0, tk.END)
@@ -2005,7 +2284,12 @@ class InventoryApp:
             messagebox.showwarning("Canh bao", "So luong phai lon hon 0!")
             return
 
-        success, msg = self.manager.import_stock(self.selected_import_barcode, qty, note, 'admin')
+        self.async_db.import_stock(self.selected_import_barcode, qty, note, 'admin',
+                                   callback=lambda result: self.on_import_done(result, qty))
+
+    def on_import_done(self, result, qty):
+        """Ket qua import_stock tu luong ghi"""
+        success, msg = result
         if success:
             messagebox.showinfo("Thanh cong", f"Da nhap {qty} san pham")
             self.import_search_entry.delete(0, tk.END)
@@ -2036,7 +2320,12 @@ class InventoryApp:
             messagebox.showwarning("Canh bao", "So luong phai lon hon 0!")
             return
 
-        success, msg = self.manager.export_stock(self.selected_export_barcode, qty, note, 'admin')
+        self.async_db.export_stock(self.selected_export_barcode, qty, note, 'admin',
+                                   callback=lambda result: self.on_export_done(result, qty))
+
+    def on_export_done(self, result, qty):
+        """Ket qua export_stock tu luong ghi"""
+        success, msg = result
         if success:
             messagebox.showinfo("Thanh cong", f"Da xuat {qty} san pham")
             self.export_search_entry.delete(0, tk.END)
@@ -2051,6 +2340,311 @@ class InventoryApp:
         else:
             messagebox.showerror("Loi", msg)
 
+    # PHIEU NHAP NHIEU MA
+
+    def add_receiving_from_entry(self):
+        """Them dong tu o nhap ma (ma vach hoac ten -> san pham gan nhat)"""
+        text = self.receiving_entry.get().strip()
+        if not text:
+            return
+        try:
+            qty = int(self.receiving_qty.get() or 1)
+        except ValueError:
+            messagebox.showerror("Loi", "So luong khong hop le!")
+            return
+        self.add_receiving_line(text, qty, done=self.on_receiving_entry_added)
+        self.receiving_entry.focus_set()
+
+    def on_receiving_entry_added(self, added):
+        """Dong tu o nhap ma da vao phieu: xoa o nhap"""
+        if added:
+            self.receiving_entry.delete(0, tk.END)
+            self.receiving_qty.delete(0, tk.END)
+            self.receiving_qty.insert(0, "1")
+
+    def add_receiving_line(self, barcode, qty=1, quiet=False, done=None):
+        """
+        Cong `qty` cho ma vao phieu nhap (chua ghi kho), ma chua co trong cache tra o luong doc
+        quiet: chi bao o thanh trang thai (quet camera lien tuc, khong bat hop thoai)
+        done(True/False): goi khi da them / khong tim thay
+        """
+        if qty <= 0:
+            messagebox.showwarning("Canh bao", "So luong phai lon hon 0!")
+            return
+
+        result = self.manager.cached_product_status(barcode)
+        if result is not None and result['exists']:
+            self.on_receiving_product(barcode, qty, quiet, done, result)
+            return
+        self.async_db.check_product_status(
+            barcode, callback=lambda result: self.on_receiving_product(barcode, qty, quiet, done, result),
+            errback=lambda e: self.update_status(f"Loi tra ma {barcode}: {e}"))
+
+    def on_receiving_product(self, barcode, qty, quiet, done, result, by_name=False):
+        """Ket qua check_product_status cua 1 dong phieu nhap; ma khong co thi tim theo ten"""
+        if not result['exists']:
+            # Ma quet tu camera la ma vach that, khong doan theo ten
+            if quiet or by_name:
+                self.on_receiving_matches(barcode, qty, quiet, done, [])
+            else:
+                self.async_db.lookup_products(
+                    barcode, 1, callback=lambda matches: self.on_receiving_matches(barcode, qty, quiet, done, matches))
+            return
+
+        self.put_receiving_line(barcode, result['data']['name'], qty)
+        if done:
+            done(True)
+
+    def on_receiving_matches(self, text, qty, quiet, done, matches):
+        """Ket qua lookup_products: lay san pham gan nhat theo ten"""
+        if not matches:
+            self.update_status(f"Khong tim thay san pham '{text}' - them san pham truoc")
+            if not quiet:
+                messagebox.showwarning("Canh bao", f"Khong tim thay san pham '{text}'!")
+            if done:
+                done(False)
+            return
+        barcode = matches[0][1]
+        self.async_db.check_product_status(
+            barcode, callback=lambda result: self.on_receiving_product(barcode, qty, quiet, done, result,
+                                                                       by_name=True))
+
+    def put_receiving_line(self, barcode, name, qty):
+        """Cong `qty` vao dong cua ma trong phieu nhap"""
+        line = self.receiving_lines.get(barcode)
+        if line:
+            line[1] += qty
+            self.receiving_tree.item(barcode, values=(barcode, name, line[1]))
+        else:
+            self.receiving_lines[barcode] = [name, qty]
+            self.receiving_tree.insert('', tk.END, iid=barcode, values=(barcode, name, qty))
+        self.receiving_tree.see(barcode)
+        self.receiving_tree.selection_set(barcode)
+
+        self.update_status(f"Phieu nhap: +{qty} {name}")
+        self.on_receiving_changed()
+
+    def edit_receiving_quantity(self):
+        """Sua so luong dong dang chon (0 = xoa dong)"""
+        selected = self.receiving_tree.selection()
+        if not selected:
+            return
+        barcode = selected[0]
+        name, qty = self.receiving_lines[barcode]
+        new_qty = simpledialog.askinteger("So luong", f"{name}:", initialvalue=qty, minvalue=0)
+        if new_qty is None:
+            return
+        if new_qty == 0:
+            self.remove_receiving_line()
+            return
+        self.receiving_lines[barcode][1] = new_qty
+        self.receiving_tree.item(barcode, values=(barcode, name, new_qty))
+        self.on_receiving_changed()
+
+    def remove_receiving_line(self):
+        """Xoa cac dong dang chon khoi phieu nhap"""
+        for barcode in self.receiving_tree.selection():
+            self.receiving_lines.pop(barcode, None)
+            self.receiving_tree.delete(barcode)
+        self.on_receiving_changed()
+
+    def clear_receiving(self):
+        """Bo ca phieu nhap dang soan"""
+        if self.receiving_lines and not messagebox.askyesno(
+                "Xac nhan", f"Xoa {len(self.receiving_lines)} dong cua phieu nhap?"):
+            return
+        self.receiving_lines.clear()
+        self.receiving_tree.delete(*self.receiving_tree.get_children())
+        self.on_receiving_changed()
+
+    def on_receiving_changed(self):
+        """Cap nhat tong + hen luu phieu nhap tam (gom nhieu lan quet thanh 1 lan ghi)"""
+        total = sum(qty for _, qty in self.receiving_lines.values())
+        self.receiving_summary.config(text=f"{len(self.receiving_lines)} ma, {total} san pham")
+        if self.receiving_draft_job:
+            self.root.after_cancel(self.receiving_draft_job)
+        self.receiving_draft_job = self.root.after(500, self.save_receiving_draft)
+
+    def save_receiving_draft(self):
+        """Ghi phieu nhap tam vao database (khoi phuc lai khi mo ung dung)"""
+        self.receiving_draft_job = None
+        # Ban tam ghi sau lenh nhap kho (hang doi ghi FIFO) chi giu phan chua nhap
+        lines = [(barcode, name, qty - self.receiving_committing[barcode])
+                 for barcode, (name, qty) in self.receiving_lines.items()
+                 if qty > self.receiving_committing[barcode]]
+        self.async_db.save_receiving_draft(
+            lines, errback=lambda e: self.update_status(f"Loi luu phieu nhap tam: {e}"))
+
+    def restore_receiving_draft(self, lines):
+        """Nap lai phieu nhap chua nhap cua lan chay truoc"""
+        for barcode, name, qty in lines:
+            self.receiving_lines[barcode] = [name, qty]
+            self.receiving_tree.insert('', tk.END, iid=barcode, values=(barcode, name, qty))
+        if lines:
+            total = sum(qty for _, _, qty in lines)
+            self.receiving_summary.config(text=f"{len(lines)} ma, {total} san pham")
+            self.update_status(f"Da khoi phuc phieu nhap chua luu ({len(lines)} dong)")
+
+    def commit_receiving(self):
+        """Nhap kho ca phieu nhap: 1 transaction, 1 lan lam moi danh sach"""
+        if not self.receiving_lines:
+            messagebox.showwarning("Canh bao", "Phieu nhap trong!")
+            return
+        total = sum(qty for _, qty in self.receiving_lines.values())
+        if not messagebox.askyesno(
+                "Xac nhan nhap kho",
+                f"Nhap {total} san pham ({len(self.receiving_lines)} ma) vao kho?"):
+            return
+
+        # Ban tam dang cho ghi khong con can: import_stock_batch xoa phieu tam cung transaction
+        if self.receiving_draft_job:
+            self.root.after_cancel(self.receiving_draft_job)
+            self.receiving_draft_job = None
+        lines = [(barcode, qty) for barcode, (_, qty) in self.receiving_lines.items()]
+        self.receiving_committing.update(dict(lines))
+        self.update_status(f"Dang nhap kho {len(lines)} ma...")
+        self.async_db.import_stock_batch(
+            lines, "Phieu nhap", 'admin',
+            callback=lambda result: self.on_receiving_committed(result, lines),
+            errback=lambda e: self.on_receiving_commit_failed(e, lines))
+
+    def on_receiving_commit_failed(self, error, lines):
+        """import_stock_batch loi: phieu nhap van con, luu lai ban tam day du"""
+        self.receiving_committing -= Counter(dict(lines))
+        messagebox.showerror("Loi", f"Loi nhap kho: {error}")
+        self.on_receiving_changed()
+
+    def on_receiving_committed(self, result, lines):
+        """Ket qua import_stock_batch tu luong ghi"""
+        self.receiving_committing -= Counter(dict(lines))
+        success, msg, bad_barcodes = result
+        if not success:
+            if bad_barcodes:
+                self.receiving_tree.selection_set([b for b in bad_barcodes if b in self.receiving_lines])
+            messagebox.showerror("Loi", msg)
+            # Phieu nhap van con, luu lai ban tam
+            self.on_receiving_changed()
+            return
+
+        # Chi bot phan da nhap: dong quet them trong luc dang ghi van giu lai
+        for barcode, qty in lines:
+            line = self.receiving_lines.get(barcode)
+            if line is None:
+                continue
+            line[1] -= qty
+            if line[1] <= 0:
+                del self.receiving_lines[barcode]
+                self.receiving_tree.delete(barcode)
+            else:
+                self.receiving_tree.item(barcode, values=(barcode, line[0], line[1]))
+        self.on_receiving_changed()
+        messagebox.showinfo("Thanh cong", msg)
+        self.update_status(msg)
+        self.refresh_products_list()
+
+    # KIEM KHO
+
+    def on_stocktake_loaded(self, session):
+        """Phien kiem kho dang mo (vd quay khac da mo, hoac truoc khi tat ung dung)"""
+        self.stocktake_session = session
+        if session:
+            self.on_stocktake_counted((True, '', {'skus': session['counted_skus'],
+                                                  'units': session['counted_units']}))
+
+    def start_stocktake(self):
+        """Mo phien kiem kho: chup ton kho hien tai, camera chuyen sang che do kiem kho"""
+        if self.stocktake_session:
+            messagebox.showinfo("Kiem kho", f"Phien kiem kho #{self.stocktake_session['session_id']} dang mo")
+            return
+        name = simpledialog.askstring("Kiem kho", "Ten phien kiem kho:",
+                                      initialvalue=f"Kiem kho {datetime.now():%d/%m/%Y}")
+        if name is None:
+            return
+        self.async_db.start_stocktake(name, 'admin', callback=self.on_stocktake_started)
+
+    def on_stocktake_started(self, result):
+        success, msg, _ = result
+        if not success:
+            messagebox.showwarning("Kiem kho", msg)
+        self.update_status(msg)
+        self.async_db.get_open_stocktake(callback=self.on_stocktake_loaded)
+        self.inventory_scan_mode.set('stocktake')
+        self.on_inventory_scan_mode_changed()
+
+    def on_stocktake_counted(self, result):
+        """Tong so dem cua ca phien sau moi dot quet"""
+        success, msg, totals = result
+        if not success:
+            # Phien da duoc dong / huy o quay khac
+            self.stocktake_session = None
+            self.update_status(msg)
+            return
+        if not self.stocktake_session:
+            return
+        self.camera_scan_summary.config(
+            text=f"Kiem kho #{self.stocktake_session['session_id']}: {totals['skus']} ma,"
+                 f" {totals['units']} san pham")
+
+    def show_stocktake_variance(self, zero_missing=False):
+        """Xem truoc chenh lech so dem / ton kho luc mo phien"""
+        if not self.stocktake_session:
+            messagebox.showwarning("Kiem kho", "Chua mo phien kiem kho!")
+            return
+        self.async_db.get_stocktake_variance(
+            self.stocktake_session['session_id'], zero_missing,
+            callback=lambda result: self.show_variance_window(*result))
+
+    def show_variance_window(self, variances, unknown, title="Chenh lech kiem kho"):
+        """Bang chenh lech, lech nhieu nhat len dau"""
+        window = tk.Toplevel(self.root)
+        window.title(title)
+        window.geometry("800x500")
+
+        net = sum(v[4] for v in variances)
+        text = f"{len(variances)} ma lech, tong {net:+d} san pham"
+        if unknown:
+            text += f" - {len(unknown)} ma khong co trong kho: {', '.join(unknown[:5])}"
+        tk.Label(window, text=text, font=('Arial', 11, 'bold')).pack(anchor='w', padx=10, pady=5)
+
+        tree = ttk.Treeview(window, columns=('barcode', 'name', 'expected', 'counted', 'diff'),
+                            show='headings')
+        for column, title_text, width in (('barcode', 'Ma vach', 140), ('name', 'Ten san pham', 300),
+                                          ('expected', 'So sach', 90), ('counted', 'Dem duoc', 90),
+                                          ('diff', 'Chenh lech', 90)):
+            tree.heading(column, text=title_text)
+            tree.column(column, width=width)
+        tree.pack(fill='both', expand=True, padx=10, pady=(0, 10))
+        # Kiem ca kho co the lech hang nghin ma: chi hien 1000 ma lech nhieu nhat
+        for row in sorted(variances, key=lambda v: -abs(v[4]))[:1000]:
+            tree.insert('', tk.END, values=row)
+
+    def close_stocktake(self):
+        """Dong phien: dieu chinh ton kho theo so dem (1 transaction, lich su ADJUST)"""
+        if not self.stocktake_session:
+            messagebox.showwarning("Kiem kho", "Chua mo phien kiem kho!")
+            return
+        zero_missing = messagebox.askyesnocancel(
+            "Dong kiem kho",
+            "Kiem toan bo kho?\n\nCo: ma chua dem coi nhu het hang\n"
+            "Khong: chi dieu chinh cac ma da dem")
+        if zero_missing is None:
+            return
+        self.async_db.close_stocktake(
+            self.stocktake_session['session_id'], zero_missing, '', 'admin',
+            callback=self.on_stocktake_closed,
+            errback=lambda e: messagebox.showerror("Loi", f"Loi dong kiem kho: {e}"))
+
+    def on_stocktake_closed(self, result):
+        success, msg, report = result
+        if not success:
+            messagebox.showerror("Loi", msg)
+            return
+        self.stocktake_session = None
+        self.camera_scan_summary.config(text=msg)
+        self.update_status(msg)
+        self.show_variance_window(report['variances'], report['unknown'], title=msg)
+        self.refresh_products_list()
+
     # ================== TAB SAN PHAM ==================
 
     def create_products_tab(self):
@@ -2073,6 +2667,7 @@ class InventoryApp:
         ttk.Button(btn_container, text="Them", command=self.show_add_product_dialog).pack(side='left', padx=2)
         ttk.Button(btn_container, text="Sua", command=self.show_edit_product_dialog).pack(side='left', padx=2)
         ttk.Button(btn_container, text="Xoa", command=self.delete_selected_product).pack(side='left', padx=2)
+        ttk.Button(btn_container, text="Nhap file", command=self.import_products_file).pack(side='left', padx=2)
         ttk.Button(btn_container, text="Lam moi", command=self.refresh_products_list).pack(side='left', padx=2)
 
         search_frame = tk.Frame(self.tab_products, bg='white')
@@ -2126,10 +2721,13 @@ class InventoryApp:
 
     def refresh_products_list(self):
         """Refresh danh sach san pham"""
+        self.async_db.get_all_products(key='products', callback=self.show_products)
+
+    def show_products(self, products):
+        """Ve lai bang san pham"""
         for item in self.products_tree.get_children():
             self.products_tree.delete(item)
 
-        products = self.manager.get_all_products()
         for product in products:
             pid, barcode, name, category, quantity, min_stock, price, cost_price, last_updated = product
             self.products_tree.insert(
@@ -2149,32 +2747,12 @@ class InventoryApp:
 
     def search_products(self):
         """Tim kiem san pham theo tu khoa"""
-        keyword = self.search_entry.get().strip().lower()
-        for item in self.products_tree.get_children():
-            self.products_tree.delete(item)
+        keyword = self.search_entry.get().strip()
+        if not keyword:
+            self.refresh_products_list()
+            return
 
-        products = self.manager.get_all_products()
-        for product in products:
-            pid, barcode, name, category, quantity, min_stock, price, cost_price, last_updated = product
-            if (
-                keyword in barcode.lower()
-                or keyword in (name or '').lower()
-                or keyword in (category or '').lower()
-            ):
-                self.products_tree.insert(
-                    '',
-                    'end',
-                    values=(
-                        pid,
-                        barcode,
-                        name,
-                        category,
-                        quantity,
-                        min_stock,
-                        f"{price:,.0f}",
-                        last_updated
-                    )
-                )
+        self.async_db.search_products(keyword, limit=500, key='products', callback=self.show_products)
 
     def show_add_product_dialog(self):
         """Dialog them san pham"""
@@ -2226,7 +2804,7 @@ class InventoryApp:
                     messagebox.showwarning("Canh bao", "Ma va ten khong duoc trong!")
                     return
 
-                success, msg = self.manager.add_product(
+                self.async_db.add_product(
                     barcode,
                     name,
                     category,
@@ -2234,14 +2812,10 @@ class InventoryApp:
                     minstock,
                     price,
                     costprice,
-                    supplier
+                    supplier,
+                    callback=lambda result: self.on_product_saved(result, dialog),
+                    errback=lambda e: messagebox.showerror("Loi", f"Loi them san pham: {e}")
                 )
-                if success:
-                    messagebox.showinfo("OK", msg)
-                    dialog.destroy()
-                    self.refresh_products_list()
-                else:
-                    messagebox.showerror("Loi", msg)
             except ValueError as e:
                 messagebox.showerror("Loi", f"Du lieu sai! {e}")
 
@@ -2250,6 +2824,17 @@ class InventoryApp:
         ttk.Button(btnframe, text="Luu", command=save, width=15).pack(side='left', padx=5)
         ttk.Button(btnframe, text="Huy", command=dialog.destroy, width=15).pack(side='left', padx=5)
 
+    def on_product_saved(self, result, dialog):
+        """Ket qua add_product / update_product tu luong ghi"""
+        success, msg = result
+        if success:
+            messagebox.showinfo("OK", msg)
+            if dialog.winfo_exists():
+                dialog.destroy()
+            self.refresh_products_list()
+        else:
+            messagebox.showerror("Loi", msg)
+
     def show_edit_product_dialog(self):
         """Dialog sua san pham"""
         selected = self.products_tree.selection()
@@ -2258,8 +2843,10 @@ class InventoryApp:
             return
 
         values = self.products_tree.item(selected[0])['values']
-        product_id = values[0]
-        product = self.manager.get_product_by_id(product_id)
+        self.async_db.get_product_by_id(values[0], key='edit_product', callback=self.open_edit_product_dialog)
+
+    def open_edit_product_dialog(self, product):
+        """Form sua san pham (get_product_by_id tu luong doc)"""
         if not product:
             messagebox.showerror("Loi", "Khong tim thay!")
             return
@@ -2315,7 +2902,7 @@ class InventoryApp:
                     messagebox.showwarning("Canh bao", "Ten khong duoc trong!")
                     return
 
-                success, msg = self.manager.update_product(
+                self.async_db.update_product(
                     barcode,
                     name,
                     category,
@@ -2323,14 +2910,10 @@ class InventoryApp:
                     minstock,
                     price,
                     costprice,
-                    supplier
+                    supplier,
+                    callback=lambda result: self.on_product_saved(result, dialog),
+                    errback=lambda e: messagebox.showerror("Loi", f"Loi sua san pham: {e}")
                 )
-                if success:
-                    messagebox.showinfo("OK", msg)
-                    dialog.destroy()
-                    self.refresh_products_list()
-                else:
-                    messagebox.showerror("Loi", msg)
             except ValueError as e:
                 messagebox.showerror("Loi", f"Du lieu sai! {e}")
 
@@ -2353,13 +2936,69 @@ class InventoryApp:
         if not messagebox.askyesno("Xac nhan", f"Xoa san pham {name} ({barcode})?"):
             return
 
-        success, msg = self.manager.delete_product(barcode)
+        self.async_db.delete_product(barcode, callback=self.on_product_deleted,
+                                     errback=lambda e: messagebox.showerror("Loi", f"Loi xoa san pham: {e}"))
+
+    def on_product_deleted(self, result):
+        """Ket qua delete_product tu luong ghi"""
+        success, msg = result
         if success:
             messagebox.showinfo("OK", msg)
             self.refresh_products_list()
         else:
             messagebox.showerror("Loi", msg)
 
+    def import_products_file(self, path=None, dry_run=None):
+        """Nhap danh muc san pham hang loat tu file CSV/XLSX"""
+        if path is None:
+            path = filedialog.askopenfilename(
+                title="Chon file danh muc san pham",
+                filetypes=[("CSV / Excel", "*.csv *.xlsx"), ("Tat ca", "*.*")])
+            if not path:
+                return
+        if dry_run is None:
+            dry_run = messagebox.askyesnocancel(
+                "Nhap danh muc", "Chay thu truoc (chi kiem tra file, chua ghi vao kho)?")
+            if dry_run is None:
+                return
+
+        def progress(done, errors):
+            self.root.after(0, self.update_status, f"Dang nhap danh muc: {done} dong, {errors} loi...")
+
+        # Chay tren luong doc: moi lo tu lay khoa ghi, quay ban hang van ghi duoc giua 2 lo
+        self.async_db.run(import_catalog, self.manager, path, dry_run=dry_run,
+                          progress=progress, user='admin',
+                          callback=lambda report: self.on_products_imported(report, path),
+                          errback=lambda e: messagebox.showerror("Loi", f"Loi nhap file: {e}"))
+
+    def on_products_imported(self, report, path):
+        """Bao cao nhap danh muc (luong nen xong)"""
+        errors = report['errors']
+        summary = (f"{'CHAY THU - ' if report['dry_run'] else ''}{report['rows']} dong\n"
+                   f"Them moi: {report['inserted']}\nCap nhat: {report['updated']}\n"
+                   f"Loi: {len(errors)}\n({report['rows_per_sec']:,.0f} dong/giay)")
+        self.update_status(f"Nhap danh muc: them {report['inserted']}, cap nhat {report['updated']},"
+                           f" loi {len(errors)}")
+
+        if errors:
+            preview = "\n".join(f"Dong {line} ({barcode}): {message}"
+                                 for line, barcode, message in errors[:10])
+            if messagebox.askyesno("Nhap danh muc", f"{summary}\n\n{preview}\n\nLuu danh sach loi ra file?"):
+                error_path = filedialog.asksaveasfilename(
+                    title="Luu danh sach loi", defaultextension=".csv",
+                    initialfile="loi_nhap_danh_muc.csv", filetypes=[("CSV", "*.csv")])
+                if error_path:
+                    write_error_report(errors, error_path)
+        else:
+            messagebox.showinfo("Nhap danh muc", summary)
+
+        if report['dry_run']:
+            if report['inserted'] + report['updated'] and messagebox.askyesno(
+                    "Nhap danh muc", "Nhap that cac dong hop le vao kho?"):
+                self.import_products_file(path, dry_run=False)
+        else:
+            self.refresh_products_list()
+
     # ================== TAB DON HANG ==================
 
 
@@ -2413,10 +3052,13 @@ class InventoryApp:
 
     def refresh_alerts(self):
         """Refresh canh bao ton kho thap"""
+        self.async_db.get_low_stock_products(key='alerts', callback=self.show_alerts)
+
+    def show_alerts(self, low):
+        """Ve lai bang canh bao"""
         for item in self.alerts_tree.get_children():
             self.alerts_tree.delete(item)
 
-        low = self.manager.get_low_stock_products()
         for p in low:
             barcode, name, cat, qty, minstock, price, last, created = p
             status = "HET" if qty == 0 else "SAP HET"
@@ -2484,10 +3126,13 @@ class InventoryApp:
 
     def refresh_reports(self):
         """Refresh bao cao thang"""
+        self.async_db.get_monthly_profit(key='reports', callback=self.show_reports)
+
+    def show_reports(self, monthly):
+        """Ve lai bang bao cao thang"""
         for item in self.reports_tree.get_children():
             self.reports_tree.delete(item)
 
-        monthly = self.manager.get_monthly_profit()
         for monthdata in monthly:
             month, profit, revenue, count = monthdata
             if revenue != 0:
@@ -2518,10 +3163,19 @@ class InventoryApp:
         """Dong app"""
         if self.camera_running:
             self.stop_camera_auto()
+        if self.camera_scanner:
+            self.camera_scanner.close()
         try:
             cv2.destroyAllWindows()
         except:
             pass
+        # Ban tam phieu nhap dang hen gio: ghi ngay truoc khi dong
+        if self.receiving_draft_job:
+            self.root.after_cancel(self.receiving_draft_job)
+            self.save_receiving_draft()
+        # Cho lenh ghi dang cho (vd don vua thanh toan) chay xong roi moi dong database
+        self.async_db.close()
+        self.manager.close()
         self.root.destroy()
 
 
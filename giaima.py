@@ -0,0 +1,382 @@
+"""
+Bộ giải mã vạch dùng chung cho scan.py (camera trong ứng dụng) và check.py (cửa sổ thử camera)
+
+Engine mô tả bằng chuỗi: "<bộ giải mã>[:<tiền xử lý>]", nối bằng dấu phẩy = thử lần lượt,
+engine đầu tiên đọc được mã thì dừng
+    bộ giải mã: pyzbar, opencv (cv2.barcode.BarcodeDetector), qrcode (cv2.QRCodeDetector)
+    tiền xử lý: none, clahe, binarize, sharpen
+    vd: "pyzbar,pyzbar:clahe,qrcode" (mặc định), "opencv:sharpen,pyzbar:binarize"
+
+Đo trên ảnh/video có nhãn:
+    python giaima.py thu_muc_anh [--engines "pyzbar|opencv|pyzbar,qrcode"] [--max-frames 300]
+Nhãn: file labels.csv (ten_file,ma) trong thư mục, không có thì lấy số đầu tên file
+(8935005800015.jpg, 8935005800015_nghieng.mp4); tên bắt đầu bằng "none" = không có mã
+"""
+import csv
+import os
+import re
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+from pyzbar.pyzbar import decode as pyzbar_decode
+
+
+BARCODE_TYPES = {
+    'QRCODE': 'Mã QR',
+    'EAN13': 'EAN-13',
+    'EAN8': 'EAN-8',
+    'CODE128': 'Code 128',
+    'CODE39': 'Code 39',
+    'CODE93': 'Code 93',
+    'UPC_A': 'UPC-A',
+    'UPC_E': 'UPC-E',
+}
+
+# Giống thứ tự decode cũ của RealtimeBarcodeScanner
+DEFAULT_ENGINE = "pyzbar,pyzbar:clahe,qrcode"
+
+
+def limit_width(frame, max_width=1280):
+    """Thu nhỏ frame rộng hơn max_width (giữ tỉ lệ)"""
+    height, width = frame.shape[:2]
+    if width <= max_width:
+        return frame
+    return cv2.resize(frame, (max_width, int(height * max_width / width)))
+
+
+# ===== TIỀN XỬ LÝ (giữ nguyên kích thước để tọa độ kết quả khớp frame gốc) =====
+
+def _gray(image):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+
+def _clahe(image):
+    return cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(_gray(image))
+
+
+def _binarize(image):
+    gray = cv2.GaussianBlur(_gray(image), (3, 3), 0)
+    return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+
+
+def _sharpen(image):
+    gray = _gray(image)
+    return cv2.addWeighted(gray, 1.5, cv2.GaussianBlur(gray, (0, 0), 3), -0.5, 0)
+
+
+PREPROCESSORS = {
+    'none': lambda image: image,
+    'clahe': _clahe,
+    'binarize': _binarize,
+    'sharpen': _sharpen,
+}
+
+
+# ===== BỘ GIẢI MÃ =====
+
+class PyzbarDecoder:
+    """pyzbar (zbar): mã vạch 1D + QR"""
+
+    def decode(self, image):
+        return [{
+            'data': obj.data.decode('utf-8'),
+            'type': obj.type,
+            'type_vn': BARCODE_TYPES.get(obj.type, obj.type),
+            'rect': obj.rect,
+            'polygon': obj.polygon,
+            'quality': obj.quality
+        } for obj in pyzbar_decode(image)]
+
+
+class _OpenCVDecoder:
+    """Detector OpenCV không dùng chung giữa các luồng được: mỗi luồng 1 detector"""
+
+    def __init__(self):
+        self.local = threading.local()
+        self.detector()
+
+    def detector(self):
+        detector = getattr(self.local, 'detector', None)
+        if detector is None:
+            detector = self.local.detector = self.create()
+        return detector
+
+
+class OpenCVBarcodeDecoder(_OpenCVDecoder):
+    """cv2.barcode.BarcodeDetector (OpenCV >= 4.8, bản cũ nằm trong opencv-contrib)"""
+
+    def create(self):
+        if hasattr(cv2, 'barcode') and hasattr(cv2.barcode, 'BarcodeDetector'):
+            return cv2.barcode.BarcodeDetector()
+        if hasattr(cv2, 'barcode_BarcodeDetector'):
+            return cv2.barcode_BarcodeDetector()
+        raise RuntimeError("OpenCV này không có BarcodeDetector (cần opencv >= 4.8 hoặc opencv-contrib)")
+
+    def decode(self, image):
+        detector = self.detector()
+        try:
+            if hasattr(detector, 'detectAndDecodeWithType'):
+                ok, infos, types, points = detector.detectAndDecodeWithType(image)
+            else:
+                ok, infos, types, points = detector.detectAndDecode(image)
+        except cv2.error:
+            return []
+        if not ok or points is None:
+            return []
+
+        results = []
+        for data, kind, corners in zip(infos, types, points):
+            if not data:
+                continue
+            # 'EAN_13' -> 'EAN13' như pyzbar; bản cũ trả về số
+            kind = kind.replace('EAN_', 'EAN') if isinstance(kind, str) else 'BARCODE'
+            results.append({'data': data, 'type': kind, 'type_vn': BARCODE_TYPES.get(kind, kind),
+                            'rect': None, 'polygon': np.asarray(corners).reshape(-1, 2).tolist(),
+                            'quality': 100})
+        return results
+
+
+class QRCodeDecoder(_OpenCVDecoder):
+    """cv2.QRCodeDetector"""
+
+    def create(self):
+        return cv2.QRCodeDetector()
+
+    def decode(self, image):
+        try:
+            data, bbox, _ = self.detector().detectAndDecode(image)
+        except cv2.error:
+            return []
+        if not data or bbox is None:
+            return []
+        return [{'data': data, 'type': 'QRCODE', 'type_vn': 'Mã QR', 'rect': None,
+                 'polygon': bbox.reshape(-1, 2).tolist(), 'quality': 100}]
+
+
+DECODERS = {
+    'pyzbar': PyzbarDecoder,
+    'opencv': OpenCVBarcodeDecoder,
+    'qrcode': QRCodeDecoder,
+}
+
+
+# ===== ENGINE =====
+
+class Engine:
+    """1 bộ giải mã + 1 bước tiền xử lý, vd pyzbar:clahe"""
+
+    def __init__(self, decoder, preprocess='none'):
+        if decoder not in DECODERS:
+            raise ValueError(f"Không có bộ giải mã '{decoder}'. Chọn: {', '.join(DECODERS)}")
+        if preprocess not in PREPROCESSORS:
+            raise ValueError(f"Không có tiền xử lý '{preprocess}'. Chọn: {', '.join(PREPROCESSORS)}")
+        self.name = decoder if preprocess == 'none' else f"{decoder}:{preprocess}"
+        self.decoder = DECODERS[decoder]()
+        self.preprocess = PREPROCESSORS[preprocess]
+
+    def decode(self, image):
+        """Ảnh BGR/xám -> danh sách kết quả (tọa độ theo ảnh vào)"""
+        return self.decoder.decode(self.preprocess(image))
+
+
+class ChainEngine:
+    """Thử lần lượt từng engine, dừng ở engine đầu tiên đọc được mã"""
+
+    def __init__(self, engines):
+        self.engines = engines
+        self.name = ','.join(engine.name for engine in engines)
+
+    def decode(self, image):
+        for engine in self.engines:
+            results = engine.decode(image)
+            if results:
+                return results
+        return []
+
+
+def engine_specs(spec):
+    """'pyzbar, pyzbar:clahe' -> ['pyzbar', 'pyzbar:clahe']"""
+    return [part.strip() for part in spec.split(',') if part.strip()]
+
+
+def make_engine(spec=DEFAULT_ENGINE):
+    """Chuỗi mô tả -> Engine / ChainEngine; bộ giải mã không có trên máy -> RuntimeError"""
+    engines = []
+    for part in engine_specs(spec):
+        decoder, _, preprocess = part.partition(':')
+        engines.append(Engine(decoder, preprocess or 'none'))
+    if not engines:
+        raise ValueError("Chưa chọn engine nào")
+    return engines[0] if len(engines) == 1 else ChainEngine(engines)
+
+
+def draw_result(frame, result):
+    """Vẽ khung và thông tin mã lên frame"""
+    try:
+        if result['polygon'] is not None:
+            points = result['polygon']
+
+            if isinstance(points, (list, tuple)):
+                points_array = []
+                for point in points:
+                    if hasattr(point, 'x') and hasattr(point, 'y'):
+                        points_array.append([int(point.x), int(point.y)])
+                    elif isinstance(point, (list, tuple)) and len(point) >= 2:
+                        points_array.append([int(point[0]), int(point[1])])
+
+                if len(points_array) > 0:
+                    points_array = np.array(points_array, dtype=np.int32)
+                    cv2.polylines(frame, [points_array], True, (0, 255, 0), 3)
+
+        if result['rect'] is not None:
+            x = result['rect'].left
+            y = result['rect'].top
+            w = result['rect'].width
+            h = result['rect'].height
+
+            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+
+            text = f"{result['type_vn']}: {result['data']}"
+            (text_w, text_h), baseline = cv2.getTextSize(
+                text, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+
+            bg_y1 = max(0, y - text_h - 10)
+            bg_y2 = max(text_h + 10, y)
+
+            cv2.rectangle(frame, (x, bg_y1), (x + text_w, bg_y2),
+                        (0, 255, 0), -1)
+
+            cv2.putText(frame, text, (x, y - 5),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
+
+    except Exception as e:
+        text = f"{result['type_vn']}: {result['data']}"
+        cv2.putText(frame, text, (10, 100),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+
+    return frame
+
+
+# ===== ĐO ĐỘ CHÍNH XÁC / TỐC ĐỘ =====
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+BENCH_ENGINES = (
+    'pyzbar', 'pyzbar:clahe', 'pyzbar:binarize', 'pyzbar:sharpen',
+    'opencv', 'opencv:clahe', 'opencv:sharpen', 'qrcode',
+    'pyzbar,opencv', DEFAULT_ENGINE,
+)
+
+
+def load_labels(folder):
+    """
+    Tên file -> mã đúng ('' = không có mã)
+    Ưu tiên labels.csv (ten_file,ma), không có thì lấy dãy số đầu tên file
+    """
+    labels = {}
+    path = os.path.join(folder, 'labels.csv')
+    if os.path.exists(path):
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            for row in csv.reader(f):
+                if len(row) >= 2 and row[0] and not row[0].startswith('#'):
+                    labels[row[0].strip()] = row[1].strip()
+
+    for name in sorted(os.listdir(folder)):
+        if name in labels or not name.lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS):
+            continue
+        if name.lower().startswith('none'):
+            labels[name] = ''
+            continue
+        match = re.match(r'\d{6,}', name)
+        if match:
+            labels[name] = match.group()
+    return labels
+
+
+def iter_labelled_frames(folder, max_frames=300):
+    """(ten file, frame, mã đúng) cho mọi ảnh + tối đa max_frames frame mỗi video"""
+    for name, label in load_labels(folder).items():
+        path = os.path.join(folder, name)
+        if name.lower().endswith(VIDEO_EXTENSIONS):
+            cap = cv2.VideoCapture(path)
+            count = 0
+            while count < max_frames:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                count += 1
+                yield name, limit_width(frame), label
+            cap.release()
+        else:
+            frame = cv2.imread(path)
+            if frame is not None:
+                yield name, limit_width(frame), label
+
+
+def evaluate_engines(folder, specs=BENCH_ENGINES, max_frames=300):
+    """
+    Chạy từng engine trên mọi frame có nhãn
+    Trả về {engine: {'frames', 'decoded' (đọc đúng), 'missed', 'false_reads', 'ms_per_frame'}}
+    Engine không có trên máy: {'error': ...}
+    Mỗi engine đọc lại thư mục (chỉ giữ 1 frame trong RAM, video dài vẫn chạy được trên máy yếu),
+    ms_per_frame chỉ tính thời gian decode, không tính đọc file
+    """
+    report = {}
+    for spec in specs:
+        try:
+            engine = make_engine(spec)
+        except RuntimeError as e:
+            report[spec] = {'error': str(e)}
+            continue
+
+        row = {'frames': 0, 'decoded': 0, 'missed': 0, 'false_reads': 0}
+        elapsed = 0.0
+        for _, frame, label in iter_labelled_frames(folder, max_frames):
+            start = time.perf_counter()
+            codes = {result['data'] for result in engine.decode(frame)}
+            elapsed += time.perf_counter() - start
+            row['frames'] += 1
+            if label and label in codes:
+                row['decoded'] += 1
+            elif label:
+                row['missed'] += 1
+            # Mã đọc ra không phải nhãn (đọc sai số / mã lạ trong ảnh không có mã)
+            row['false_reads'] += len(codes - {label})
+        row['ms_per_frame'] = elapsed / row['frames'] * 1000 if row['frames'] else 0.0
+        report[spec] = row
+    return report
+
+
+def print_report(report):
+    print(f"{'engine':<30} {'frame':>6} {'đọc đúng':>9} {'tỉ lệ':>7} {'đọc sai':>8} {'ms/frame':>9}")
+    for spec, row in report.items():
+        if 'error' in row:
+            print(f"{spec:<30} bỏ qua: {row['error']}")
+            continue
+        labelled = row['decoded'] + row['missed']
+        rate = row['decoded'] / labelled * 100 if labelled else 0.0
+        print(f"{spec:<30} {row['frames']:>6} {row['decoded']:>9} {rate:>6.1f}% {row['false_reads']:>8}"
+              f" {row['ms_per_frame']:>9.1f}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    specs = BENCH_ENGINES
+    max_frames = 300
+    if '--engines' in args:
+        i = args.index('--engines')
+        specs = [spec for spec in args[i + 1].split('|') if spec]
+        del args[i:i + 2]
+    if '--max-frames' in args:
+        i = args.index('--max-frames')
+        max_frames = int(args[i + 1])
+        del args[i:i + 2]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+
+    print_report(evaluate_engines(args[0], specs, max_frames))
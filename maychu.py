@@ -0,0 +1,212 @@
+"""
+May chu HTTP/JSON noi bo: nhieu quay POS dung chung 1 inventory.db qua 1 tien trinh
+- chi nghe tren 127.0.0.1, chi dung thu vien chuan
+- lenh ghi gom transaction (BatchWriter), lenh doc chay tren vai luong doc co dinh
+- 1 InventoryManager duy nhat giu cache san pham nong cho moi quay
+
+Chay may chu: python maychu.py [duong_dan_db] [--port 8765]
+Quay dung may chu: KHO_SERVER=http://127.0.0.1:8765 KHO_TERMINAL=Q2 python front.py
+
+Giao thuc: POST /api/<ham> {"args": [...], "kwargs": {...}}
+        -> {"ok": true, "result": ...} hoac {"ok": false, "error": "..."}
+           GET /api/stats -> thong ke cache + gom ghi
+"""
+import functools
+import http.client
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from dulieu import InventoryManager
+from tacvu import WRITE_METHODS, AsyncInventory
+
+
+DEFAULT_PORT = 8765
+# So luong doc co dinh: moi luong 1 ket noi doc, khong mo them ket noi theo tung yeu cau HTTP
+DEFAULT_READERS = 4
+
+# Ham co tham so terminal_id: client tu dien ma quay cua minh
+TERMINAL_METHODS = {'create_order', 'import_stock_batch', 'save_receiving_draft', 'load_receiving_draft'}
+
+# Ham InventoryManager duoc goi qua HTTP (khong co get_connection/close/...)
+API_METHODS = {
+    # tra cuu
+    'check_product_status', 'get_product_by_barcode', 'get_product_by_id',
+    'get_all_products', 'search_products', 'lookup_products', 'get_low_stock_products',
+    # ban hang / xuat nhap
+    'create_order', 'void_order', 'delete_order', 'replace_order_items',
+    'import_stock', 'export_stock', 'update_quantity', 'import_stock_batch', 'export_stock_batch',
+    'save_receiving_draft', 'load_receiving_draft',
+    'add_product', 'quick_add_product', 'update_product', 'delete_product',
+    'existing_barcodes', 'upsert_products',
+    # kiem kho: so dem nam trong tien trinh may chu, moi quay cong vao cung phien
+    'start_stocktake', 'get_open_stocktake', 'add_stocktake_counts', 'set_stocktake_count',
+    'get_stocktake_variance', 'close_stocktake', 'cancel_stocktake',
+    # don hang / bao cao
+    'get_orders', 'get_orders_page', 'search_orders', 'get_order_details',
+    'get_inventory_history', 'get_inventory_history_page',
+    'get_monthly_profit', 'get_sales_rollup', 'warm_caches',
+}
+
+
+class InventoryServer(ThreadingHTTPServer):
+    """May chu giu 1 InventoryManager + AsyncInventory (luong ghi gom lenh)"""
+
+    daemon_threads = True
+
+    def __init__(self, manager, port=DEFAULT_PORT, readers=DEFAULT_READERS):
+        super().__init__(('127.0.0.1', port), RequestHandler)
+        self.manager = manager
+        self.async_db = AsyncInventory(manager, readers=readers)
+
+    def close(self):
+        """Dung nhan yeu cau, ghi het hang doi roi dong database"""
+        self.shutdown()
+        self.server_close()
+        self.async_db.close()
+        self.manager.close()
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """1 yeu cau = 1 lenh InventoryManager (keep-alive HTTP/1.1)"""
+
+    protocol_version = 'HTTP/1.1'
+    # Header va body gui 2 lan: tat Nagle de khong cho delayed ACK (~40 ms / yeu cau)
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.path != '/api/stats':
+            self.send_json(404, {'ok': False, 'error': 'Khong co duong dan nay'})
+            return
+        self.send_json(200, {'ok': True, 'result': {
+            'cache': self.server.manager.product_cache.stats(),
+            'writes': self.server.async_db._writer.stats(),
+        }})
+
+    def do_POST(self):
+        name = self.path[len('/api/'):] if self.path.startswith('/api/') else ''
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self.send_json(400, {'ok': False, 'error': 'JSON khong hop le'})
+            return
+
+        if name not in API_METHODS:
+            self.send_json(404, {'ok': False, 'error': f"Khong co ham '{name}'"})
+            return
+
+        args, kwargs = body.get('args', []), body.get('kwargs', {})
+        try:
+            # Lenh ghi -> luong ghi gom transaction, lenh doc -> vai luong doc co dinh
+            # (luong cua tung yeu cau HTTP khong mo ket noi doc rieng, khong ro ri ket noi)
+            result = self.server.async_db.submit(name, *args, **kwargs).result()
+            self.send_json(200, {'ok': True, 'result': result})
+        except Exception as e:
+            self.send_json(500, {'ok': False, 'error': f"{type(e).__name__}: {e}"})
+
+    def send_json(self, status, payload):
+        # set (vd existing_barcodes) -> list
+        data = json.dumps(payload, ensure_ascii=False, default=list).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Khong in moi yeu cau (hang nghin yeu cau/giay)
+        pass
+
+
+class RemoteInventory:
+    """
+    Client cua may chu: cung ham voi InventoryManager nhung goi qua HTTP
+    Dong tra ve la list thay vi tuple (JSON), cach dung giong nhau
+    """
+
+    def __init__(self, url, terminal_id=None, timeout=30.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or DEFAULT_PORT
+        self.timeout = timeout
+        self.terminal_id = terminal_id or os.environ.get('KHO_TERMINAL', 'Q1')
+        # Moi luong 1 ket noi keep-alive
+        self._local = threading.local()
+
+    def __getattr__(self, name):
+        if name not in API_METHODS:
+            raise AttributeError(name)
+        return functools.partial(self.call, name)
+
+    def cached_product_status(self, barcode):
+        """Client khong giu cache san pham (cache nam o may chu): luon hoi may chu"""
+        return None
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def call(self, name, *args, **kwargs):
+        """Goi 1 ham tren may chu, loi may chu -> RuntimeError"""
+        if name in TERMINAL_METHODS:
+            kwargs.setdefault('terminal_id', self.terminal_id)
+        body = json.dumps({'args': args, 'kwargs': kwargs}, ensure_ascii=False).encode('utf-8')
+
+        # Ket noi keep-alive cu bi dong (may chu khoi dong lai): lenh doc thu lai 1 lan,
+        # lenh ghi khong thu lai vi co the may chu da ghi roi
+        retries = 0 if name in WRITE_METHODS else 1
+        for attempt in range(retries + 1):
+            conn = self._connection()
+            try:
+                conn.request('POST', f'/api/{name}', body, {'Content-Type': 'application/json'})
+                payload = json.loads(conn.getresponse().read())
+                break
+            except (ConnectionError, http.client.HTTPException):
+                conn.close()
+                self._local.conn = None
+                if attempt == retries:
+                    raise
+
+        if not payload['ok']:
+            raise RuntimeError(payload['error'])
+        return payload['result']
+
+    def close(self):
+        """Dong ket noi cua luong hien tai"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def serve(db_name='inventory.db', port=DEFAULT_PORT):
+    """Chay may chu den khi Ctrl+C"""
+    manager = InventoryManager(db_name)
+    server = InventoryServer(manager, port)
+    # Nap san cache san pham + chi muc ten
+    server.async_db.warm_caches()
+    print(f"May chu kho hang: http://127.0.0.1:{port} ({db_name})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.async_db.close()
+        manager.close()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    port = DEFAULT_PORT
+    if '--port' in args:
+        i = args.index('--port')
+        port = int(args[i + 1])
+        del args[i:i + 2]
+    serve(args[0] if args else 'inventory.db', port)
@@ -0,0 +1,229 @@
+"""
+Nguồn hình cho RealtimeBarcodeScanner.start(capture=...): cùng giao diện read()/isOpened()/release()
+như cv2.VideoCapture, để chạy thử / đo scanner không cần camera (máy CI không màn hình)
+
+    camera:      open_source(0)
+    video:       VideoFileSource("quay.mp4")                 mọi frame đều được decode, nhanh nhất có thể
+                 VideoFileSource("quay.mp4", realtime=True)  phát đúng FPS của file như camera thật
+    thư mục ảnh: ImageFolderSource("anh/", fps=None)
+    giả lập:     SyntheticSource(frames=300, noise=6, blur=1.5)  vẽ mã EAN-13 + nhiễu + mờ
+
+Nguồn không giới hạn FPS (fps=None) có `lossless = True`: scanner chờ decode xong frame trước
+rồi mới đưa frame sau (không bỏ frame) -> kết quả lặp lại được giữa các lần chạy
+Chuỗi cho open_source / KHO_CAMERA: "0" (camera), "synthetic[:ma1,ma2]", thư mục ảnh, file video
+"""
+import os
+import time
+
+import cv2
+import numpy as np
+
+from giaima import IMAGE_EXTENSIONS
+
+
+class FrameSource:
+    """Nguồn frame có nhịp `fps` (None = không chờ); lớp con cài _next() trả frame hoặc None khi hết"""
+
+    def __init__(self, fps=None):
+        self.interval = 1.0 / fps if fps else 0.0
+        self.lossless = not fps
+        self.opened = True
+        self.started = None
+        self.count = 0
+
+    def isOpened(self):
+        return self.opened
+
+    def read(self):
+        if not self.opened:
+            return False, None
+        now = time.monotonic()
+        if self.started is None:
+            self.started = now
+        if self.interval:
+            due = self.started + self.count * self.interval
+            if due > now:
+                time.sleep(due - now)
+        frame = self._next()
+        if frame is None:
+            return False, None
+        self.count += 1
+        return True, frame
+
+    def _next(self):
+        raise NotImplementedError
+
+    def release(self):
+        self.opened = False
+
+
+class VideoFileSource(FrameSource):
+    """
+    Đọc file video: realtime=False thì decode mọi frame (đo thông lượng),
+    realtime=True thì phát theo FPS của file, frame decode không kịp bị bỏ như camera (đo độ trễ)
+    """
+
+    def __init__(self, path, realtime=False, loop=False):
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise FileNotFoundError(path)
+        fps = (self.cap.get(cv2.CAP_PROP_FPS) or 30.0) if realtime else None
+        super().__init__(fps)
+        self.path = path
+        self.loop = loop
+
+    def _next(self):
+        ok, frame = self.cap.read()
+        if not ok and self.loop and self.count:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.cap.read()
+        return frame if ok else None
+
+    def release(self):
+        super().release()
+        self.cap.release()
+
+
+class ImageFolderSource(FrameSource):
+    """Các ảnh trong thư mục theo thứ tự tên file, mỗi ảnh `hold` frame"""
+
+    def __init__(self, folder, fps=None, loop=False, hold=1):
+        super().__init__(fps)
+        self.files = sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                            if name.lower().endswith(IMAGE_EXTENSIONS))
+        if not self.files:
+            raise FileNotFoundError(f"Không có ảnh trong {folder}")
+        self.loop = loop
+        self.hold = hold
+        self.frame = None
+
+    def _next(self):
+        index, repeat = divmod(self.count, self.hold)
+        if index >= len(self.files) and not self.loop:
+            return None
+        if repeat == 0 or self.frame is None:
+            image = cv2.imread(self.files[index % len(self.files)])
+            # Ảnh hỏng thì giữ ảnh trước
+            if image is not None:
+                self.frame = image
+        return self.frame
+
+
+# ===== MÃ EAN-13 GIẢ LẬP =====
+
+_EAN_L = ('0001101', '0011001', '0010011', '0111101', '0100011',
+          '0110001', '0101111', '0111011', '0110111', '0001011')
+_EAN_R = tuple(''.join('1' if bit == '0' else '0' for bit in code) for code in _EAN_L)
+_EAN_G = tuple(code[::-1] for code in _EAN_R)
+# Chữ số đầu quyết định 6 số bên trái mã theo bảng L hay G
+_EAN_PARITY = ('LLLLLL', 'LLGLGG', 'LLGGLG', 'LLGGGL', 'LGLLGG',
+               'LGGLLG', 'LGGGLL', 'LGLGLG', 'LGLGGL', 'LGGLGL')
+
+
+def ean13_check_digit(digits12):
+    """Số kiểm tra của 12 số đầu"""
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits12))
+    return str((10 - total % 10) % 10)
+
+
+def ean13_modules(code):
+    """95 vạch (chuỗi '1' = đen) của mã 13 số, hoặc 12 số (tự thêm số kiểm tra)"""
+    if len(code) == 12:
+        code += ean13_check_digit(code)
+    if len(code) != 13 or not code.isdigit() or ean13_check_digit(code[:12]) != code[12]:
+        raise ValueError(f"Mã EAN-13 không hợp lệ: {code}")
+    parity = _EAN_PARITY[int(code[0])]
+    left = ''.join((_EAN_L if p == 'L' else _EAN_G)[int(d)] for p, d in zip(parity, code[1:7]))
+    right = ''.join(_EAN_R[int(d)] for d in code[7:])
+    return '101' + left + '01010' + right + '101'
+
+
+def render_ean13(code, module=3, height=160, quiet=11):
+    """Ảnh xám mã vạch EAN-13 trên nền trắng (có vùng trống 2 bên)"""
+    bars = np.array([bit == '1' for bit in ean13_modules(code)])
+    row = np.full(len(bars) + 2 * quiet, 255, dtype=np.uint8)
+    row[quiet:quiet + len(bars)][bars] = 0
+    return np.repeat(np.tile(row, (height, 1)), module, axis=1)
+
+
+def random_ean13(rng, prefix='893'):
+    """Mã EAN-13 ngẫu nhiên hợp lệ (893 = Việt Nam)"""
+    body = prefix + ''.join(str(d) for d in rng.integers(0, 10, 12 - len(prefix)))
+    return body + ean13_check_digit(body)
+
+
+class SyntheticSource(FrameSource):
+    """
+    Frame giả lập: mỗi mã hiện `hold` frame (trôi nhẹ như tay cầm sản phẩm), rồi `gap` frame trống
+    noise: độ lệch chuẩn nhiễu, blur: sigma làm mờ (0 = nét); codes None = mã ngẫu nhiên mỗi lượt
+    shown[mã] = thời điểm (monotonic) frame đầu tiên có mã được phát, để đo độ trễ decode
+    """
+
+    def __init__(self, codes=None, frames=300, fps=None, size=(1280, 720), hold=30, gap=15,
+                 module=3, noise=4.0, blur=1.0, seed=0):
+        super().__init__(fps)
+        self.codes = list(codes) if codes else None
+        self.frames = frames
+        self.width, self.height = size
+        self.hold = hold
+        self.gap = gap
+        self.module = module
+        self.noise = noise
+        self.blur = blur
+        self.rng = np.random.default_rng(seed)
+        self.shown = {}
+        self.label = None
+        self._code = None
+        self._image = None
+
+    def _pass_code(self, index):
+        if self.codes:
+            return self.codes[index % len(self.codes)]
+        return random_ean13(self.rng)
+
+    def _next(self):
+        if self.frames is not None and self.count >= self.frames:
+            return None
+        index, step = divmod(self.count, self.hold + self.gap)
+        frame = np.full((self.height, self.width), 110, dtype=np.uint8)
+
+        if step < self.hold:
+            if step == 0:
+                self._code = self._pass_code(index)
+                self._image = render_ean13(self._code, self.module)
+            image = self._image
+            h, w = image.shape
+            x = (self.width - w) // 2 + int(self.width * 0.15 * np.sin(step / 12)) + int(self.rng.integers(-3, 4))
+            y = (self.height - h) // 2 + int(self.rng.integers(-3, 4))
+            x = min(max(x, 0), self.width - w)
+            frame[y:y + h, x:x + w] = image
+            self.label = self._code
+        else:
+            self.label = None
+
+        if self.blur > 0:
+            frame = cv2.GaussianBlur(frame, (0, 0), self.blur)
+        if self.noise > 0:
+            frame = np.clip(frame + self.rng.normal(0, self.noise, frame.shape), 0, 255).astype(np.uint8)
+        if self.label is not None and self.label not in self.shown:
+            self.shown[self.label] = time.monotonic()
+        return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+
+
+def open_source(spec=0):
+    """
+    Mở nguồn hình từ số camera hoặc chuỗi (KHO_CAMERA):
+    "0" camera 0, "synthetic" / "synthetic:ma1,ma2" giả lập 30 FPS, thư mục ảnh, file video (phát theo FPS)
+    """
+    spec = str(spec)
+    if spec.isdigit():
+        cap = cv2.VideoCapture(int(spec))
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        return cap
+    if spec == 'synthetic' or spec.startswith('synthetic:'):
+        codes = [code for code in spec.partition(':')[2].split(',') if code]
+        return SyntheticSource(codes or None, frames=None, fps=30)
+    if os.path.isdir(spec):
+        return ImageFolderSource(spec, fps=30, loop=True, hold=15)
+    return VideoFileSource(spec, realtime=True)
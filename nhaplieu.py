@@ -0,0 +1,229 @@
+"""
+Nhap danh muc san pham hang loat tu file CSV (hoac XLSX neu co openpyxl)
+- doc tung dong (khong nap ca file vao bo nho), kiem tra theo tung lo
+- moi lo 1 transaction: upsert bang executemany + lich su ADD_NEW gom 1 lenh
+- giua 2 lo nha khoa ghi: quay ban hang van tao don duoc trong luc nhap
+- dry_run: chi kiem tra + dem so dong se them/cap nhat, khong ghi gi
+
+Chay: python nhaplieu.py danh_muc.csv [duong_dan_db] [--dry-run] [--errors loi.csv]
+"""
+import csv
+import sys
+import time
+
+from timkiem import fold_text
+
+
+# Ten cot trong file (da bo dau, bo khoang trang/_/-) -> cot products
+COLUMN_ALIASES = {
+    'barcode': ('barcode', 'mavach', 'ma', 'masp', 'sku', 'ean'),
+    'name': ('name', 'ten', 'tensp', 'tensanpham'),
+    'category': ('category', 'nhom', 'loai', 'danhmuc'),
+    'quantity': ('quantity', 'soluong', 'sl', 'ton', 'tonkho'),
+    'min_stock': ('minstock', 'tontoithieu', 'toithieu'),
+    'price': ('price', 'gia', 'giaban'),
+    'cost_price': ('costprice', 'cost', 'gianhap', 'giavon'),
+    'supplier': ('supplier', 'nhacungcap', 'ncc'),
+    'description': ('description', 'mota', 'ghichu'),
+}
+
+NUMBER_COLUMNS = {'quantity': int, 'min_stock': int, 'price': float, 'cost_price': float}
+
+
+def match_columns(header):
+    """Header cua file -> {vi tri cot: cot products}, bo qua cot khong biet"""
+    lookup = {alias: column for column, aliases in COLUMN_ALIASES.items() for alias in aliases}
+    mapping = {}
+    for i, title in enumerate(header):
+        key = ''.join(ch for ch in fold_text(str(title or '')) if ch.isalnum())
+        column = lookup.get(key)
+        if column and column not in mapping.values():
+            mapping[i] = column
+    return mapping
+
+
+def iter_rows(path):
+    """Doc file theo tung dong: (so dong trong file, list gia tri); dong dau la header"""
+    if path.lower().endswith(('.xlsx', '.xlsm')):
+        try:
+            import openpyxl
+        except ImportError:
+            raise RuntimeError("Can cai openpyxl de doc file Excel (pip install openpyxl)")
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            for line, row in enumerate(workbook.active.iter_rows(values_only=True), 1):
+                yield line, ['' if value is None else value for value in row]
+        finally:
+            workbook.close()
+        return
+
+    # utf-8-sig: file CSV luu tu Excel co BOM dau file
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        for line, row in enumerate(csv.reader(f, dialect), 1):
+            yield line, row
+
+
+def parse_number(value, kind):
+    """'12,000' / 12000.0 -> so; so am hoac sai dinh dang -> ValueError"""
+    if isinstance(value, (int, float)):
+        number = value
+    else:
+        text = str(value).strip().replace(',', '').replace(' ', '')
+        try:
+            number = float(text)
+        except ValueError:
+            raise ValueError("khong phai so")
+    if kind is int:
+        if number != int(number):
+            raise ValueError("phai la so nguyen")
+        number = int(number)
+    if number < 0:
+        raise ValueError("khong duoc am")
+    return number
+
+
+def validate_row(values, mapping):
+    """1 dong file -> dict san pham, sai -> ValueError (thong bao cho bao cao loi)"""
+    product = {}
+    for i, column in mapping.items():
+        value = values[i] if i < len(values) else ''
+        if value is None or str(value).strip() == '':
+            continue
+        if column in NUMBER_COLUMNS:
+            try:
+                product[column] = parse_number(value, NUMBER_COLUMNS[column])
+            except ValueError as e:
+                raise ValueError(f"{column} '{value}' khong hop le ({e})")
+        else:
+            # Excel doc ma vach dang so -> 8930000000001.0
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            product[column] = str(value).strip()
+
+    barcode = product.get('barcode', '')
+    if not barcode:
+        raise ValueError("thieu ma vach")
+    if len(barcode) > 64 or len(barcode.split()) != 1:
+        raise ValueError(f"ma vach '{barcode}' khong hop le")
+    return product
+
+
+def import_catalog(manager, path, chunk_size=2000, dry_run=False, progress=None, user='system'):
+    """
+    Nhap danh muc tu `path` vao manager (InventoryManager)
+    progress(so dong da doc, so dong loi) duoc goi sau moi lo
+    San pham da co: cap nhat cac o co gia tri, o trong giu nguyen, khong doi ton kho
+    (ton kho cua hang da co thay doi qua nhap kho/kiem kho de con lich su)
+    Tra ve bao cao: rows, inserted, updated, errors [(dong, ma vach, loi)], seconds, rows_per_sec
+    """
+    start = time.perf_counter()
+    report = {'rows': 0, 'inserted': 0, 'updated': 0, 'errors': [], 'dry_run': dry_run}
+    rows = iter_rows(path)
+
+    mapping = None
+    for line, header in rows:
+        mapping = match_columns(header)
+        break
+    if not mapping or 'barcode' not in mapping.values():
+        raise ValueError("File khong co cot ma vach (barcode / ma vach)")
+    barcode_index = next(i for i, column in mapping.items() if column == 'barcode')
+
+    seen = {}
+    chunk = []
+
+    def flush():
+        # set(): manager tu xa (RemoteInventory) tra ve list
+        existing = set(manager.existing_barcodes([product['barcode'] for product in chunk]))
+        # O trong = giu gia tri cu; san pham moi thi bat buoc co ten
+        for product in chunk:
+            if product['barcode'] not in existing and 'name' not in product:
+                report['errors'].append((seen[product['barcode']], product['barcode'],
+                                         "san pham moi thieu ten"))
+        chunk[:] = [product for product in chunk
+                    if product['barcode'] in existing or 'name' in product]
+        if chunk and not dry_run:
+            existing = set(manager.upsert_products(chunk, user))
+        for product in chunk:
+            if product['barcode'] in existing:
+                report['updated'] += 1
+            else:
+                report['inserted'] += 1
+        chunk.clear()
+        if progress:
+            progress(report['rows'], len(report['errors']))
+
+    for line, values in rows:
+        if not any(str(value).strip() for value in values):
+            continue
+        report['rows'] += 1
+        try:
+            product = validate_row(values, mapping)
+            barcode = product['barcode']
+            if barcode in seen:
+                raise ValueError(f"trung ma vach voi dong {seen[barcode]}")
+            seen[barcode] = line
+        except ValueError as e:
+            barcode = values[barcode_index] if barcode_index < len(values) else ''
+            report['errors'].append((line, barcode, str(e)))
+            continue
+
+        chunk.append(product)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk or progress:
+        flush()
+    report['errors'].sort()
+
+    report['seconds'] = time.perf_counter() - start
+    report['rows_per_sec'] = report['rows'] / report['seconds'] if report['seconds'] else 0.0
+    return report
+
+
+def write_error_report(errors, path):
+    """Ghi danh sach dong loi ra CSV (mo duoc bang Excel)"""
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['dong', 'ma_vach', 'loi'])
+        writer.writerows(errors)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    dry_run = '--dry-run' in args
+    if dry_run:
+        args.remove('--dry-run')
+    error_path = None
+    if '--errors' in args:
+        i = args.index('--errors')
+        error_path = args[i + 1]
+        del args[i:i + 2]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+
+    from dulieu import InventoryManager
+
+    manager = InventoryManager(args[1] if len(args) > 1 else 'inventory.db')
+    try:
+        result = import_catalog(
+            manager, args[0], dry_run=dry_run,
+            progress=lambda done, errors: print(f"  {done} dong, {errors} loi", end='\r'))
+    finally:
+        manager.close()
+
+    print(f"\n{'[THU] ' if dry_run else ''}{result['rows']} dong: them {result['inserted']},"
+          f" cap nhat {result['updated']}, loi {len(result['errors'])}"
+          f" ({result['rows_per_sec']:,.0f} dong/giay)")
+    for line, barcode, message in result['errors'][:20]:
+        print(f"  dong {line} ({barcode}): {message}")
+    if error_path and result['errors']:
+        write_error_report(result['errors'], error_path)
+        print(f"Da ghi {len(result['errors'])} dong loi vao {error_path}")
+    elif len(result['errors']) > 20:
+        print(f"  ... them {len(result['errors']) - 20} loi (--errors loi.csv de xem het)")
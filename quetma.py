@@ -0,0 +1,103 @@
+"""
+Dieu phoi ma quet tu camera theo che do: ban hang, nhap kho, xuat kho, kiem kho
+- moi che do co thoi gian cho (cooldown) va cach gom rieng (ScanPolicy)
+- ma van nam trong khung hinh chi tinh 1 lan: phai roi khung hinh lau hon cooldown
+  moi duoc tinh them (dua tung mon qua camera = moi mon 1 lan)
+- che do co gom: cac lan quet trong 1 dot duoc cong don theo ma, handler nhan 1 Counter
+  -> 1 lan cap nhat so luong / 1 lenh ghi cho ca dot thay vi 1 lenh ghi moi ma
+- chay tren luong Tk (feed goi qua root.after), khong can khoa
+"""
+import time
+from collections import Counter, namedtuple
+
+
+# cooldown: giay, ma phai vang mat lau hon moi tinh lan nua
+# batch_window: giay gom tu lan quet dau cua dot (0 = giao ngay tung ma)
+# max_batch: so lan quet toi da 1 dot, du thi giao ngay
+ScanPolicy = namedtuple('ScanPolicy', 'cooldown batch_window max_batch')
+
+SCAN_POLICIES = {
+    # Gio hang nam trong bo nho, moi ma giao ngay de thu ngan thay lien
+    'sell': ScanPolicy(cooldown=2.0, batch_window=0.0, max_batch=1),
+    # Phieu nhap: dua lien tuc tung thung, gom theo dot de lam moi bang 1 lan
+    'import': ScanPolicy(cooldown=0.8, batch_window=0.5, max_batch=200),
+    # Xuat kho ghi thang vao kho: 1 dot = 1 transaction, cooldown dai de tranh xuat trung
+    'export': ScanPolicy(cooldown=1.5, batch_window=1.0, max_batch=200),
+    # Kiem kho: dem nhanh nhat, chi cong vao bo dem trong bo nho
+    'stocktake': ScanPolicy(cooldown=0.8, batch_window=0.5, max_batch=500),
+}
+
+# Scanner giao lai 1 ma dang nam trong khung hinh moi chung nay giay
+# (scanner.scan_cooldown), nho hon moi cooldown o tren de biet ma con trong khung
+SIGHTING_INTERVAL = 0.25
+
+
+class ScanRouter:
+    """
+    Nhan ma tu camera, loc trung theo che do hien tai, gom theo dot roi goi
+    handlers[che do](Counter {ma: so lan})
+    schedule(ms, ham, *args): hen gio (root.after), None = chi giao khi flush()
+    """
+
+    def __init__(self, handlers, policies=None, schedule=None, clock=time.monotonic):
+        self.handlers = handlers
+        self.policies = dict(SCAN_POLICIES, **(policies or {}))
+        self.schedule = schedule
+        self.clock = clock
+        self.mode = None
+        self.accepted = 0
+        self.suppressed = 0
+        self.batches = 0
+        self._last_seen = {}
+        self._pending = Counter()
+        self._generation = 0
+        self._timer = False
+
+    def set_mode(self, mode):
+        """Doi che do (None = bo qua moi ma quet); dot dang gom cua che do cu duoc giao truoc"""
+        if mode == self.mode:
+            return
+        self.flush()
+        self.mode = mode
+        self._last_seen.clear()
+
+    def feed(self, code, now=None):
+        """1 lan camera doc duoc ma, tra ve True neu duoc tinh"""
+        if self.mode not in self.handlers:
+            return False
+        policy = self.policies[self.mode]
+        now = self.clock() if now is None else now
+
+        last = self._last_seen.get(code)
+        self._last_seen[code] = now
+        if last is not None and now - last < policy.cooldown:
+            self.suppressed += 1
+            return False
+
+        self.accepted += 1
+        self._pending[code] += 1
+        if policy.batch_window <= 0 or sum(self._pending.values()) >= policy.max_batch:
+            self.flush()
+        elif not self._timer and self.schedule is not None:
+            self._timer = True
+            self.schedule(int(policy.batch_window * 1000), self._on_timer, self._generation)
+        return True
+
+    def _on_timer(self, generation):
+        # Hen gio cua dot da giao som (du max_batch / doi che do) thi bo qua
+        if generation == self._generation:
+            self.flush()
+
+    def flush(self):
+        """Giao dot dang gom cho handler cua che do hien tai"""
+        self._generation += 1
+        self._timer = False
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, Counter()
+        self.batches += 1
+        self.handlers[self.mode](batch)
+
+    def stats(self):
+        """So lan quet duoc tinh / bi loc trung va so dot da giao"""
+        return {'accepted': self.accepted, 'suppressed': self.suppressed, 'batches': self.batches}
@@ -1,215 +1,667 @@
 import cv2
 import numpy as np
-from pyzbar.pyzbar import decode
+from pyzbar.locations import Rect
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from datetime import datetime
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.util import Finalize
+import queue
 import threading
+import time
+
+from giaima import BARCODE_TYPES, DEFAULT_ENGINE, draw_result, engine_specs, limit_width, make_engine
+from nguonhinh import open_source
+
+
+class FrameSlot:
+    """
+    Ô chứa 1 frame mới nhất giữa luồng camera và luồng decode:
+    frame chưa kịp decode bị frame mới ghi đè (đếm là bỏ qua), không bao giờ xếp hàng
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.frame = None
+        self.seq = 0
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, frame, wait=False):
+        """wait=True: chờ frame trước được lấy rồi mới đặt (nguồn lossless, không bỏ frame)"""
+        with self.cond:
+            while wait and self.frame is not None and not self.closed:
+                self.cond.wait()
+            if self.frame is not None:
+                self.dropped += 1
+            self.frame = frame
+            self.seq += 1
+            self.cond.notify_all()
+
+    def take(self, timeout=0.5):
+        """Lấy frame mới nhất (mỗi frame chỉ 1 luồng decode lấy), None nếu hết giờ/đã đóng"""
+        with self.cond:
+            if self.frame is None and not self.closed:
+                self.cond.wait(timeout)
+            frame, self.frame = self.frame, None
+            if frame is not None:
+                self.cond.notify_all()
+            return frame
+
+    def drain(self):
+        """Chờ frame cuối được lấy (hoặc slot đóng)"""
+        with self.cond:
+            while self.frame is not None and not self.closed:
+                self.cond.wait()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.frame = None
+            self.cond.notify_all()
+
+
+class RateMeter:
+    """Đếm số lần/giây trong `window` giây gần nhất"""
+
+    def __init__(self, window=2.0):
+        self.window = window
+        self.times = deque()
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def tick(self):
+        now = time.monotonic()
+        with self.lock:
+            self.total += 1
+            self.times.append(now)
+            while now - self.times[0] > self.window:
+                self.times.popleft()
+
+    def rate(self):
+        with self.lock:
+            now = time.monotonic()
+            while self.times and now - self.times[0] > self.window:
+                self.times.popleft()
+            if len(self.times) < 2:
+                return 0.0
+            return (len(self.times) - 1) / max(self.times[-1] - self.times[0], 1e-6)
+
+
+# Tiến trình decode: giữ engine + các vùng shared memory đã mở theo tên (mở gần nhất ở cuối)
+_engines = {}
+_attached = OrderedDict()
+# Vòng của DecodePool có workers + 1 vùng; vùng cũ (đã unlink khi tạo lại/đóng pool) bị đóng dần
+_MAX_ATTACHED = 16
+
+
+def _init_worker():
+    """Chạy khi tiến trình decode khởi động: đóng các vùng đã mở khi tiến trình thoát"""
+    Finalize(None, _close_attached, exitpriority=10)
+
+
+def _close_attached():
+    while _attached:
+        _attached.popitem(last=False)[1].close()
+
+
+def _attach(shm_name):
+    """
+    Mở vùng shared memory do tiến trình cha tạo mà không đăng ký với resource_tracker:
+    tiến trình cha tự unlink, tracker không được báo rò rỉ / unlink lần 2 khi tiến trình con thoát
+    """
+    try:
+        return shared_memory.SharedMemory(name=shm_name, track=False)  # Python 3.13+
+    except TypeError:
+        pass
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=shm_name)
+    finally:
+        resource_tracker.register = register
+
+
+def _decode_shared(spec, shm_name, shape):
+    """Chạy trong tiến trình con: đọc frame từ shared memory (không copy qua pipe) rồi decode"""
+    shm = _attached.get(shm_name)
+    if shm is None:
+        shm = _attached[shm_name] = _attach(shm_name)
+        while len(_attached) > _MAX_ATTACHED:
+            _attached.popitem(last=False)[1].close()
+    else:
+        _attached.move_to_end(shm_name)
+    engine = _engines.get(spec)
+    if engine is None:
+        engine = _engines[spec] = make_engine(spec)
+    frame = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    return engine.decode(frame)
+
+
+class DecodePool:
+    """
+    Chạy các engine của 1 chuỗi engine (giaima) song song trên nhiều lõi, kết quả hợp lệ
+    đầu tiên thắng: engine chưa bắt đầu bị hủy, engine đang chạy chạy nốt và bị bỏ kết quả
+    mode='thread': pyzbar/OpenCV nhả GIL trong lúc decode
+    mode='process': frame ghi 1 lần vào shared memory, các tiến trình đọc chung
+    """
+
+    def __init__(self, workers=3, mode='thread', engine=DEFAULT_ENGINE):
+        self.workers = workers
+        self.mode = mode
+        self.strategies = engine_specs(engine)
+        self.wins = {name: 0 for name in self.strategies}
+        if mode == 'process':
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+            # Vòng shared memory: 1 vùng chỉ dùng lại khi mọi cách decode trên nó đã xong
+            self.free = queue.Queue()
+            self.buffers = []
+            for _ in range(workers + 1):
+                self.free.put(None)
+        elif mode == 'thread':
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='decode-pool')
+            self.engines = {name: make_engine(name) for name in self.strategies}
+        else:
+            raise ValueError(f"mode phải là 'thread' hoặc 'process', không phải {mode!r}")
+
+    def _shared_frame(self, frame):
+        """Chép frame vào 1 vùng shared memory rảnh (tạo mới / lớn hơn nếu cần)"""
+        shm = self.free.get()
+        if shm is None or shm.size < frame.nbytes:
+            if shm is not None:
+                self.buffers.remove(shm)
+                shm.close()
+                shm.unlink()
+            shm = shared_memory.SharedMemory(create=True, size=frame.nbytes)
+            self.buffers.append(shm)
+        np.ndarray(frame.shape, dtype=np.uint8, buffer=shm.buf)[:] = frame
+        return shm
+
+    def decode(self, frame):
+        """Decode 1 frame (BGR uint8), trả về danh sách kết quả của cách xong đầu tiên"""
+        if self.mode == 'process':
+            shm = self._shared_frame(frame)
+            futures = {self.executor.submit(_decode_shared, name, shm.name, frame.shape): name
+                       for name in self.strategies}
+            remaining = [len(futures)]
+            lock = threading.Lock()
+
+            def release(_):
+                with lock:
+                    remaining[0] -= 1
+                    done = remaining[0] == 0
+                if done:
+                    self.free.put(shm)
+
+            for future in futures:
+                future.add_done_callback(release)
+        else:
+            futures = {self.executor.submit(self.engines[name].decode, frame): name
+                       for name in self.strategies}
+
+        results = []
+        pending = set(futures)
+        while pending and not results:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.cancelled() or future.exception() is not None:
+                    continue
+                if future.result():
+                    results = future.result()
+                    self.wins[futures[future]] += 1
+                    break
+        for future in pending:
+            future.cancel()
+        return results
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        if self.mode == 'process':
+            for shm in self.buffers:
+                shm.close()
+                shm.unlink()
+            self.buffers = []
+
+
+def _bounds(result):
+    """Khung (x0, y0, x1, y1) của 1 kết quả decode (rect của pyzbar hoặc polygon của QR)"""
+    if result.get('rect') is not None:
+        rect = result['rect']
+        return rect.left, rect.top, rect.left + rect.width, rect.top + rect.height
+    points = np.asarray(result['polygon'], dtype=np.float32).reshape(-1, 2)
+    return (int(points[:, 0].min()), int(points[:, 1].min()),
+            int(points[:, 0].max()), int(points[:, 1].max()))
+
+
+def _map_result(result, dx, dy, scale=1.0):
+    """Đổi tọa độ kết quả decode trên ảnh cắt/thu nhỏ về tọa độ frame gốc"""
+    mapped = dict(result)
+    if result.get('rect') is not None:
+        rect = result['rect']
+        mapped['rect'] = Rect(int(rect.left * scale) + dx, int(rect.top * scale) + dy,
+                              int(rect.width * scale), int(rect.height * scale))
+    if result.get('polygon') is not None:
+        points = np.asarray(result['polygon'], dtype=np.float32).reshape(-1, 2)
+        mapped['polygon'] = [(int(x * scale) + dx, int(y * scale) + dy) for x, y in points]
+    return mapped
+
+
+class RoiTracker:
+    """
+    Nhớ vùng mã vừa decode: frame sau chỉ decode vùng cắt quanh đó (có lề),
+    thỉnh thoảng mới tìm lại cả frame (thu nhỏ) để thấy mã mới
+    """
+
+    def __init__(self, padding=0.4, min_padding=24, ttl=1.0, search_interval=10,
+                 search_width=640, full_res_interval=4):
+        self.padding = padding                      # lề = padding x cạnh của khung mã
+        self.min_padding = min_padding              # lề tối thiểu (px)
+        self.ttl = ttl                              # giây không thấy lại thì quên vùng
+        self.search_interval = search_interval      # đang theo dõi: N frame tìm cả frame 1 lần
+        self.search_width = search_width            # tìm cả frame trên ảnh thu nhỏ còn chừng này
+        self.full_res_interval = full_res_interval  # không có vùng: N lần tìm thì 1 lần độ phân giải gốc
+        self.regions = {}                           # data -> (x0, y0, x1, y1, lần thấy cuối)
+        self.frames = 0
+        self.searches = 0
+        self.roi_hits = 0
+        self.lock = threading.Lock()
+
+    def _remember(self, results, now):
+        with self.lock:
+            for result in results:
+                self.regions[result['data']] = _bounds(result) + (now,)
+
+    def _crops(self, shape, now):
+        """Vùng cắt (đã thêm lề, gộp trong frame) của các mã còn nhớ"""
+        height, width = shape[:2]
+        crops = []
+        with self.lock:
+            for data, (x0, y0, x1, y1, seen) in list(self.regions.items()):
+                if now - seen > self.ttl:
+                    del self.regions[data]
+                    continue
+                pad_x = max(int((x1 - x0) * self.padding), self.min_padding)
+                pad_y = max(int((y1 - y0) * self.padding), self.min_padding)
+                crops.append((max(x0 - pad_x, 0), max(y0 - pad_y, 0),
+                              min(x1 + pad_x, width), min(y1 + pad_y, height)))
+        return crops
+
+    def decode(self, frame, decode_image):
+        """
+        Decode frame bằng decode_image(ảnh) -> kết quả, ưu tiên vùng đã nhớ
+        Tọa độ kết quả luôn theo frame gốc
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.frames += 1
+            frame_no = self.frames
+
+        results = []
+        crops = self._crops(frame.shape, now)
+        for x0, y0, x1, y1 in crops:
+            if x1 - x0 < 8 or y1 - y0 < 8:
+                continue
+            known = {result['data'] for result in results}
+            # Vùng chồng nhau có thể decode ra cùng 1 mã 2 lần
+            results.extend(_map_result(result, x0, y0) for result in decode_image(frame[y0:y1, x0:x1])
+                           if result['data'] not in known)
+        if results:
+            self.roi_hits += 1
+
+        # Đang thấy mã: chỉ tìm cả frame định kỳ (mã mới xuất hiện cạnh mã cũ)
+        if results and frame_no % self.search_interval:
+            self._remember(results, now)
+            return results
+
+        self.searches += 1
+        height, width = frame.shape[:2]
+        if not crops and self.searches % self.full_res_interval == 0:
+            found = decode_image(frame)
+        elif width > self.search_width:
+            scale = width / self.search_width
+            small = cv2.resize(frame, (self.search_width, int(height / scale)),
+                               interpolation=cv2.INTER_AREA)
+            found = [_map_result(result, 0, 0, scale) for result in decode_image(small)]
+        else:
+            found = decode_image(frame)
+
+        known = {result['data'] for result in results}
+        results.extend(result for result in found if result['data'] not in known)
+        self._remember(results, now)
+        return results
+
+    def reset(self):
+        with self.lock:
+            self.regions.clear()
+
+    def stats(self):
+        """Số frame, số frame decode trúng vùng đã nhớ, số lần tìm cả frame"""
+        return {'frames': self.frames, 'roi_hits': self.roi_hits, 'searches': self.searches}
+
+
+class MotionGate:
+    """
+    Chỉ decode khi khung hình có chuyển động (so frame thu nhỏ với frame trước):
+    - có chuyển động, hoặc chưa quá `settle` giây sau chuyển động cuối -> decode
+      (sản phẩm vừa đặt xuống đứng yên vẫn được decode)
+    - cảnh tĩnh -> bỏ qua frame
+    - không có chuyển động quá `idle_after` giây -> chế độ nghỉ: chỉ xét `idle_fps` frame/giây,
+      có chuyển động là về tốc độ đầy đủ ngay
+    """
+
+    def __init__(self, threshold=4.0, settle=1.5, idle_after=10.0, idle_fps=4.0, width=160):
+        self.threshold = threshold      # chênh lệch trung bình mỗi điểm ảnh (0-255) coi là chuyển động
+        self.settle = settle
+        self.idle_after = idle_after
+        self.idle_fps = idle_fps
+        self.width = width
+        self.previous = None
+        self.last_motion = time.monotonic()
+        self.motion = 0.0
+        self.checked = 0
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+    def should_decode(self, frame, now=None):
+        """Xét 1 frame, trả về True nếu nên decode"""
+        now = time.monotonic() if now is None else now
+        height, width = frame.shape[:2]
+        small = cv2.resize(frame, (self.width, max(int(height * self.width / width), 1)),
+                           interpolation=cv2.INTER_AREA)
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+        with self.lock:
+            self.checked += 1
+            previous, self.previous = self.previous, small
+            if previous is None or previous.shape != small.shape:
+                self.last_motion = now
+                return True
+            self.motion = float(cv2.absdiff(small, previous).mean())
+            if self.motion >= self.threshold:
+                self.last_motion = now
+            if now - self.last_motion < self.settle:
+                return True
+            self.skipped += 1
+            return False
+
+    def is_idle(self, now=None):
+        now = time.monotonic() if now is None else now
+        return now - self.last_motion > self.idle_after
+
+    def wake(self):
+        """Coi như vừa có chuyển động (vd bật lại camera)"""
+        with self.lock:
+            self.previous = None
+            self.last_motion = time.monotonic()
+
+    def stats(self):
+        return {'checked': self.checked, 'skipped': self.skipped, 'idle': self.is_idle(),
+                'motion': self.motion}
 
 
 class RealtimeBarcodeScanner:
     """Scanner camera real-time cho Tkinter integration"""
     
-    def __init__(self, callback=None):
+    def __init__(self, callback=None, decode_workers=1, pool_workers=0, pool_mode='thread',
+                 roi_tracking=True, motion_gate=True, cpu_budget=1.0, engine=DEFAULT_ENGINE):
         """
         Args:
-            callback: Function được gọi khi quét được mã (callback(code_data))
+            callback: Function được gọi khi quét được mã (callback(code_data)),
+                chạy trên luồng decode
+            decode_workers: số luồng decode lấy frame từ FrameSlot
+            pool_workers: > 0 thì mỗi frame chạy các cách decode song song trên
+                DecodePool (pool_mode 'thread' hoặc 'process'), 0 = tuần tự
+            roi_tracking: chỉ decode vùng quanh mã vừa thấy, thỉnh thoảng mới tìm cả frame
+            motion_gate: bỏ qua frame tĩnh, nghỉ (ít frame/giây) khi lâu không có chuyển động
+            cpu_budget: phần thời gian (theo 1 lõi) được dùng để decode, vd 0.5 = decode
+                xong nghỉ bằng thời gian vừa decode
+            engine: chuỗi engine giải mã (giaima.make_engine), vd "pyzbar,opencv:sharpen"
         """
-        self.barcode_types = {
-            'QRCODE': 'Mã QR',
-            'EAN13': 'EAN-13',
-            'EAN8': 'EAN-8',
-            'CODE128': 'Code 128',
-            'CODE39': 'Code 39',
-            'CODE93': 'Code 93',
-            'UPC_A': 'UPC-A',
-            'UPC_E': 'UPC-E',
-        }
-        self.qr_detector = cv2.QRCodeDetector()
+        if not cpu_budget > 0:
+            raise ValueError(f"cpu_budget phải > 0 (phần của 1 lõi, vd 0.3), không phải {cpu_budget!r}")
+        self.barcode_types = BARCODE_TYPES
+        self.engine = make_engine(engine)
+        self.pool = DecodePool(pool_workers, pool_mode, engine) if pool_workers > 0 else None
+        self.tracker = RoiTracker() if roi_tracking else None
+        self.gate = MotionGate() if motion_gate else None
+        self.cpu_budget = cpu_budget
+        self.started = None
+        self.cpu_started = 0.0
         self.scanned_codes = {}
         self.scan_cooldown = 2
         self.callback = callback
         self.is_running = False
         self.cap = None
+        self.lossless = False
         self.current_frame = None
         self.lock = threading.Lock()
-    
-    def preprocess_frame(self, frame):
-        """Tiền xử lý frame"""
-        height, width = frame.shape[:2]
-        if width > 1280:
-            scale = 1280 / width
-            new_width = int(width * scale)
-            new_height = int(height * scale)
-            frame = cv2.resize(frame, (new_width, new_height))
-        
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        enhanced = clahe.apply(gray)
-        
-        return frame, enhanced
-    
-    def decode_barcode(self, frame, enhanced):
-        """Decode barcode"""
-        results = []
-        
-        detected = decode(frame)
-        for obj in detected:
-            results.append({
-                'data': obj.data.decode('utf-8'),
-                'type': obj.type,
-                'type_vn': self.barcode_types.get(obj.type, obj.type),
-                'rect': obj.rect,
-                'polygon': obj.polygon,
-                'quality': obj.quality
-            })
-        
-        if not results:
-            detected = decode(enhanced)
-            for obj in detected:
-                results.append({
-                    'data': obj.data.decode('utf-8'),
-                    'type': obj.type,
-                    'type_vn': self.barcode_types.get(obj.type, obj.type),
-                    'rect': obj.rect,
-                    'polygon': obj.polygon,
-                    'quality': obj.quality
-                })
-        
-        if not results:
-            try:
-                data, bbox, _ = self.qr_detector.detectAndDecode(frame)
-                if data and bbox is not None:
-                    results.append({
-                        'data': data,
-                        'type': 'QRCODE',
-                        'type_vn': 'Mã QR',
-                        'rect': None,
-                        'polygon': bbox,
-                        'quality': 100
-                    })
-            except:
-                pass
-        
-        return results
+        # Luồng camera chỉ đọc frame, luồng decode lấy frame mới nhất từ slot
+        self.decode_workers = decode_workers
+        self.slot = FrameSlot()
+        self.threads = []
+        # Kết quả decode gần nhất, vẽ lên frame mới nhất khi xem trước
+        self.overlays = []
+        self.overlay_time = 0.0
+        self.overlay_ttl = 0.5
+        # Mã của lần decode gần nhất, báo lại khi MotionGate bỏ qua frame tĩnh
+        self.held = []
+        self.scan_lock = threading.Lock()
+        self.capture_meter = RateMeter()
+        self.decode_meter = RateMeter()
+        self.decode_seconds = 0.0
     
     def draw_barcode(self, frame, result):
-        
-        try:
-            if result['polygon'] is not None:
-                points = result['polygon']
-                
-                if isinstance(points, (list, tuple)):
-                    points_array = []
-                    for point in points:
-                        if hasattr(point, 'x') and hasattr(point, 'y'):
-                            points_array.append([int(point.x), int(point.y)])
-                        elif isinstance(point, (list, tuple)) and len(point) >= 2:
-                            points_array.append([int(point[0]), int(point[1])])
-                    
-                    if len(points_array) > 0:
-                        points_array = np.array(points_array, dtype=np.int32)
-                        cv2.polylines(frame, [points_array], True, (0, 255, 0), 3)
-            
-            if result['rect'] is not None:
-                x = result['rect'].left
-                y = result['rect'].top
-                w = result['rect'].width
-                h = result['rect'].height
-                
-                cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                
-                text = f"{result['type_vn']}: {result['data']}"
-                (text_w, text_h), baseline = cv2.getTextSize(
-                    text, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
-                
-                bg_y1 = max(0, y - text_h - 10)
-                bg_y2 = max(text_h + 10, y)
-                
-                cv2.rectangle(frame, (x, bg_y1), (x + text_w, bg_y2), 
-                            (0, 255, 0), -1)
-                
-                cv2.putText(frame, text, (x, y - 5),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
-        
-        except Exception as e:
-            text = f"{result['type_vn']}: {result['data']}"
-            cv2.putText(frame, text, (10, 100),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-        
-        return frame
+        return draw_result(frame, result)
     
     def is_new_scan(self, barcode_data):
         
         current_time = datetime.now()
         
-        if barcode_data in self.scanned_codes:
-            last_scan_time = self.scanned_codes[barcode_data]
-            time_diff = (current_time - last_scan_time).total_seconds()
+        # Nhiều luồng decode dùng chung scanned_codes
+        with self.scan_lock:
+            if barcode_data in self.scanned_codes:
+                last_scan_time = self.scanned_codes[barcode_data]
+                time_diff = (current_time - last_scan_time).total_seconds()
+                
+                if time_diff < self.scan_cooldown:
+                    return False
             
-            if time_diff < self.scan_cooldown:
-                return False
-        
-        self.scanned_codes[barcode_data] = current_time
-        return True
+            self.scanned_codes[barcode_data] = current_time
+            return True
     
-    def start(self, camera_id=0):
-        
+    def start(self, camera_id=0, capture=None):
+        """
+        Bật camera `camera_id` (hoặc chuỗi nguồn của nguonhinh.open_source: video, thư mục ảnh,
+        "synthetic"), hoặc đọc từ `capture` có sẵn (read()/isOpened()/release() như cv2.VideoCapture)
+        """
         if self.is_running:
             return False
         
-        self.cap = cv2.VideoCapture(camera_id)
+        self.cap = capture if capture is not None else open_source(camera_id)
         
         if not self.cap.isOpened():
             return False
         
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-        
+        # Nguồn lossless (video/ảnh không giới hạn FPS): luồng camera chờ decode, không bỏ frame
+        self.lossless = getattr(self.cap, 'lossless', False)
         self.is_running = True
+        self.started = time.monotonic()
+        self.cpu_started = time.process_time()
+        if self.gate is not None:
+            self.gate.wake()
+        self.slot = FrameSlot()
+        self.capture_meter = RateMeter()
+        self.decode_meter = RateMeter()
+        self.decode_seconds = 0.0
         
-        # Start thread
-        thread = threading.Thread(target=self._capture_loop, daemon=True)
-        thread.start()
+        # 1 luồng camera + decode_workers luồng decode
+        self.threads = [threading.Thread(target=self._capture_loop, name='camera', daemon=True)]
+        self.threads += [threading.Thread(target=self._decode_loop, name=f'decode-{i}', daemon=True)
+                         for i in range(self.decode_workers)]
+        for thread in self.threads:
+            thread.start()
         
         return True
     
     def _capture_loop(self):
-        
+        """Chỉ đọc camera: không bao giờ chờ decode nên xem trước luôn mượt"""
         while self.is_running:
             ret, frame = self.cap.read()
             
             if not ret:
                 break
             
-            processed_frame, enhanced = self.preprocess_frame(frame)
-            results = self.decode_barcode(processed_frame, enhanced)
+            self.capture_meter.tick()
+            with self.lock:
+                self.current_frame = frame
+            self.slot.put(frame, wait=self.lossless)
+        
+        # Hết nguồn: frame cuối vẫn được decode
+        if self.lossless:
+            self.slot.drain()
+        self.slot.close()
+    
+    def _decode_loop(self):
+        """Lấy frame mới nhất trong slot, decode, gọi callback"""
+        while self.is_running:
+            frame = self.slot.take()
+            if frame is None:
+                if self.slot.closed:
+                    break
+                continue
             
-            for result in results:
-                processed_frame = self.draw_barcode(processed_frame, result)
-                
-                if self.is_new_scan(result['data']):
-                    # Callback
-                    if self.callback:
-                        self.callback(result)
+            spent = self.handle_frame(frame)
+            if spent is None:
+                # Cảnh tĩnh lâu: chỉ xét vài frame/giây, frame giữa chừng bị slot ghi đè
+                if self.gate.is_idle():
+                    time.sleep(1.0 / self.gate.idle_fps)
+                continue
             
-            # Lưu frame hiện tại
+            # Giới hạn CPU: các luồng decode cộng lại dùng tối đa cpu_budget của 1 lõi
+            rest = spent * (self.decode_workers / self.cpu_budget - 1)
+            if rest > 0:
+                time.sleep(rest)
+    
+    def handle_frame(self, frame, now=None):
+        """
+        Xét 1 frame: decode rồi gọi callback, trả về số giây decode
+        Cảnh tĩnh (MotionGate bỏ qua) trả về None, mã của lần decode gần nhất vẫn được báo
+        là còn thấy: sản phẩm cầm yên dưới camera không bị ScanRouter tính thêm lần nữa khi động lại
+        """
+        if self.gate is not None and not self.gate.should_decode(frame, now):
             with self.lock:
-                self.current_frame = processed_frame.copy()
+                held = self.held
+            self.emit(held)
+            return None
+        
+        start = time.perf_counter()
+        results = self.process_frame(frame)
+        self.decode_meter.tick()
+        spent = time.perf_counter() - start
+        
+        with self.lock:
+            self.decode_seconds += spent
+            # Frame có chuyển động mà không thấy mã: sản phẩm đã rời khung hình
+            self.held = results
+            if results:
+                self.overlays = results
+                self.overlay_time = time.monotonic()
+        
+        self.emit(results)
+        return spent
+    
+    def emit(self, results):
+        """Gọi callback cho các mã chưa báo trong scan_cooldown giây"""
+        for result in results:
+            if self.is_new_scan(result['data']):
+                # Callback
+                if self.callback:
+                    self.callback(result)
+    
+    def process_frame(self, frame):
+        """Tiền xử lý + decode 1 frame, trả về danh sách kết quả"""
+        frame = limit_width(frame)
+        if self.tracker is not None:
+            return self.tracker.decode(frame, self.decode_image)
+        return self.decode_image(frame)
+    
+    def decode_image(self, image):
+        """Decode 1 ảnh BGR (cả frame hoặc vùng cắt) bằng DecodePool hoặc tuần tự"""
+        if self.pool is not None:
+            return self.pool.decode(np.ascontiguousarray(image))
+        return self.engine.decode(image)
     
     def get_frame(self):
-        """Lấy frame hiện tại (thread-safe)"""
+        """Lấy frame mới nhất của camera + khung mã vừa decode (thread-safe)"""
         with self.lock:
-            if self.current_frame is not None:
-                return self.current_frame.copy()
-        return None
+            latest = self.current_frame
+            overlays = self.overlays if time.monotonic() - self.overlay_time < self.overlay_ttl else []
+        if latest is None:
+            return None
+        
+        # Cùng tỉ lệ với process_frame để tọa độ kết quả khớp; vẽ trên bản sao
+        frame = limit_width(latest)
+        if frame is latest:
+            frame = frame.copy()
+        for result in overlays:
+            frame = self.draw_barcode(frame, result)
+        return frame
+    
+    def wait(self, timeout=None):
+        """Đợi nguồn hết frame (video, thư mục ảnh) và decode xong, True nếu đã xong"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return not any(thread.is_alive() for thread in self.threads)
+    
+    def stats(self):
+        """FPS camera, FPS decode, số frame bị bỏ qua (decode không kịp)"""
+        decoded = self.decode_meter.total
+        return {
+            'capture_fps': self.capture_meter.rate(),
+            'decode_fps': self.decode_meter.rate(),
+            'captured': self.capture_meter.total,
+            'decoded': decoded,
+            'dropped': self.slot.dropped,
+            'decode_ms': self.decode_seconds / decoded * 1000 if decoded else 0.0,
+            'cpu_percent': self.cpu_percent(),
+            **(self.tracker.stats() if self.tracker is not None else {}),
+            **(self.gate.stats() if self.gate is not None else {}),
+        }
+    
+    def cpu_percent(self):
+        """CPU cả tiến trình (% của 1 lõi) từ lúc start"""
+        if self.started is None:
+            return 0.0
+        wall = time.monotonic() - self.started
+        return (time.process_time() - self.cpu_started) / wall * 100 if wall > 0 else 0.0
     
     def stop(self):
         """Dừng camera"""
         self.is_running = False
+        self.slot.close()
+        
+        # Đợi luồng camera thoát trước khi release (tránh read() trên capture đã đóng)
+        for thread in self.threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=2)
+        self.threads = []
         
         if self.cap is not None and self.cap.isOpened():
             self.cap.release()
         
         self.current_frame = None
+        self.overlays = []
+        self.held = []
+        if self.tracker is not None:
+            self.tracker.reset()
+    
+    def close(self):
+        """Dừng camera và đóng DecodePool (không start lại được nữa)"""
+        self.stop()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
     
     def clear_history(self):
         """Xóa lịch sử quét"""
@@ -0,0 +1,276 @@
+"""
+Goi InventoryManager o luong nen de giao dien Tk khong bi dung khi database cham/bi khoa
+- moi lenh ghi chay tren 1 luong ghi duy nhat (hang doi FIFO), lenh dang cho duoc gom 1 transaction
+- lenh doc chay tren vai luong doc, moi luong 1 ket noi rieng
+- moi lenh tra ve Future, callback duoc goi tren luong Tk qua root.after
+- AioInventory: cung cac luong do nhung dung voi asyncio (dich vu khong giao dien)
+"""
+import asyncio
+import functools
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+# Ham cua InventoryManager co ghi database -> luong ghi, con lai -> luong doc
+WRITE_METHODS = {
+    'add_product', 'update_product', 'delete_product', 'quick_add_product',
+    'update_quantity', 'import_stock', 'export_stock', 'import_stock_batch', 'export_stock_batch',
+    'save_receiving_draft', 'create_order',
+    'void_order', 'delete_order', 'replace_order_items', 'upsert_products',
+    'start_stocktake', 'close_stocktake', 'cancel_stocktake', 'rebuild_sales_rollups',
+}
+
+
+class BatchWriter:
+    """
+    Luong ghi duy nhat (thay ThreadPoolExecutor 1 luong) co gom lenh (group commit):
+    cac lenh batch=True dang cho duoc chay chung 1 transaction, moi lenh 1 SAVEPOINT
+    (lenh loi khong keo theo lenh khac), ket qua chi tra ve sau khi COMMIT
+    """
+
+    _STOP = object()
+
+    def __init__(self, db=None, max_batch=64):
+        self.db = db
+        self.max_batch = max_batch
+        self.batches = 0
+        self.commands = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name='kho-ghi', daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args, batch=False, **kwargs):
+        """Xep lenh vao hang doi ghi, tra ve Future"""
+        future = Future()
+        self._queue.put((future, func, args, kwargs, batch and self.db is not None))
+        return future
+
+    def _loop(self):
+        pending = None
+        while True:
+            item, pending = pending or self._queue.get(), None
+            if item is self._STOP:
+                return
+
+            batch = [item]
+            while item[4] and len(batch) < self.max_batch:
+                try:
+                    nxt = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is self._STOP or not nxt[4]:
+                    pending = nxt
+                    break
+                batch.append(nxt)
+            self._run(batch)
+
+    def _run(self, batch):
+        """Chay 1 lenh don le hoac 1 nhom lenh trong 1 transaction"""
+        batch = [item for item in batch if item[0].set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        future, func, args, kwargs, batched = batch[0]
+        if not batched:
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            return
+
+        results = []
+        try:
+            with self.db.write():
+                for future, func, args, kwargs, _ in batch:
+                    try:
+                        with self.db.write():
+                            results.append((future, func(*args, **kwargs), None))
+                    except Exception as e:
+                        results.append((future, None, e))
+        except Exception as e:
+            # COMMIT loi: khong lenh nao duoc ghi
+            for future, *_ in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.commands += len(batch)
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def stats(self):
+        """So transaction gom va so lenh da gom"""
+        return {'batches': self.batches, 'commands': self.commands,
+                'avg_batch': self.commands / self.batches if self.batches else 0.0}
+
+    def shutdown(self, wait=True):
+        """Chay het lenh dang cho roi dung luong ghi"""
+        self._queue.put(self._STOP)
+        if wait:
+            self._thread.join()
+
+
+class AsyncInventory:
+    """
+    Ban bat dong bo cua InventoryManager: async_db.create_order(items, callback=...) -> Future
+    manager van dung dong bo duoc (script, benchmark)
+    """
+
+    def __init__(self, manager, root=None, readers=2):
+        self.manager = manager
+        self.root = root
+        # manager tu xa (RemoteInventory) khong co db: khong gom transaction
+        self._writer = BatchWriter(getattr(manager, 'db', None))
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='kho-doc')
+        # key -> so thu tu lenh moi nhat, ket qua cu hon bi bo (vd go phim tim kiem)
+        self._latest = {}
+        self._latest_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not callable(getattr(self.manager, name, None)):
+            raise AttributeError(name)
+        return functools.partial(self.submit, name)
+
+    def submit(self, method_name, *args, callback=None, errback=None, key=None, **kwargs):
+        """
+        Goi manager.<method_name>(*args, **kwargs) o luong nen
+        callback(ket qua) / errback(loi) chay tren luong Tk
+        key: chi giao ket qua cua lenh moi nhat cung key
+        """
+        method = getattr(self.manager, method_name)
+        write = method_name in WRITE_METHODS
+        return self.run(method, *args, write=write, batch=write,
+                        callback=callback, errback=errback, key=key, **kwargs)
+
+    def run(self, func, *args, write=False, batch=False, callback=None, errback=None, key=None,
+            **kwargs):
+        """
+        Chay ham bat ky o luong ghi (write=True) hoac luong doc
+        batch=True: ham chi ghi qua manager.db.write(), duoc gom chung transaction voi lenh khac
+        """
+        token = None
+        if key is not None:
+            with self._latest_lock:
+                token = self._latest[key] = self._latest.get(key, 0) + 1
+
+        if write:
+            future = self._writer.submit(func, *args, batch=batch, **kwargs)
+        else:
+            future = self._readers.submit(func, *args, **kwargs)
+        # Khong co giao dien va callback: nguoi goi tu doi Future (vd AioInventory)
+        if callback or errback or self.root is not None:
+            future.add_done_callback(lambda f: self._dispatch(f, callback, errback, key, token))
+        return future
+
+    def discard(self, key):
+        """Bo ket qua cua moi lenh dang chay cung key (vd o tim kiem vua bi xoa)"""
+        with self._latest_lock:
+            self._latest[key] = self._latest.get(key, 0) + 1
+
+    def _dispatch(self, future, callback, errback, key, token):
+        """Chuyen ket qua ve luong Tk (hoac goi ngay neu khong co root)"""
+        if self.root is None:
+            self._deliver(future, callback, errback, key, token)
+        else:
+            self.root.after(0, self._deliver, future, callback, errback, key, token)
+
+    def _deliver(self, future, callback, errback, key, token):
+        if future.cancelled():
+            return
+        if key is not None and self._latest.get(key) != token:
+            return
+
+        error = future.exception()
+        if error is not None:
+            if errback:
+                errback(error)
+            else:
+                print(f"Loi tac vu nen: {error}")
+        elif callback:
+            callback(future.result())
+
+    def close(self, wait=True):
+        """Cho cac lenh dang cho chay xong (lenh ghi khong bi bo) roi dung luong nen"""
+        self._readers.shutdown(wait=wait)
+        self._writer.shutdown(wait=wait)
+
+
+class AioInventory:
+    """
+    API asyncio cho InventoryManager: await aio.create_order(items), async for o in aio.iter_orders()
+    - toi da `max_concurrency` lenh cung cho/chay, lenh sau doi den luot
+    - huy task khi lenh con trong hang doi -> lenh khong chay; lenh dang chay se chay xong
+      (moi lenh ghi la 1 transaction, khong bao gio bi cat giua chung)
+    """
+
+    def __init__(self, manager, readers=4, max_concurrency=32):
+        self.manager = manager
+        self._pool = AsyncInventory(manager, readers=readers)
+        self._limit = asyncio.Semaphore(max_concurrency)
+        self._sync = None
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not callable(getattr(self.manager, name, None)):
+            raise AttributeError(name)
+        return functools.partial(self.call, name)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def call(self, method_name, *args, **kwargs):
+        """await manager.<method_name>(*args, **kwargs) tren luong ghi/luong doc"""
+        async with self._limit:
+            # Huy coroutine -> wrap_future huy luon Future neu lenh chua bat dau
+            return await asyncio.wrap_future(self._pool.submit(method_name, *args, **kwargs))
+
+    async def check_product_status(self, barcode):
+        """
+        Ma da co trong cache tra ngay tren vong lap (chi doc bo nho), khong qua luong doc
+        PRAGMA data_version (ghi tu tien trinh khac) chay o luong doc: cache hit hen kiem tra nen,
+        ghi tu tien trinh khac thay duoc tu lan goi sau; cache miss kiem tra trong check_product_status
+        """
+        cache = getattr(self.manager, 'product_cache', None)
+        result = cache.get(barcode, count_miss=False) if cache is not None else None
+        if result is not None:
+            if self._sync is None or self._sync.done():
+                self._sync = self._pool.run(self.manager.sync_product_cache)
+            return result
+        return await self.call('check_product_status', barcode)
+
+    async def run(self, func, *args, write=False, **kwargs):
+        """await ham bat ky tren luong ghi (write=True) hoac luong doc"""
+        async with self._limit:
+            return await asyncio.wrap_future(self._pool.run(func, *args, write=write, **kwargs))
+
+    async def iter_orders(self, text='', date_from=None, date_to=None, payment_method=None,
+                          page_size=100):
+        """Duyet don hang moi nhat truoc theo trang keyset (cung bo loc voi search_orders)"""
+        cursor = None
+        while True:
+            rows, cursor = await self.call('search_orders', text, date_from, date_to,
+                                           payment_method, page_size, cursor)
+            for row in rows:
+                yield row
+            if cursor is None:
+                return
+
+    async def iter_inventory_history(self, page_size=100):
+        """Duyet lich su xuat nhap moi nhat truoc theo trang keyset"""
+        cursor = None
+        while True:
+            rows, cursor = await self.call('get_inventory_history_page', page_size, cursor)
+            for row in rows:
+                yield row
+            if cursor is None:
+                return
+
+    async def close(self):
+        """Cho lenh dang cho chay xong roi dung luong nen (khong dong manager)"""
+        await asyncio.get_running_loop().run_in_executor(None, self._pool.close)
@@ -1,10 +1,14 @@
+import os
+import sys
+
 import cv2
 
-# 1️⃣ Load ảnh test
-frame = cv2.imread("/home/phuc/fist/image/2f.jpg")
+# 1️⃣ Load ảnh test: python test.py [ảnh], mặc định ảnh mẫu của repo
+path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "Untitled.jpeg")
+frame = cv2.imread(path)
 
 if frame is None:
-    print("❌ Không load được ảnh")
+    print("❌ Không load được ảnh:", path)
     exit()
 
 # 2️⃣ Lấy chiều cao & chiều rộng ảnh
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Cac module cua ung dung nam o thu muc goc (python front.py), khong phai package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
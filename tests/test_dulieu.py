@@ -0,0 +1,188 @@
+"""InventoryManager tren database tam"""
+import pytest
+
+from dulieu import InventoryManager
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = InventoryManager(str(tmp_path / 'inventory.db'))
+    yield manager
+    manager.close()
+
+
+def quantity(manager, barcode):
+    return manager.get_product_by_barcode(barcode)[4]
+
+
+def sell(manager, *lines):
+    success, msg, order = manager.create_order(
+        [{'barcode': barcode, 'quantity': qty} for barcode, qty in lines])
+    assert success, msg
+    return order
+
+
+# ===== SUA DON =====
+
+def test_replace_keeps_line_of_deleted_product(manager):
+    manager.add_product('111', 'Nuoc suoi', quantity=10, price=5000, cost_price=3000)
+    manager.add_product('222', 'Banh mi', quantity=10, price=15000, cost_price=9000)
+    order = sell(manager, ('111', 2), ('222', 1))
+    assert manager.delete_product('222')[0]
+
+    success, msg, edited = manager.replace_order_items(
+        order['order_id'], [{'barcode': '111', 'quantity': 3}, {'barcode': '222', 'quantity': 1}])
+
+    assert success, msg
+    line = next(d for d in edited['items'] if d['barcode'] == '222')
+    assert (line['name'], line['price'], line['cost_price']) == ('Banh mi', 15000, 9000)
+    assert edited['total'] == 3 * 5000 + 15000
+    assert quantity(manager, '111') == 7
+
+
+def test_replace_rejects_unknown_barcode(manager):
+    manager.add_product('111', 'Nuoc suoi', quantity=10, price=5000, cost_price=3000)
+    order = sell(manager, ('111', 2))
+
+    success, msg, _ = manager.replace_order_items(
+        order['order_id'], [{'barcode': '111', 'quantity': 1}, {'barcode': '999', 'quantity': 1}])
+
+    assert not success and '999' in msg
+    # Ca transaction bi huy: don va ton kho giu nguyen
+    assert quantity(manager, '111') == 8
+    assert [row[0] for row in manager.get_order_details(order['order_id'])] == ['111']
+
+
+# ===== PHIEU NHAP =====
+
+def test_import_batch_clears_draft_in_same_transaction(manager):
+    manager.add_product('111', 'Nuoc suoi', quantity=1)
+    manager.save_receiving_draft([('111', 'Nuoc suoi', 4)], terminal_id='Q1')
+
+    success, msg, _ = manager.import_stock_batch([('111', 4)], terminal_id='Q1')
+
+    assert success, msg
+    assert quantity(manager, '111') == 5
+    assert manager.load_receiving_draft('Q1') == []
+
+
+def test_failed_import_batch_keeps_draft(manager):
+    manager.add_product('111', 'Nuoc suoi', quantity=1)
+    manager.save_receiving_draft([('111', 'Nuoc suoi', 4), ('999', 'Khong co', 1)], terminal_id='Q1')
+
+    success, _, bad = manager.import_stock_batch([('111', 4), ('999', 1)], terminal_id='Q1')
+
+    assert not success and bad == ['999']
+    assert quantity(manager, '111') == 1
+    assert len(manager.load_receiving_draft('Q1')) == 2
+
+
+# ===== KE HOACH TRUY VAN =====
+
+class RollupScanManager(InventoryManager):
+    """Them 1 ham quet bang tong hop ngoai danh sach duoc mien"""
+
+    PLAN_CHECKS = InventoryManager.PLAN_CHECKS + [('units_by_payment', ())]
+
+    def units_by_payment(self):
+        return self.db.reader().execute(
+            "SELECT payment_method, SUM(units) FROM sales_monthly GROUP BY payment_method").fetchall()
+
+
+def test_query_plans_have_no_full_scans(manager):
+    assert manager.verify_query_plans() == []
+
+
+def test_rollup_scan_outside_exempt_methods_is_reported(tmp_path):
+    manager = RollupScanManager(str(tmp_path / 'inventory.db'))
+    try:
+        problems = manager.verify_query_plans()
+    finally:
+        manager.close()
+    assert [(name, detail.split()[1]) for name, _, detail in problems] == [('units_by_payment', 'sales_monthly')]
+
+
+# ===== BAN QUA TON KHO =====
+
+def test_create_order_rejects_oversell_without_writing(manager):
+    manager.add_product('111', 'Nuoc suoi', quantity=2, price=5000)
+    manager.add_product('222', 'Banh mi', quantity=10, price=15000)
+
+    success, _, data = manager.create_order(
+        [{'barcode': '222', 'quantity': 1}, {'barcode': '111', 'quantity': 3}])
+
+    assert not success
+    assert data['shortages'] == [('111', 'Nuoc suoi', 2, 3)]
+    assert (quantity(manager, '111'), quantity(manager, '222')) == (2, 10)
+    assert manager.get_orders(10) == []
+
+
+def test_create_order_allow_oversell_goes_negative(manager):
+    manager.add_product('111', 'Nuoc suoi', quantity=2, price=5000)
+    success, msg, _ = manager.create_order([{'barcode': '111', 'quantity': 3}], allow_oversell=True)
+    assert success, msg
+    assert quantity(manager, '111') == -1
+
+
+# ===== HUY DON =====
+
+def test_void_order_returns_stock_and_keeps_order(manager):
+    manager.add_product('111', 'Nuoc suoi', quantity=10, price=5000)
+    order = sell(manager, ('111', 4))
+
+    assert manager.void_order(order['order_id'])[0]
+
+    assert quantity(manager, '111') == 10
+    assert manager.get_orders(10)[0][8] == 'CANCELLED'
+    assert not manager.void_order(order['order_id'])[0]
+    assert quantity(manager, '111') == 10
+
+
+def test_cancelled_order_cannot_be_edited_and_delete_does_not_return_twice(manager):
+    manager.add_product('111', 'Nuoc suoi', quantity=10, price=5000)
+    order = sell(manager, ('111', 4))
+    manager.void_order(order['order_id'])
+
+    success, _, _ = manager.replace_order_items(order['order_id'], [{'barcode': '111', 'quantity': 1}])
+    assert not success
+    assert manager.delete_order(order['order_id'])[0]
+    assert quantity(manager, '111') == 10
+    assert manager.get_orders(10) == []
+
+
+# ===== XUAT KHO THEO DOT =====
+
+def test_export_batch_is_all_or_nothing(manager):
+    manager.add_product('111', 'Nuoc suoi', quantity=5)
+    manager.add_product('222', 'Banh mi', quantity=1)
+
+    success, _, failed = manager.export_stock_batch([('111', 2), ('222', 1), ('222', 1)])
+    assert not success and failed == ['222']
+    assert (quantity(manager, '111'), quantity(manager, '222')) == (5, 1)
+
+    success, msg, _ = manager.export_stock_batch([('111', 2), ('111', 1), ('222', 1)])
+    assert success, msg
+    assert (quantity(manager, '111'), quantity(manager, '222')) == (2, 0)
+
+
+# ===== KIEM KHO =====
+
+def test_stocktake_adjusts_by_variance_and_keeps_sales_during_count(manager):
+    manager.add_product('111', 'Nuoc suoi', quantity=10, price=5000)
+    manager.add_product('222', 'Banh mi', quantity=4, price=15000)
+    _, _, session_id = manager.start_stocktake()
+    assert not manager.start_stocktake()[0]
+
+    manager.add_stocktake_counts(session_id, {'111': 6, '999': 1})
+    manager.add_stocktake_counts(session_id, [('111', 2)])
+    # Ban trong luc dem: chenh lech tinh theo anh chup luc mo phien
+    sell(manager, ('111', 3))
+
+    variances, unknown = manager.get_stocktake_variance(session_id)
+    assert variances == [('111', 'Nuoc suoi', 10, 8, -2)] and unknown == ['999']
+
+    success, msg, report = manager.close_stocktake(session_id, zero_missing=True)
+    assert success, msg
+    assert report['net_change'] == -6
+    assert (quantity(manager, '111'), quantity(manager, '222')) == (5, 0)
+    assert manager.get_open_stocktake() is None
@@ -0,0 +1,37 @@
+"""May chu HTTP: lenh doc chay tren so luong doc co dinh"""
+import threading
+
+import pytest
+
+from dulieu import InventoryManager
+from maychu import InventoryServer, RemoteInventory
+
+
+@pytest.fixture
+def server(tmp_path):
+    manager = InventoryManager(str(tmp_path / 'inventory.db'))
+    server = InventoryServer(manager, port=0, readers=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.close()
+
+
+def test_reads_do_not_open_a_connection_per_request(server):
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    RemoteInventory(url).add_product('111', 'Nuoc suoi', quantity=5)
+
+    # Moi client 1 ket noi HTTP moi -> 1 luong xu ly moi tren may chu
+    for _ in range(30):
+        client = RemoteInventory(url)
+        assert client.get_product_by_barcode('111')[2] == 'Nuoc suoi'
+        client.close()
+
+    assert len(server.manager.db._readers) <= 2
+
+
+def test_remote_errors_become_runtime_error(server):
+    client = RemoteInventory(f"http://127.0.0.1:{server.server_address[1]}")
+    with pytest.raises(RuntimeError):
+        client.get_product_by_barcode()
+    client.close()
@@ -0,0 +1,62 @@
+"""ScanRouter: loc trung theo cooldown, gom dot, doi che do"""
+from collections import Counter
+
+from quetma import SIGHTING_INTERVAL, ScanPolicy, ScanRouter
+
+
+def make_router(policies=None):
+    delivered = []
+    timers = []
+    handlers = {mode: (lambda batch, mode=mode: delivered.append((mode, batch)))
+                for mode in ('sell', 'import', 'export', 'stocktake')}
+    router = ScanRouter(handlers, policies, schedule=lambda ms, func, *args: timers.append((func, args)))
+    return router, delivered, timers
+
+
+def test_code_held_in_view_counts_once():
+    router, delivered, _ = make_router()
+    router.set_mode('sell')
+    # Scanner giao lai ma moi SIGHTING_INTERVAL giay trong khi ma van nam trong khung
+    for i in range(40):
+        router.feed('111', now=i * SIGHTING_INTERVAL)
+    # Roi khung hinh lau hon cooldown roi dua lai = mon thu 2
+    router.feed('111', now=40 * SIGHTING_INTERVAL + 2.5)
+
+    assert delivered == [('sell', Counter({'111': 1}))] * 2
+    assert router.stats() == {'accepted': 2, 'suppressed': 39, 'batches': 2}
+
+
+def test_batch_is_delivered_once_by_timer():
+    router, delivered, timers = make_router()
+    router.set_mode('import')
+    router.feed('111', now=0.0)
+    router.feed('222', now=0.1)
+    router.feed('111', now=1.0)
+
+    assert delivered == [] and len(timers) == 1
+    func, args = timers[0]
+    func(*args)
+    assert delivered == [('import', Counter({'111': 2, '222': 1}))]
+
+
+def test_max_batch_flushes_early_and_stale_timer_is_ignored():
+    router, delivered, timers = make_router({'export': ScanPolicy(cooldown=1.5, batch_window=1.0, max_batch=2)})
+    router.set_mode('export')
+    router.feed('111', now=0.0)
+    router.feed('222', now=0.0)
+    func, args = timers[0]
+    func(*args)
+
+    assert delivered == [('export', Counter({'111': 1, '222': 1}))]
+
+
+def test_set_mode_flushes_pending_batch_to_old_mode():
+    router, delivered, _ = make_router()
+    router.set_mode('stocktake')
+    router.feed('111', now=0.0)
+    router.set_mode('export')
+    router.feed('111', now=0.1)
+    router.set_mode(None)
+
+    assert delivered == [('stocktake', Counter({'111': 1})), ('export', Counter({'111': 1}))]
+    assert not router.feed('111', now=5.0)
@@ -0,0 +1,81 @@
+"""MotionGate + ScanRouter: san pham cam yen duoi camera chi duoc tinh 1 lan"""
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+pytest.importorskip('pyzbar')
+
+from quetma import SIGHTING_INTERVAL, ScanRouter  # noqa: E402
+from scan import RealtimeBarcodeScanner  # noqa: E402
+
+CODE = '8935005800015'
+FPS = 30
+
+
+class FakeEngine:
+    """Engine gia: thay ma khi san pham con trong khung hinh"""
+
+    def __init__(self):
+        self.present = True
+        self.calls = 0
+
+    def decode(self, image):
+        self.calls += 1
+        return [{'data': CODE, 'type': 'EAN13'}] if self.present else []
+
+
+def run(scanner, router, frames, clock):
+    """Dua lan luot frame vao scanner, moi frame cach nhau 1/FPS giay"""
+    for frame in frames:
+        clock[0] += 1.0 / FPS
+        scanner.handle_frame(frame, now=clock[0])
+
+
+def moving(rng, count):
+    return [rng.integers(0, 255, (240, 320, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def make(mode):
+    clock = [0.0]
+    batches = []
+    router = ScanRouter({mode: batches.append}, clock=lambda: clock[0])
+    router.set_mode(mode)
+    scanner = RealtimeBarcodeScanner(callback=lambda result: router.feed(result['data'], now=clock[0]),
+                                     roi_tracking=False, motion_gate=True)
+    # Loc trung theo dong ho gia nam o ScanRouter
+    scanner.scan_cooldown = 0
+    scanner.engine = FakeEngine()
+    return scanner, router, clock, batches
+
+
+@pytest.mark.parametrize('mode', ['import', 'export', 'stocktake'])
+def test_held_still_then_moved_counts_once(mode):
+    scanner, router, clock, batches = make(mode)
+    rng = np.random.default_rng(1)
+
+    run(scanner, router, moving(rng, FPS), clock)          # dua san pham vao
+    still = moving(rng, 1) * (4 * FPS)                      # cam yen 4 giay (qua settle)
+    run(scanner, router, still, clock)
+    assert scanner.gate.skipped > 0
+    calls = scanner.engine.calls
+    run(scanner, router, moving(rng, FPS), clock)          # xoay san pham
+    router.flush()
+
+    assert scanner.engine.calls > calls
+    assert router.accepted == 1
+    assert sum(sum(batch.values()) for batch in batches) == 1
+
+
+def test_removed_then_shown_again_counts_twice():
+    scanner, router, clock, batches = make('import')
+    rng = np.random.default_rng(2)
+
+    run(scanner, router, moving(rng, FPS), clock)
+    scanner.engine.present = False
+    run(scanner, router, moving(rng, 2 * FPS), clock)      # lay ra, quay trong 2 giay
+    scanner.engine.present = True
+    run(scanner, router, moving(rng, FPS), clock)          # dua mon thu 2 vao
+    router.flush()
+
+    assert router.accepted == 2
+    assert SIGHTING_INTERVAL < router.policies['import'].cooldown
@@ -0,0 +1,78 @@
+"""Luong ghi gom transaction (BatchWriter), AsyncInventory, AioInventory"""
+import asyncio
+import threading
+
+import pytest
+
+from dulieu import InventoryManager
+from tacvu import AioInventory, AsyncInventory, BatchWriter
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = InventoryManager(str(tmp_path / 'inventory.db'))
+    yield manager
+    manager.close()
+
+
+def test_batch_writer_groups_commands_and_isolates_failures(manager):
+    manager.add_product('111', 'Nuoc suoi', quantity=0)
+    writer = BatchWriter(manager.db)
+    gate = threading.Event()
+    # Giu luong ghi de cac lenh sau xep hang roi duoc gom 1 transaction
+    writer.submit(gate.wait)
+    futures = [writer.submit(manager.update_quantity, '111', 1, batch=True) for _ in range(10)]
+    failing = writer.submit(manager.update_quantity, '111', -100, batch=True)
+    gate.set()
+
+    assert all(future.result(timeout=5)[0] for future in futures)
+    assert failing.result(timeout=5)[0] is False
+    writer.shutdown()
+    assert writer.stats()['batches'] == 1
+    assert manager.get_product_by_barcode('111')[4] == 10
+
+
+def test_async_inventory_drops_results_superseded_by_key(manager):
+    async_db = AsyncInventory(manager)
+    delivered = []
+    gate = threading.Event()
+    first = async_db.run(gate.wait, key='search', callback=lambda _: delivered.append('cu'))
+    second = async_db.run(lambda: 'moi', key='search', callback=delivered.append)
+    second.result(timeout=5)
+    gate.set()
+    first.result(timeout=5)
+
+    dropped = async_db.run(gate.wait, key='goi_y', callback=delivered.append)
+    async_db.discard('goi_y')
+    dropped.result(timeout=5)
+    async_db.close()
+
+    assert delivered == ['moi']
+
+
+def test_aio_cache_hit_checks_data_version_off_the_loop(manager, tmp_path):
+    manager.add_product('111', 'Nuoc suoi', quantity=5)
+    threads = []
+    data_version = manager.db.data_version
+
+    def spy():
+        threads.append(threading.current_thread())
+        return data_version()
+
+    async def scenario():
+        async with AioInventory(manager) as aio:
+            assert (await aio.check_product_status('111'))['data']['quantity'] == 5
+            manager.db.data_version = spy
+            loop_thread = threading.current_thread()
+
+            # Tien trinh khac ghi: lan goi sau thay so luong moi
+            other = InventoryManager(str(tmp_path / 'inventory.db'))
+            other.update_quantity('111', 3)
+            other.close()
+            assert (await aio.check_product_status('111'))['data']['quantity'] == 5
+            await asyncio.wrap_future(aio._sync)
+            assert (await aio.check_product_status('111'))['data']['quantity'] == 8
+            return loop_thread
+
+    loop_thread = asyncio.run(scenario())
+    assert threads and loop_thread not in threads
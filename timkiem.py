@@ -0,0 +1,134 @@
+import heapq
+import unicodedata
+from array import array
+from collections import Counter
+
+
+def fold_text(text):
+    """Bo dau, chu thuong: 'Nước Mắm' -> 'nuoc mam'"""
+    text = (text or '').lower().replace('đ', 'd')
+    decomposed = unicodedata.normalize('NFD', text)
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def trigrams(folded):
+    """Tap trigram cua chuoi da bo dau, dem dau cach 2 ben moi tu ("  n" giu lai chu cai dau)"""
+    grams = set()
+    for word in folded.split():
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+def edit_distance(a, b, limit=3):
+    """Khoang cach sua tu (dao 2 ky tu canh nhau tinh 1 loi), dung som khi vuot `limit`"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before = None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1,
+                       previous[j - 1] + (ca != cb))
+            if before is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+def allowed_errors(word):
+    """So loi go cho phep theo do dai tu"""
+    return 0 if len(word) <= 2 else 1 if len(word) <= 5 else 2
+
+
+class NameIndex:
+    """
+    Chi muc ten san pham trong bo nho, tim gan dung khong dau
+    - tu dien: moi tu (da bo dau) -> danh sach san pham chua tu do
+    - trigram -> cac tu trong tu dien, dung de tim tu go sai/go do
+    """
+
+    # So san pham ung vien toi da duoc xep hang cho 1 lan tim (giu do tre < 1 frame)
+    MAX_CANDIDATES = 2000
+
+    def __init__(self):
+        self.entries = {}
+        self.word_postings = {}
+        self.word_grams = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, product_id, barcode, name):
+        """Them/cap nhat 1 san pham (posting cua ten cu duoc loc khi xep hang)"""
+        words = tuple(fold_text(name).split())
+        self.entries[product_id] = (barcode, words)
+        for word in set(words):
+            posting = self.word_postings.get(word)
+            if posting is None:
+                posting = self.word_postings[word] = array('I')
+                for gram in trigrams(word):
+                    self.word_grams.setdefault(gram, set()).add(word)
+            posting.append(product_id)
+
+    def remove(self, product_id):
+        """Xoa san pham khoi ket qua"""
+        self.entries.pop(product_id, None)
+
+    def similar_words(self, word):
+        """Cac tu trong tu dien ma tien to khop `word` trong so loi cho phep: {tu: so loi}"""
+        allowed = allowed_errors(word)
+        grams = trigrams(word)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.word_grams.get(gram, ()))
+
+        # Sai k ky tu lam mat toi da 3k trigram (tru trigram cuoi "x " khi go do)
+        needed = max(1, len(grams) - 1 - 3 * allowed)
+        matches = {}
+        for candidate, count in shared.items():
+            if count < needed or len(candidate) < len(word) - allowed:
+                continue
+            errors = edit_distance(word, candidate[:len(word)], allowed)
+            if errors <= allowed:
+                matches[candidate] = errors
+        return matches
+
+    def lookup(self, text, limit=8):
+        """Tra ve [(product_id, barcode)] gan nhat voi `text`, tot nhat truoc"""
+        per_word = [self.similar_words(word) for word in fold_text(text).split()]
+        if not per_word or not all(per_word):
+            return []
+
+        # Lay ung vien tu tu it san pham nhat, tu khop dung truoc
+        rarest = min(per_word, key=lambda matches: sum(
+            len(self.word_postings[word]) for word in matches))
+        candidates = set()
+        for word in sorted(rarest, key=rarest.get):
+            candidates.update(self.word_postings[word][:self.MAX_CANDIDATES - len(candidates)])
+            if len(candidates) >= self.MAX_CANDIDATES:
+                break
+
+        ranked = []
+        for product_id in candidates:
+            entry = self.entries.get(product_id)
+            if entry is None:
+                continue
+            barcode, words = entry
+            # Moi tu cua truy van phai khop 1 tu trong ten hien tai
+            distance = 0
+            for matches in per_word:
+                errors = [matches[word] for word in words if word in matches]
+                if not errors:
+                    break
+                distance += min(errors)
+            else:
+                ranked.append((distance, len(words), product_id, barcode))
+
+        return [(product_id, barcode)
+                for _, _, product_id, barcode in heapq.nsmallest(limit, ranked)]